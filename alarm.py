@@ -1,23 +1,7 @@
 import requests
-import mysql.connector
 import time
 from datetime import datetime
-from configparser import ConfigParser
-
-def get_config():
-    config = ConfigParser()
-    config.read('credentials.ini')
-    return config
-
-def get_db_connection():
-    config = get_config()
-    return mysql.connector.connect(
-        host=config.get('database', 'db_host'),
-        database=config.get('database', 'db_name'),
-        user=config.get('database', 'db_user'),
-        password=config.get('database', 'db_password'),
-        port=config.getint('database', 'db_port')
-    )
+from db import get_config, get_connection, pool_stats
 
 def send_slack_alert(message: str) -> bool:
     config = get_config()
@@ -33,9 +17,6 @@ def send_slack_alert(message: str) -> bool:
 
 def check_and_insert_new_alarms():
     """Insert new alarms for overdue devices."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     insert_query = """
     INSERT INTO device_alarms (device_id, alarm_description, alarm_type, issue_start_time, last_alarm_sent_time)
     WITH ranked_snapshots AS (
@@ -82,19 +63,17 @@ def check_and_insert_new_alarms():
     WHERE da.id IS NULL
     """
 
-    cursor.execute(insert_query)
-    new_alarms = cursor.rowcount
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_connection('check_and_insert_new_alarms') as conn:
+        cursor = conn.cursor()
+        cursor.execute(insert_query)
+        new_alarms = cursor.rowcount
+        conn.commit()
+        cursor.close()
 
     return new_alarms
 
 def check_and_resolve_alarms():
     """Find devices that are back online and resolve their alarms."""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
     query = """
     WITH ranked_snapshots AS (
         SELECT
@@ -135,10 +114,11 @@ def check_and_resolve_alarms():
       AND da.alarm_type = 'snapshot_missing'
     """
 
-    cursor.execute(query)
-    resolved_devices = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_connection('check_and_resolve_alarms') as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query)
+        resolved_devices = cursor.fetchall()
+        cursor.close()
 
     return resolved_devices
 
@@ -147,9 +127,6 @@ def resolve_alarms(alarm_ids: list):
     if not alarm_ids:
         return
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     query = f"""
     UPDATE device_alarms
     SET issue_resolved = TRUE,
@@ -157,16 +134,14 @@ def resolve_alarms(alarm_ids: list):
     WHERE id IN ({','.join(['%s'] * len(alarm_ids))})
     """
 
-    cursor.execute(query, alarm_ids)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_connection('resolve_alarms') as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, alarm_ids)
+        conn.commit()
+        cursor.close()
 
 def get_pending_alerts():
     """Get alarms that need notification (new or daily reminder)."""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
     query = """
     SELECT
         da.id as alarm_id,
@@ -192,10 +167,11 @@ def get_pending_alerts():
         )
     """
 
-    cursor.execute(query)
-    alerts = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_connection('get_pending_alerts') as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(query)
+        alerts = cursor.fetchall()
+        cursor.close()
 
     return alerts
 
@@ -204,19 +180,17 @@ def update_last_sent_time(alarm_ids: list):
     if not alarm_ids:
         return
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     query = f"""
     UPDATE device_alarms
     SET last_alarm_sent_time = NOW()
     WHERE id IN ({','.join(['%s'] * len(alarm_ids))})
     """
 
-    cursor.execute(query, alarm_ids)
-    conn.commit()
-    cursor.close()
-    conn.close()
+    with get_connection('update_last_sent_time') as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, alarm_ids)
+        conn.commit()
+        cursor.close()
 
 def format_down_alert(alerts: list) -> str:
     """Format down alerts into a Slack message."""
@@ -299,6 +273,9 @@ def run_alarm_check():
         else:
             print("Failed to send down notification")
 
+    for label, timing in pool_stats().items():
+        print(f"DB {label}: acquire avg {timing['acquire_ms_avg']} ms, hold avg {timing['hold_ms_avg']} ms")
+
     print(f"[{datetime.now()}] Alarm check complete.")
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+"""
+Micro-benchmark for per-request token validation
+
+Compares the previous validate_token implementation (strftime + SHA-256 for
+both windows on every call) with the cached TokenVerifier.
+
+Usage:
+    python bench_auth.py --devices 50 --iterations 200000
+"""
+import time
+import hashlib
+import argparse
+from datetime import datetime, timezone, timedelta
+from token_auth import TokenVerifier, token_for_window
+
+KEYWORD = "hardwork"
+WINDOW_MINUTES = 30
+
+
+def current_window():
+    now = datetime.now(timezone.utc)
+    minutes = (now.minute // WINDOW_MINUTES) * WINDOW_MINUTES
+    return now.replace(minute=minutes, second=0, microsecond=0)
+
+
+def legacy_validate(device_id, provided_token):
+    """Token check as server.py did it before TokenVerifier"""
+    time_window = current_window()
+    current_token = hashlib.sha256(
+        f"{device_id}-{KEYWORD}-{time_window.strftime('%Y-%m-%d-%H-%M')}".encode()).hexdigest()
+    if provided_token == current_token:
+        return True
+
+    previous_window = current_window() - timedelta(minutes=WINDOW_MINUTES)
+    previous_token = hashlib.sha256(
+        f"{device_id}-{KEYWORD}-{previous_window.strftime('%Y-%m-%d-%H-%M')}".encode()).hexdigest()
+    return provided_token == previous_token
+
+
+def run(label, validate, requests):
+    start = time.perf_counter()
+    for device_id, token in requests:
+        validate(device_id, token)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed / len(requests) * 1e6:>10.2f} us/request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    window = current_window()
+    previous = window - timedelta(minutes=WINDOW_MINUTES)
+    current_tokens = [(d, token_for_window(d, KEYWORD, window)) for d in range(1, args.devices + 1)]
+    previous_tokens = [(d, token_for_window(d, KEYWORD, previous)) for d in range(1, args.devices + 1)]
+
+    def workload(tokens):
+        return [tokens[i % len(tokens)] for i in range(args.iterations)]
+
+    verifier = TokenVerifier(KEYWORD, WINDOW_MINUTES)
+    print(f"{args.devices} devices, {args.iterations:,} requests per scenario")
+    run('legacy, current window', legacy_validate, workload(current_tokens))
+    run('cached, current window', verifier.verify, workload(current_tokens))
+    run('legacy, previous window', legacy_validate, workload(previous_tokens))
+    run('cached, previous window', verifier.verify, workload(previous_tokens))
+    print(f"verifier counters: {verifier.info()}")
+
+
+if __name__ == '__main__':
+    main()
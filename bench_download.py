@@ -0,0 +1,114 @@
+"""
+Benchmark original image delivery paths over a loopback socket
+
+Compares, for whole files and for byte ranges:
+    send_file  werkzeug's FileWrapper (8 KB reads + sendall), which is what
+               send_file / range responses used before byte_ranges.py
+    chunked    byte_ranges.read_chunks (256 KB reads + sendall), the fallback
+               when the server has no usable sendfile path
+    sendfile   socket.sendfile (os.sendfile, zero-copy), what gunicorn does
+               with the file wrapper returned by byte_ranges.file_body
+
+CPU is the sending thread's CPU time, reported per GB served. Files are read
+once before timing so all modes run from the page cache.
+
+Usage:
+    python bench_download.py /mnt/disk1/media/SOME_CAMERA/Area_1/*.jpg --rounds 20
+"""
+import time
+import socket
+import argparse
+import threading
+from werkzeug.wsgi import FileWrapper
+from byte_ranges import read_chunks
+
+
+def drain(sock):
+    """Read and discard until the peer closes"""
+    buf = bytearray(1024 * 1024)
+    while sock.recv_into(buf):
+        pass
+    sock.close()
+
+
+def send_with_send_file(sock, path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        for chunk in FileWrapper(f, 8192):
+            chunk = chunk[:remaining]
+            sock.sendall(chunk)
+            remaining -= len(chunk)
+            if remaining <= 0:
+                break
+
+
+def send_chunked(sock, path, start, length):
+    f = open(path, 'rb')
+    f.seek(start)
+    for chunk in read_chunks(f, length):
+        sock.sendall(chunk)
+
+
+def send_with_sendfile(sock, path, start, length):
+    with open(path, 'rb') as f:
+        sock.sendfile(f, offset=start, count=length)
+
+
+MODES = {
+    'send_file': send_with_send_file,
+    'chunked': send_chunked,
+    'sendfile': send_with_sendfile,
+}
+
+
+def run_mode(send, jobs, rounds):
+    """Send every (path, start, length) job rounds times; returns (bytes, wall s, cpu s)"""
+    total = 0
+    wall = 0.0
+    cpu = 0.0
+    for _ in range(rounds):
+        for path, start, length in jobs:
+            server, client = socket.socketpair()
+            reader = threading.Thread(target=drain, args=(client,))
+            reader.start()
+
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            send(server, path, start, length)
+            server.close()
+            reader.join()
+            cpu += time.thread_time() - cpu_start
+            wall += time.perf_counter() - wall_start
+            total += length
+    return total, wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='+', help='Original image files')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--range-bytes', type=int, default=1024 * 1024,
+                        help='Size of the tail range requested in the range scenario')
+    args = parser.parse_args()
+
+    full_jobs = []
+    range_jobs = []
+    for path in args.images:
+        with open(path, 'rb') as f:
+            size = len(f.read())  # warm the page cache
+        full_jobs.append((path, 0, size))
+        start = max(0, size - args.range_bytes)
+        range_jobs.append((path, start, size - start))
+
+    print(f"{len(args.images)} file(s), {args.rounds} rounds")
+    print(f"{'scenario':<10}{'mode':<12}{'MB/s':>10}{'CPU s/GB':>11}")
+    for scenario, jobs in (('full', full_jobs), ('range', range_jobs)):
+        for mode, send in MODES.items():
+            total, wall, cpu = run_mode(send, jobs, args.rounds)
+            gigabytes = total / 1024 ** 3
+            print(f"{scenario:<10}{mode:<12}{total / wall / 1024 ** 2:>10.0f}{cpu / gigabytes:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
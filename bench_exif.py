@@ -0,0 +1,71 @@
+"""
+Benchmark capture-time extraction (EXIF DateTimeOriginal)
+
+Modes:
+    exiftool        one exiftool process per file (previous get_image_timestamp)
+    exiftool-batch  one exiftool -stay_open process fed all files
+    parser          in-process JPEG APP1 parser (exif_time.jpeg_datetime_original)
+    pillow          in-process Pillow EXIF reader (exif_time.pillow_datetime_original)
+
+exiftool modes are skipped when exiftool is not installed.
+
+Usage:
+    python bench_exif.py /mnt/disk5/ftpdata/media/SOME_CAMERA/*/*.jpg --repeat 3
+"""
+import time
+import shutil
+import argparse
+import subprocess
+from exif_time import ExifToolBatch, jpeg_datetime_original, pillow_datetime_original
+
+
+def exiftool_per_file(paths):
+    values = {}
+    for path in paths:
+        result = subprocess.run(['exiftool', '-DateTimeOriginal', '-s3', path],
+                                capture_output=True, text=True, timeout=10)
+        values[path] = result.stdout.strip() or None
+    return values
+
+
+def exiftool_batch(paths):
+    with ExifToolBatch() as exiftool:
+        return exiftool.datetime_originals(paths)
+
+
+MODES = {
+    'exiftool': exiftool_per_file,
+    'exiftool-batch': exiftool_batch,
+    'parser': lambda paths: {path: jpeg_datetime_original(path) for path in paths},
+    'pillow': lambda paths: {path: pillow_datetime_original(path) for path in paths},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='+', help='Image files to read')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the file list (default: 3)')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma separated modes to run')
+    args = parser.parse_args()
+
+    has_exiftool = shutil.which('exiftool') is not None
+    print(f"{len(args.images)} file(s), {args.repeat} pass(es)")
+    print(f"{'mode':<16}{'files/sec':>12}{'ms/file':>10}{'with value':>12}")
+
+    for mode in args.modes.split(','):
+        if mode.startswith('exiftool') and not has_exiftool:
+            print(f"{mode:<16}{'exiftool not installed':>34}")
+            continue
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            values = MODES[mode](args.images)
+        elapsed = time.perf_counter() - started
+
+        files = len(args.images) * args.repeat
+        found = sum(1 for value in values.values() if value)
+        print(f"{mode:<16}{files / elapsed:>12.0f}{elapsed / files * 1000:>10.2f}{found:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark output formats for resized images
+
+Shrinks each sample frame once per size, then encodes it with the same
+settings the server uses (imaging.encode_image) in every format, reporting
+average bytes served, size relative to JPEG and encode time.
+
+Usage:
+    python bench_formats.py /mnt/disk1/media/SOME_CAMERA/Area_1/*.jpg --sizes 640x480,1280x720
+"""
+import time
+import argparse
+from PIL import Image
+from imaging import shrink_image, flatten_to_rgb, encode_image, parse_size_list, NEGOTIABLE_FORMATS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='+', help='Sample camera frames')
+    parser.add_argument('--sizes', default='150x84,640x480,1280x720', help='Comma separated WIDTHxHEIGHT list')
+    parser.add_argument('--formats', default=','.join(('JPEG',) + NEGOTIABLE_FORMATS),
+                        help='Comma separated output formats (default: JPEG plus what the server negotiates)')
+    parser.add_argument('--repeat', type=int, default=3, help='Encodes per image and format (default: 3)')
+    args = parser.parse_args()
+
+    formats = [fmt.strip().upper() for fmt in args.formats.split(',') if fmt.strip()]
+    print(f"{len(args.images)} image(s), {args.repeat} encode(s) each")
+    print(f"{'size':<11}{'format':<8}{'avg bytes':>11}{'vs JPEG':>9}{'encode ms':>11}")
+
+    for target_size in parse_size_list(args.sizes):
+        shrunk = []
+        for path in args.images:
+            with Image.open(path) as img:
+                shrunk.append(shrink_image(img, target_size, convert=flatten_to_rgb))
+
+        jpeg_bytes = None
+        for output_format in formats:
+            total_bytes = 0
+            started = time.perf_counter()
+            for img in shrunk:
+                for _ in range(args.repeat):
+                    data = encode_image(img, output_format)
+                total_bytes += len(data)
+            encode_ms = (time.perf_counter() - started) / (len(shrunk) * args.repeat) * 1000
+
+            avg_bytes = total_bytes / len(shrunk)
+            if jpeg_bytes is None and output_format == 'JPEG':
+                jpeg_bytes = avg_bytes
+            ratio = f"{avg_bytes / jpeg_bytes:.0%}" if jpeg_bytes else '-'
+            size_label = f"{target_size[0]}x{target_size[1]}"
+            print(f"{size_label:<11}{output_format:<8}{avg_bytes:>11,.0f}{ratio:>9}{encode_ms:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
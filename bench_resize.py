@@ -0,0 +1,95 @@
+"""
+Benchmark JPEG resize modes on sample camera frames
+
+Each mode runs in its own subprocess so peak RSS is measured independently.
+
+Usage:
+    python bench_resize.py /mnt/disk1/media/SOME_CAMERA/Area_1/*.jpg --size 640x480
+"""
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from pathlib import Path
+from PIL import Image
+from imaging import fit_within, draft_for_size, resample_to
+
+MODES = {
+    # Full decode, then LANCZOS
+    'full-lanczos': {'draft': False, 'policy': 'lanczos'},
+    # Previous server.py behaviour (Image.thumbnail with its default reducing_gap)
+    'thumbnail': None,
+    # DCT-scaled decode, then LANCZOS
+    'draft-lanczos': {'draft': True, 'policy': 'lanczos'},
+    # DCT-scaled decode, then reduce() + BICUBIC
+    'draft-fast': {'draft': True, 'policy': 'fast'},
+}
+
+
+def resize_one(path, target_size, mode):
+    with Image.open(path) as img:
+        if MODES[mode] is None:
+            img.thumbnail(target_size, Image.Resampling.LANCZOS)
+            return img.size
+
+        final_size = fit_within(img.size, target_size)
+        box = draft_for_size(img, final_size, enabled=MODES[mode]['draft'])
+        out = resample_to(img, final_size, MODES[mode]['policy'], box)
+        return out.size
+
+
+def run_worker(mode, target_size, paths, repeat):
+    """Resize every image repeat times and print timing as JSON"""
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    count = 0
+    for _ in range(repeat):
+        for path in paths:
+            resize_one(path, target_size, mode)
+            count += 1
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    print(json.dumps({
+        'mode': mode,
+        'images': count,
+        'cpu_ms_per_image': cpu / count * 1000,
+        'wall_ms_per_image': wall / count * 1000,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='+', help='JPEG files to resize')
+    parser.add_argument('--size', default='640x480', help='Target WIDTHxHEIGHT (default: 640x480)')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the image list (default: 3)')
+    parser.add_argument('--modes', default=','.join(MODES), help='Comma separated modes to run')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    target_size = (width, height)
+
+    if args.worker:
+        run_worker(args.worker, target_size, args.images, args.repeat)
+        return
+
+    total_bytes = sum(Path(p).stat().st_size for p in args.images)
+    print(f"{len(args.images)} image(s), {total_bytes / len(args.images) / 1024 ** 2:.1f} MB average, target {width}x{height}")
+    print(f"{'mode':<16}{'cpu ms/img':>12}{'wall ms/img':>13}{'max RSS MB':>12}")
+
+    for mode in args.modes.split(','):
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker', mode, '--size', args.size,
+             '--repeat', str(args.repeat), *args.images],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output)
+        print(f"{mode:<16}{result['cpu_ms_per_image']:>12.1f}{result['wall_ms_per_image']:>13.1f}{result['max_rss_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
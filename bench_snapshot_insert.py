@@ -0,0 +1,121 @@
+"""
+Benchmark snapshot row loading (rows/sec)
+
+Runs against a scratch copy of camera.snapshot (camera.snapshot_bench,
+created LIKE camera.snapshot with the (device_id, time, area_name) unique
+key added if needed, dropped afterwards) using synthetic rows.
+
+Modes:
+    executemany  previous insert_snapshots_to_db (named-parameter executemany, plain INSERT)
+    multirow     snapshot_loader.insert_rows (multi-row INSERT ... ON DUPLICATE KEY UPDATE)
+    load-data    snapshot_loader.load_rows (LOAD DATA LOCAL INFILE + INSERT ... SELECT upsert)
+
+Each upsert mode is timed twice: new rows, then the same rows again
+(all duplicates).
+
+Usage:
+    python bench_snapshot_insert.py --rows 50000
+"""
+import time
+import argparse
+import logging
+from db import get_connection
+from snapshot_loader import (insert_rows, load_rows, has_unique_key, SNAPSHOT_COLUMNS,
+                             UNIQUE_KEY_COLUMNS, UNIQUE_KEY_NAME, ROWS_PER_STATEMENT)
+
+BENCH_TABLE = 'camera.snapshot_bench'
+
+EXECUTEMANY_QUERY = f"""
+    INSERT INTO {BENCH_TABLE}
+    ({', '.join(SNAPSHOT_COLUMNS)})
+    VALUES ({', '.join(f'%({column})s' for column in SNAPSHOT_COLUMNS)})
+"""
+
+
+def make_rows(count):
+    base = int(time.time() * 1000) - count * 1000
+    return [{
+        'device_id': 999999,
+        'time': base + i * 1000,
+        'url': f"/mnt/disk1/media/BENCH_WTP/Area_{i % 4}/{base + i * 1000}.jpg",
+        'thumbnail': 1,
+        'timezone': 'UTC',
+        'area_name': f"Area_{i % 4}",
+        'created_by': 0,
+        'updated_by': 0,
+        'preset_id': 0,
+        'adjusted_start_time': 0
+    } for i in range(count)]
+
+
+def run_sql(*statements):
+    with get_connection('bench_snapshot_insert') as conn:
+        cursor = conn.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        conn.commit()
+        cursor.close()
+
+
+def executemany(rows):
+    with get_connection('bench_snapshot_insert') as conn:
+        cursor = conn.cursor()
+        cursor.executemany(EXECUTEMANY_QUERY, rows)
+        conn.commit()
+        cursor.close()
+
+
+def multirow(rows, rows_per_statement):
+    with get_connection('bench_snapshot_insert') as conn:
+        cursor = conn.cursor()
+        insert_rows(cursor, rows, BENCH_TABLE, True, rows_per_statement)
+        conn.commit()
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000, help='Rows per mode (default: 50000)')
+    parser.add_argument('--rows-per-statement', type=int, default=ROWS_PER_STATEMENT,
+                        help=f"Rows per multi-row INSERT (default: {ROWS_PER_STATEMENT})")
+    parser.add_argument('--modes', default='executemany,multirow,load-data', help='Comma separated modes to run')
+    parser.add_argument('--keep', action='store_true', help=f"Keep {BENCH_TABLE} afterwards")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    run_sql(f"DROP TABLE IF EXISTS {BENCH_TABLE}", f"CREATE TABLE {BENCH_TABLE} LIKE camera.snapshot")
+    with get_connection('bench_snapshot_insert') as conn:
+        cursor = conn.cursor()
+        if not has_unique_key(cursor, BENCH_TABLE):
+            cursor.execute(f"ALTER TABLE {BENCH_TABLE} ADD UNIQUE KEY {UNIQUE_KEY_NAME} "
+                           f"({', '.join(UNIQUE_KEY_COLUMNS)})")
+        cursor.close()
+
+    rows = make_rows(args.rows)
+    modes = {
+        'executemany': executemany,
+        'multirow': lambda batch: multirow(batch, args.rows_per_statement),
+        'load-data': lambda batch: load_rows(batch, BENCH_TABLE, True),
+    }
+    print(f"{args.rows} rows per pass")
+    print(f"{'mode':<14}{'pass':<12}{'seconds':>10}{'rows/sec':>12}")
+    try:
+        for mode in args.modes.split(','):
+            run_sql(f"TRUNCATE TABLE {BENCH_TABLE}")
+            passes = ['new'] if mode == 'executemany' else ['new', 'duplicates']
+            for label in passes:
+                started = time.perf_counter()
+                try:
+                    modes[mode](rows)
+                except Exception as e:
+                    print(f"{mode:<14}{label:<12}  failed: {e}")
+                    break
+                elapsed = time.perf_counter() - started
+                print(f"{mode:<14}{label:<12}{elapsed:>10.2f}{args.rows / elapsed:>12.0f}")
+    finally:
+        if not args.keep:
+            run_sql(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+HTTP byte-range support for original image downloads
+
+Lets clients resume or fetch parts of a 9-12 MB original (206 Partial
+Content, multipart/byteranges for several ranges, 416 when nothing in the
+Range header fits the file). Bodies are handed to the WSGI server's
+wsgi.file_wrapper when it is safe to, so gunicorn can push them with
+os.sendfile without copying through Python; otherwise they are streamed in
+bounded chunks.
+"""
+import uuid
+
+# More ranges than this in one request is not a resume, serve the whole file instead
+MAX_RANGES = 8
+# Read size for the streamed (non-sendfile) path
+CHUNK_SIZE = 256 * 1024
+
+
+def _range_specs(range_header):
+    """
+    [(first, last), ...] from a bytes Range header, last None for open ranges and
+    first None for suffix ranges; None if the header is not valid bytes ranges
+    Ranges may come in any order and overlap (RFC 7233), unlike what
+    werkzeug's parse_range_header accepts
+    """
+    units, equals, spec = range_header.partition('=')
+    if not equals or units.strip().lower() != 'bytes':
+        return None
+    specs = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition('-')
+        first, last = first.strip(), last.strip()
+        if not dash or not (first or last) or not all(v.isdigit() for v in (first, last) if v):
+            return None
+        if first and last and int(last) < int(first):
+            return None
+        specs.append((int(first) if first else None, int(last) if last else None))
+    return specs or None
+
+
+def parse_ranges(range_header, length):
+    """
+    Resolve a Range header against a file of length bytes
+    Returns None to serve the whole file (no header, bad syntax, other units,
+    too many ranges), [] when no range is satisfiable, otherwise a sorted list
+    of (start, end) byte offsets with end exclusive and overlaps merged
+    """
+    if not range_header:
+        return None
+    specs = _range_specs(range_header)
+    if specs is None or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for first, last in specs:
+        if first is None:
+            # Suffix range: the last `last` bytes
+            start, stop = max(0, length - last), length
+        else:
+            start, stop = first, length if last is None else min(last + 1, length)
+        if start < stop:
+            ranges.append((start, stop))
+
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def can_sendfile(environ):
+    """
+    True when the server will honor Content-Length for a seeked file wrapper
+
+    gunicorn sends exactly Content-Length bytes from the current file offset
+    (with os.sendfile unless disabled); other servers may stream the wrapper
+    to EOF, so they get the chunked reader instead.
+    """
+    return ('wsgi.file_wrapper' in environ
+            and environ.get('SERVER_SOFTWARE', '').startswith('gunicorn'))
+
+
+def read_chunks(file_obj, length):
+    """Yield length bytes from file_obj's current position, then close it"""
+    try:
+        while length > 0:
+            chunk = file_obj.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+def file_body(environ, file_path, start, end, use_sendfile):
+    """Body iterable for bytes [start, end) of file_path"""
+    file_obj = open(file_path, 'rb')
+    try:
+        file_obj.seek(start)
+    except OSError:
+        file_obj.close()
+        raise
+    if use_sendfile:
+        return environ['wsgi.file_wrapper'](file_obj, CHUNK_SIZE)
+    return read_chunks(file_obj, end - start)
+
+
+def multipart_body(file_path, ranges, length, mimetype):
+    """
+    Build a multipart/byteranges body for several ranges
+    Returns tuple (iterable, content_length, boundary)
+    """
+    boundary = uuid.uuid4().hex
+    heads = [
+        (f"--{boundary}\r\nContent-Type: {mimetype}\r\n"
+         f"Content-Range: {content_range(start, end, length)}\r\n\r\n").encode()
+        for start, end in ranges
+    ]
+    # Every part after the first is preceded by the CRLF ending the previous one
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    content_length = (sum(len(head) for head in heads) + 2 * (len(ranges) - 1)
+                      + sum(end - start for start, end in ranges) + len(tail))
+
+    def generate():
+        with open(file_path, 'rb') as file_obj:
+            for i, ((start, end), head) in enumerate(zip(ranges, heads)):
+                yield (b"\r\n" + head) if i else head
+                file_obj.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    chunk = file_obj.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        yield tail
+
+    return generate(), content_length, boundary
+
+
+def content_range(start, end, length):
+    """Content-Range header value for bytes [start, end)"""
+    return f"bytes {start}-{end - 1}/{length}"
+
@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from configparser import ConfigParser
+import mysql.connector
+from mysql.connector import pooling
+
+logger = logging.getLogger(__name__)
+
+CREDENTIALS_FILE = 'credentials.ini'
+
+# Defaults, overridable in the [database] section of credentials.ini
+DEFAULT_POOL_SIZE = 5
+# Seconds to wait for a free connection when the pool is exhausted
+DEFAULT_POOL_TIMEOUT = 10
+
+_config = None
+_config_lock = threading.Lock()
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_config():
+    """Parse credentials.ini once per process"""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                config = ConfigParser()
+                config.read(os.environ.get('CREDENTIALS_FILE', CREDENTIALS_FILE))
+                _config = config
+    return _config
+
+
+def _get_pool():
+    """Create the connection pool lazily, and again after a fork"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                config = get_config()
+                pool_size = config.getint('database', 'pool_size', fallback=DEFAULT_POOL_SIZE)
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name=f"camera-{os.getpid()}",
+                    pool_size=pool_size,
+                    pool_reset_session=True,
+                    host=config.get('database', 'db_host'),
+                    database=config.get('database', 'db_name'),
+                    user=config.get('database', 'db_user'),
+                    password=config.get('database', 'db_password'),
+                    port=config.getint('database', 'db_port')
+                )
+                _pool_pid = os.getpid()
+                logger.info(f"Created MySQL connection pool (size: {pool_size})")
+    return _pool
+
+
+def _acquire(timeout):
+    """
+    Take a connection from the pool, waiting up to timeout seconds if exhausted
+    The pool checks each connection is alive on checkout and reconnects stale ones
+    """
+    pool = _get_pool()
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        try:
+            return pool.get_connection()
+        except pooling.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.25)
+
+
+def _record(label, acquire_ms, hold_ms):
+    with _stats_lock:
+        entry = _stats.setdefault(label, {
+            'calls': 0, 'acquire_ms_total': 0.0, 'acquire_ms_max': 0.0,
+            'hold_ms_total': 0.0, 'hold_ms_max': 0.0
+        })
+        entry['calls'] += 1
+        entry['acquire_ms_total'] += acquire_ms
+        entry['acquire_ms_max'] = max(entry['acquire_ms_max'], acquire_ms)
+        entry['hold_ms_total'] += hold_ms
+        entry['hold_ms_max'] = max(entry['hold_ms_max'], hold_ms)
+
+
+@contextmanager
+def get_connection(label='default'):
+    """
+    Borrow a pooled MySQL connection for the duration of a with-block
+
+    Usage:
+        with get_connection('get_device_by_id') as conn:
+            cursor = conn.cursor(dictionary=True)
+            ...
+
+    Acquire and hold times are recorded per label (see pool_stats()).
+    Uncommitted work is rolled back when the block raises.
+    """
+    config = get_config()
+    timeout = config.getfloat('database', 'pool_timeout', fallback=DEFAULT_POOL_TIMEOUT)
+
+    started = time.perf_counter()
+    conn = _acquire(timeout)
+    acquired = time.perf_counter()
+
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except mysql.connector.Error:
+            pass
+        raise
+    finally:
+        conn.close()  # returns the connection to the pool
+        released = time.perf_counter()
+
+        acquire_ms = (acquired - started) * 1000
+        hold_ms = (released - acquired) * 1000
+        _record(label, acquire_ms, hold_ms)
+        logger.debug(f"DB {label}: acquire {acquire_ms:.1f} ms, hold {hold_ms:.1f} ms")
+
+
+@contextmanager
+def get_direct_connection(label='direct', **options):
+    """
+    Open a dedicated (non-pooled) MySQL connection with extra connector options,
+    e.g. allow_local_infile=True for LOAD DATA LOCAL INFILE; closed after the block
+    """
+    config = get_config()
+    started = time.perf_counter()
+    conn = mysql.connector.connect(
+        host=config.get('database', 'db_host'),
+        database=config.get('database', 'db_name'),
+        user=config.get('database', 'db_user'),
+        password=config.get('database', 'db_password'),
+        port=config.getint('database', 'db_port'),
+        **options
+    )
+    acquired = time.perf_counter()
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except mysql.connector.Error:
+            pass
+        raise
+    finally:
+        conn.close()
+        _record(label, (acquired - started) * 1000, (time.perf_counter() - acquired) * 1000)
+
+
+def pool_stats():
+    """Per-label connection acquire/hold timings (ms)"""
+    with _stats_lock:
+        return {
+            label: {
+                'calls': entry['calls'],
+                'acquire_ms_avg': round(entry['acquire_ms_total'] / entry['calls'], 2),
+                'acquire_ms_max': round(entry['acquire_ms_max'], 2),
+                'hold_ms_avg': round(entry['hold_ms_total'] / entry['calls'], 2),
+                'hold_ms_max': round(entry['hold_ms_max'], 2),
+            }
+            for label, entry in _stats.items()
+        }
+
+
+def log_pool_stats():
+    """Log a one-line summary per label"""
+    for label, entry in sorted(pool_stats().items()):
+        logger.info(f"DB {label}: {entry['calls']} call(s), acquire avg {entry['acquire_ms_avg']} ms "
+                    f"(max {entry['acquire_ms_max']}), hold avg {entry['hold_ms_avg']} ms (max {entry['hold_ms_max']})")
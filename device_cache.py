@@ -0,0 +1,128 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceRegistry:
+    """
+    In-process cache of camera rows keyed by device_id
+
+    - Known devices are kept for ttl seconds, unknown IDs for negative_ttl
+      seconds so repeated bad IDs do not hit the database either
+    - warm() bulk-loads every device in one query
+    - invalidate() drops one device or everything; it also touches
+      invalidation_file so the other server worker processes drop their
+      copies on their next lookup (checked at most once per second)
+
+    load_one(device_id) must return the row or None and raise on database
+    errors (errors are never cached); load_all() returns a list of rows.
+    """
+
+    def __init__(self, load_one, load_all, ttl, negative_ttl, invalidation_file=None):
+        self.load_one = load_one
+        self.load_all = load_all
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.invalidation_file = invalidation_file
+
+        self._lock = threading.Lock()
+        self._entries = {}  # device_id -> (row or None, expires_at)
+        self._warmed = False
+        self._warm_failed_at = None
+        self._marker_mtime = self._read_marker_mtime()
+        self._marker_checked = time.monotonic()
+
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'warmups': 0, 'invalidations': 0}
+
+    def _read_marker_mtime(self):
+        if not self.invalidation_file:
+            return None
+        try:
+            return os.stat(self.invalidation_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_marker(self, now):
+        """Drop everything if another process invalidated since we last looked"""
+        if not self.invalidation_file or now - self._marker_checked < 1:
+            return
+        self._marker_checked = now
+        mtime = self._read_marker_mtime()
+        if mtime != self._marker_mtime:
+            self._marker_mtime = mtime
+            with self._lock:
+                self._entries.clear()
+                self._warmed = False
+            logger.info("Device cache cleared by invalidation from another worker")
+
+    def warm(self):
+        """Load every device in one query"""
+        rows = self.load_all()
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for row in rows:
+                self._entries[row['device_id']] = (row, expires_at)
+            self._warmed = True
+            self.stats['warmups'] += 1
+        logger.info(f"Device cache warmed with {len(rows)} devices")
+        return len(rows)
+
+    def get(self, device_id):
+        """Return the cached row for device_id (None if unknown), loading on miss"""
+        now = time.monotonic()
+        self._check_marker(now)
+
+        if not self._warmed and (self._warm_failed_at is None
+                                 or now - self._warm_failed_at > self.negative_ttl):
+            try:
+                self.warm()
+            except Exception as e:
+                # Fall back to single lookups; retry the bulk load later
+                self._warm_failed_at = now
+                logger.error(f"Device cache warm-up failed: {e}")
+
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is not None and entry[1] > now:
+                if entry[0] is None:
+                    self.stats['negative_hits'] += 1
+                else:
+                    self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+
+        row = self.load_one(device_id)
+        ttl = self.ttl if row is not None else self.negative_ttl
+        with self._lock:
+            self._entries[device_id] = (row, time.monotonic() + ttl)
+        return row
+
+    def invalidate(self, device_id=None):
+        """Drop one device (or all when device_id is None) here and in other workers"""
+        with self._lock:
+            if device_id is None:
+                self._entries.clear()
+                self._warmed = False
+            else:
+                self._entries.pop(device_id, None)
+            self.stats['invalidations'] += 1
+
+        if self.invalidation_file:
+            try:
+                with open(self.invalidation_file, 'a'):
+                    os.utime(self.invalidation_file)
+                self._marker_mtime = self._read_marker_mtime()
+            except OSError as e:
+                logger.warning(f"Could not touch device cache invalidation file {self.invalidation_file}: {e}")
+
+    def info(self):
+        """Cache size and counters for the health endpoint"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'warmed': self._warmed,
+                **self.stats
+            }
@@ -0,0 +1,206 @@
+import os
+import math
+import time
+import errno
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean "no such file", not "the disk is in trouble"
+MISSING_ERRNOS = {errno.ENOENT, errno.ENOTDIR}
+
+# Bytes read from the probe file on each probe
+PROBE_READ_BYTES = 64 * 1024
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = math.ceil(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(index, len(sorted_values) - 1))]
+
+
+class DiskHealthMonitor:
+    """
+    Tracks stat/read latency and errors per mirrored disk and picks which
+    disk of each mirror pair reads should go to first
+
+    - A background thread probes every disk each interval seconds: a stat
+      of the mount and a 64 KB read of a sample file with its page cache
+      dropped first, so the read reaches the disk
+    - Callers add passive samples with record() (e.g. the stat done for
+      each path lookup); these are mostly served from the dentry cache, so
+      they only count towards the error rate, never towards latency
+    - Probe and passive samples are kept in separate windows (probe_window
+      and window samples per disk)
+    - Each pair routes to its primary unless the primary is unhealthy
+      (probe failing or passive error rate above error_threshold) and the
+      mirror is not, or both are healthy and the primary's median probe
+      latency is over slow_factor times the mirror's (and at least slow_min_ms)
+
+    pairs maps a primary prefix to its mirror, e.g. {'/mnt/disk1/': '/mnt/disk2/'}.
+    on_route_change, if set, is called with no arguments whenever a pair
+    switches disks.
+    """
+
+    def __init__(self, pairs, interval=5, window=200, probe_window=24, error_threshold=0.2,
+                 slow_factor=3.0, slow_min_ms=20):
+        self.pairs = dict(pairs)
+        self.interval = interval
+        self.error_threshold = error_threshold
+        self.slow_factor = slow_factor
+        self.slow_min_ms = slow_min_ms
+        self.on_route_change = None
+
+        self.disks = list(dict.fromkeys(list(self.pairs) + list(self.pairs.values())))
+        self._lock = threading.Lock()
+        self._samples = {disk: deque(maxlen=window) for disk in self.disks}  # passive: (ms, ok)
+        self._probes = {disk: deque(maxlen=probe_window) for disk in self.disks}  # uncached probes: ms
+        self._probe_ok = {disk: True for disk in self.disks}
+        self._probe_files = {}
+        self._routes = {}
+        for primary, mirror in self.pairs.items():
+            self._routes[primary] = primary
+            self._routes[mirror] = primary
+
+        self._thread = None
+        self._thread_pid = None
+        self._stop = threading.Event()
+
+    def record(self, disk, seconds, ok=True):
+        """Add one passive sample (seconds) for disk; ok=False counts as an I/O error"""
+        samples = self._samples.get(disk)
+        if samples is not None:
+            samples.append((seconds * 1000, ok))
+
+    def route(self, disk):
+        """The disk of disk's mirror pair that reads should try first"""
+        return self._routes.get(disk, disk)
+
+    def _find_probe_file(self, disk, max_dirs=50):
+        """First regular file found walking down from the mount (depth first), or None"""
+        stack = [disk]
+        while stack and max_dirs > 0:
+            max_dirs -= 1
+            subdirs = []
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            return entry.path
+                        if entry.is_dir(follow_symlinks=False) and entry.name != 'lost+found':
+                            subdirs.append(entry.path)
+            except PermissionError:
+                continue
+            stack.extend(reversed(subdirs))
+        return None
+
+    def _read_probe(self, disk):
+        probe_file = self._probe_files.get(disk)
+        if probe_file is None:
+            probe_file = self._probe_files[disk] = self._find_probe_file(disk)
+            if probe_file is None:
+                return
+        try:
+            fd = os.open(probe_file, os.O_RDONLY)
+        except OSError as e:
+            if e.errno in MISSING_ERRNOS:
+                self._probe_files.pop(disk, None)  # pick another file next time
+                return
+            raise
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, PROBE_READ_BYTES, os.POSIX_FADV_DONTNEED)
+            os.pread(fd, PROBE_READ_BYTES, 0)
+        finally:
+            os.close(fd)
+
+    def probe(self, disk):
+        """Time a stat of the mount plus an uncached read; returns True if both succeeded"""
+        started = time.perf_counter()
+        try:
+            os.stat(disk)
+            self._read_probe(disk)
+            ok = True
+        except OSError as e:
+            if self._probe_ok[disk]:
+                logger.warning(f"Disk probe failed for {disk}: {e}")
+            ok = False
+        if ok:
+            self._probes[disk].append((time.perf_counter() - started) * 1000)
+        if ok and not self._probe_ok[disk]:
+            logger.info(f"Disk probe for {disk} succeeded again")
+        self._probe_ok[disk] = ok
+        return ok
+
+    def _disk_summary(self, disk):
+        samples = list(self._samples[disk])
+        errors = sum(1 for _, ok in samples if not ok)
+        error_rate = errors / len(samples) if samples else 0.0
+        probes = sorted(self._probes[disk])
+        return {
+            'healthy': self._probe_ok[disk] and error_rate <= self.error_threshold,
+            'samples': len(samples),
+            'error_rate': round(error_rate, 3),
+            'probes': len(probes),
+            'p50_ms': round(percentile(probes, 50), 2),
+            'p95_ms': round(percentile(probes, 95), 2),
+            'p99_ms': round(percentile(probes, 99), 2),
+            'passive_p95_ms': round(percentile(sorted(ms for ms, _ in samples), 95), 2),
+        }
+
+    def _choose(self, primary, mirror):
+        p = self._disk_summary(primary)
+        m = self._disk_summary(mirror)
+        if not p['healthy']:
+            return mirror if m['healthy'] else primary
+        if m['healthy'] and p['p50_ms'] > max(self.slow_min_ms, self.slow_factor * m['p50_ms']):
+            return mirror
+        return primary
+
+    def update_routes(self):
+        """Re-evaluate every pair; returns True if any route changed"""
+        changed = False
+        with self._lock:
+            for primary, mirror in self.pairs.items():
+                chosen = self._choose(primary, mirror)
+                if self._routes[primary] != chosen:
+                    logger.warning(f"Disk routing for {primary} / {mirror} switched to {chosen}")
+                    self._routes[primary] = self._routes[mirror] = chosen
+                    changed = True
+        if changed and self.on_route_change:
+            self.on_route_change()
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for disk in self.disks:
+                self.probe(disk)
+            self.update_routes()
+
+    def start(self):
+        """Start the probe thread (once per process, so again after a fork)"""
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        for disk in self.disks:
+            self.probe(disk)
+        self.update_routes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='disk-health', daemon=True)
+        self._thread.start()
+        self._thread_pid = os.getpid()
+        logger.info(f"Disk health monitor started for {', '.join(self.disks)} (every {self.interval}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def info(self):
+        """Per-disk latency percentiles, error rates and current routing for the health endpoint"""
+        with self._lock:
+            return {
+                'disks': {disk: self._disk_summary(disk) for disk in self.disks},
+                'routing': {primary: self._routes[primary] for primary in self.pairs}
+            }
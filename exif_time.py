@@ -0,0 +1,219 @@
+"""
+Capture-time (EXIF DateTimeOriginal) extraction without a process per image
+
+- JPEG: a minimal APP1 parser that reads only the marker segments before
+  the image data
+- Other formats Pillow understands: Pillow's EXIF reader (header only)
+- Anything still without a value: one exiftool process in -stay_open mode
+  fed batches of paths, when exiftool is installed
+"""
+import os
+import json
+import time
+import select
+import shutil
+import struct
+import logging
+import subprocess
+from datetime import datetime
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+EXIF_IFD_POINTER = 0x8769
+DATETIME_ORIGINAL = 0x9003
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+
+# Paths sent to exiftool per -execute
+EXIFTOOL_BATCH_SIZE = 200
+# Seconds to wait for exiftool to answer one batch
+EXIFTOOL_TIMEOUT = 60
+
+
+def parse_exif_datetime(value):
+    """Milliseconds since the epoch for 'YYYY:MM:DD HH:MM:SS' (local time), or None"""
+    try:
+        dt = datetime.strptime(value.strip()[:19], '%Y:%m:%d %H:%M:%S')
+    except (ValueError, AttributeError):
+        return None
+    return int(dt.timestamp() * 1000)
+
+
+def _jpeg_exif_segment(f):
+    """Return the TIFF block of the first Exif APP1 segment, reading no further than needed"""
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            f.seek(-1, os.SEEK_CUR)  # fill byte
+            continue
+        if code == 0x01 or 0xD0 <= code <= 0xD8:
+            continue  # markers without a length field
+        if code in (0xDA, 0xD9):
+            return None  # image data (or end) reached without EXIF
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if length < 2:
+            return None  # corrupt; seeking back would loop forever
+        if code == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(b'Exif\x00\x00'):
+                return data[6:]
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def _ifd_entries(tiff, order, offset):
+    """Yield (tag, type, count, raw value/offset bytes) for the IFD at offset"""
+    count = struct.unpack(order + 'H', tiff[offset:offset + 2])[0]
+    for i in range(count):
+        start = offset + 2 + 12 * i
+        yield struct.unpack(order + 'HHI4s', tiff[start:start + 12])
+
+
+def _tiff_datetime_original(tiff):
+    order = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if order is None:
+        return None
+    ifd0 = struct.unpack(order + 'I', tiff[4:8])[0]
+
+    exif_ifd = None
+    for tag, _, _, value in _ifd_entries(tiff, order, ifd0):
+        if tag == EXIF_IFD_POINTER:
+            exif_ifd = struct.unpack(order + 'I', value)[0]
+            break
+    if exif_ifd is None:
+        return None
+
+    for tag, value_type, count, value in _ifd_entries(tiff, order, exif_ifd):
+        if tag == DATETIME_ORIGINAL and value_type == 2:
+            if count > 4:
+                offset = struct.unpack(order + 'I', value)[0]
+                value = tiff[offset:offset + count]
+                if len(value) < count:
+                    return None  # truncated file
+            text = value[:count].rstrip(b'\x00 ').decode('ascii', errors='replace')
+            return text or None
+    return None
+
+
+def jpeg_datetime_original(path):
+    """DateTimeOriginal string from a JPEG's APP1 segment, or None"""
+    try:
+        with open(path, 'rb') as f:
+            tiff = _jpeg_exif_segment(f)
+        return _tiff_datetime_original(tiff) if tiff else None
+    except (OSError, struct.error):
+        return None
+
+
+def pillow_datetime_original(path):
+    """DateTimeOriginal string via Pillow's EXIF reader, or None"""
+    try:
+        with Image.open(path) as img:
+            value = img.getexif().get_ifd(EXIF_IFD_POINTER).get(DATETIME_ORIGINAL)
+    except Exception:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('ascii', errors='replace')
+    if not isinstance(value, str):
+        return None
+    return value.strip('\x00 ') or None
+
+
+class ExifToolBatch:
+    """
+    One long-running exiftool (-stay_open) answering many paths per request
+
+    Usage:
+        with ExifToolBatch() as exiftool:
+            values = exiftool.datetime_originals(paths)
+    """
+
+    def __init__(self, executable='exiftool', timeout=EXIFTOOL_TIMEOUT):
+        self.executable = executable
+        self.timeout = timeout
+        self._proc = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        self._proc = subprocess.Popen(
+            [self.executable, '-stay_open', 'True', '-@', '-',
+             '-common_args', '-j', '-charset', 'filename=utf8', '-DateTimeOriginal'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+
+    def _read_until_ready(self):
+        fd = self._proc.stdout.fileno()
+        output = b''
+        deadline = time.monotonic() + self.timeout
+        while not output.rstrip().endswith(b'{ready}'):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError(f"exiftool did not answer within {self.timeout}s")
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise RuntimeError("exiftool exited unexpectedly")
+            output += chunk
+        return output.rstrip()[:-len(b'{ready}')]
+
+    def datetime_originals(self, paths):
+        """Returns {str(path): DateTimeOriginal string or None}"""
+        values = {}
+        paths = [str(p) for p in paths]
+        for i in range(0, len(paths), EXIFTOOL_BATCH_SIZE):
+            batch = paths[i:i + EXIFTOOL_BATCH_SIZE]
+            self._proc.stdin.write(('\n'.join(batch) + '\n-execute\n').encode())
+            self._proc.stdin.flush()
+            output = self._read_until_ready().strip()
+            for item in json.loads(output) if output else []:
+                value = item.get('DateTimeOriginal')
+                values[item.get('SourceFile')] = str(value) if value else None
+        return {path: values.get(path) for path in paths}
+
+    def close(self):
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.write(b'-stay_open\nFalse\n')
+            self._proc.stdin.flush()
+            self._proc.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.kill()
+        self._proc = None
+
+
+def datetime_originals(paths, use_exiftool=True):
+    """
+    DateTimeOriginal for many images at once
+    Returns {path: 'YYYY:MM:DD HH:MM:SS' or None}, keyed by the paths given
+    """
+    values = {}
+    for path in paths:
+        if os.path.splitext(str(path))[1].lower() in JPEG_EXTENSIONS:
+            values[path] = jpeg_datetime_original(path)
+        else:
+            values[path] = pillow_datetime_original(path)
+
+    missing = [path for path, value in values.items() if value is None]
+    if missing and use_exiftool and shutil.which('exiftool'):
+        try:
+            with ExifToolBatch() as exiftool:
+                found = exiftool.datetime_originals(missing)
+            for path in missing:
+                values[path] = found.get(str(path))
+        except Exception as e:
+            logger.warning(f"exiftool batch lookup failed for {len(missing)} file(s): {e}")
+    return values
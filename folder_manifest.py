@@ -0,0 +1,174 @@
+import os
+from pathlib import Path
+from imaging import is_derivative
+
+# Ingest status flags kept per file (see ingest_state.py)
+STATUS_FLAGS = ('renamed', 'thumbnailed', 'copied', 'inserted', 'mirrored')
+
+
+class ManifestEntry:
+    """One file in a camera folder"""
+
+    __slots__ = ('path', 'size', 'mtime', 'inode', 'is_thumbnail', 'timestamp', 'area') + STATUS_FLAGS
+
+    def __init__(self, path, size, mtime, inode, is_thumbnail, timestamp, area, **status):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.inode = inode
+        self.is_thumbnail = is_thumbnail  # inside a thumbnail/derivatives folder
+        self.timestamp = timestamp  # milliseconds parsed from the file name, or None
+        self.area = area  # first subfolder under the camera folder, or 'unknown'
+        for flag in STATUS_FLAGS:
+            setattr(self, flag, bool(status.get(flag, False)))
+
+
+class FolderManifest:
+    """
+    In-memory listing of a camera folder built with a single os.scandir walk
+
+    Pipeline stages take the manifest instead of walking the tree again, and
+    report their own renames and new files so it stays accurate for the
+    stages that follow. parse_timestamp(filename) returns the millisecond
+    timestamp encoded in a file name, or None.
+
+    Given the manifest of an earlier run (previous), scan() only lists the
+    folders whose mtime changed, and reuses the earlier entry (and its
+    status) for files whose inode is unchanged instead of stat'ing them.
+    changed/removed collect the paths added, updated or dropped since.
+    """
+
+    def __init__(self, root, image_extensions, parse_timestamp):
+        self.root = Path(root)
+        self.image_extensions = image_extensions
+        self.parse_timestamp = parse_timestamp
+        self.files = {}  # Path -> ManifestEntry
+        self.dirs = []  # Paths of every subfolder
+        self.dir_mtimes = {}  # str path -> st_mtime_ns when listed (root included)
+        self.listed_dirs = 0  # folders actually listed by the last scan
+        self.changed = set()
+        self.removed = set()
+
+    @classmethod
+    def scan(cls, root, image_extensions, parse_timestamp, previous=None):
+        manifest = cls(root, image_extensions, parse_timestamp)
+        known_dirs = {}
+        known_files = {}
+        if previous is not None:
+            for path in previous.dir_mtimes:
+                known_dirs.setdefault(str(Path(path).parent), []).append(path)
+            for entry in previous.files.values():
+                known_files.setdefault(str(entry.path.parent), []).append(entry)
+
+        stack = [(str(manifest.root), None)]
+        while stack:
+            path, mtime_ns = stack.pop()
+            if mtime_ns is None:
+                mtime_ns = os.stat(path).st_mtime_ns
+            manifest.dir_mtimes[path] = mtime_ns
+
+            if previous is not None and previous.dir_mtimes.get(path) == mtime_ns:
+                # Listing unchanged since the last run: reuse it without reading the folder
+                for entry in known_files.get(path, ()):
+                    manifest.files[entry.path] = entry
+                for subdir in known_dirs.get(path, ()):
+                    if subdir != path:
+                        manifest.dirs.append(Path(subdir))
+                        stack.append((subdir, None))
+                continue
+
+            manifest.listed_dirs += 1
+            known = {str(entry.path): entry for entry in known_files.get(path, ())}
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        manifest.dirs.append(Path(entry.path))
+                        stack.append((entry.path, entry.stat(follow_symlinks=False).st_mtime_ns))
+                    elif entry.is_file(follow_symlinks=False):
+                        earlier = known.get(entry.path)
+                        if earlier is not None and earlier.inode == entry.inode():
+                            manifest.files[earlier.path] = earlier
+                        else:
+                            manifest._add(Path(entry.path), entry.stat(follow_symlinks=False))
+
+        if previous is not None:
+            manifest.removed = set(previous.files) - set(manifest.files)
+        return manifest
+
+    def _add(self, path, stat_result, **status):
+        relative = path.relative_to(self.root)
+        self.files[path] = ManifestEntry(
+            path=path,
+            size=stat_result.st_size,
+            mtime=stat_result.st_mtime,
+            inode=stat_result.st_ino,
+            is_thumbnail=is_derivative(relative.parent),
+            timestamp=self.parse_timestamp(path.name),
+            area=relative.parts[0] if len(relative.parts) > 1 else 'unknown',
+            **status
+        )
+        self.changed.add(path)
+
+    def images(self):
+        """Original images (not thumbnails or other derivatives)"""
+        return [entry for entry in self.files.values()
+                if not entry.is_thumbnail and entry.path.suffix.lower() in self.image_extensions]
+
+    def has_file(self, path):
+        return Path(path) in self.files
+
+    def add_file(self, path, **status):
+        """Record a file a stage has just written"""
+        path = Path(path)
+        self._add(path, os.stat(path), **status)
+        for parent in path.parents:
+            if parent == self.root or parent in self.dirs:
+                break
+            self.dirs.append(parent)
+
+    def mark(self, entry, *flags):
+        """Set ingest status flags on an entry"""
+        for flag in flags:
+            if not getattr(entry, flag):
+                setattr(entry, flag, True)
+                self.changed.add(entry.path)
+
+    def rename_file(self, old_path, new_path):
+        """Record a file rename done by a stage"""
+        entry = self.files.pop(Path(old_path))
+        entry.path = Path(new_path)
+        entry.timestamp = self.parse_timestamp(entry.path.name)
+        self.files[entry.path] = entry
+        self.changed.discard(Path(old_path))
+        self.removed.add(Path(old_path))
+        self.changed.add(entry.path)
+
+    def rename_dir(self, old_path, new_path):
+        """Record a subfolder rename: every path below it moves too"""
+        old_path, new_path = Path(old_path), Path(new_path)
+
+        def moved(path):
+            if path == old_path or old_path in path.parents:
+                return new_path / path.relative_to(old_path)
+            return path
+
+        self.dirs = [moved(d) for d in self.dirs]
+        self.dir_mtimes = {str(moved(Path(d))): mtime_ns for d, mtime_ns in self.dir_mtimes.items()}
+        files = {}
+        for entry in self.files.values():
+            path = moved(entry.path)
+            if path != entry.path:
+                self.changed.discard(entry.path)
+                self.removed.add(entry.path)
+                self.changed.add(path)
+                entry.path = path
+                relative = path.relative_to(self.root)
+                entry.area = relative.parts[0] if len(relative.parts) > 1 else 'unknown'
+            files[path] = entry
+        self.files = files
+
+    def file_count(self):
+        return len(self.files)
+
+    def total_size(self):
+        return sum(entry.size for entry in self.files.values())
@@ -1,13 +1,24 @@
-import mysql.connector
 import json
-import shutil
 import os
 import re
+import time
 import subprocess
 import logging
+import threading
+import multiprocessing
 from pathlib import Path
-from configparser import ConfigParser
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from db import get_connection, log_pool_stats
 from PIL import Image
+from exif_time import datetime_originals, parse_exif_datetime
+from folder_manifest import FolderManifest
+from ingest_state import IngestState
+from transfer import transfer_folder, remove_empty_dirs
+from scheduler import Scheduler
+from placement import PlacementEngine
+from snapshot_loader import SnapshotLoader, load_watermarks
+from imaging import render_ladder, derivative_path, is_derivative, DERIVATIVE_SIZES
 from datetime import datetime, timedelta
 
 # Configure logging
@@ -21,34 +32,53 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    config = ConfigParser()
-    config.read('credentials.ini')
-
-    return mysql.connector.connect(
-        host=config.get('database', 'db_host'),
-        database=config.get('database', 'db_name'),
-        user=config.get('database', 'db_user'),
-        password=config.get('database', 'db_password'),
-        port=config.getint('database', 'db_port')
-    )
+def available_cpus():
+    """CPUs this process may run on (respects taskset/cgroup affinity)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Derivative generation runs on a process pool; images are handed out in chunks
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', available_cpus()))
+DERIVATIVE_CHUNKSIZE = int(os.environ.get('DERIVATIVE_CHUNKSIZE', 8))
+# Seconds between derivative progress lines
+PROGRESS_INTERVAL = 10
+# Folders are processed concurrently (see scheduler.py): threads scanning/renaming folders,
+# concurrent file moves per destination disk, and files per move task
+PREPARE_THREADS = int(os.environ.get('PREPARE_THREADS', 2))
+COPY_STREAMS_PER_DISK = int(os.environ.get('COPY_STREAMS_PER_DISK', 2))
+COPY_SLICE_FILES = int(os.environ.get('COPY_SLICE_FILES', 200))
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp'}
+
+# Per-file ingest state kept between runs so unchanged folders are skipped
+INGEST_STATE_DB = os.environ.get('INGEST_STATE_DB', '/var/lib/image-processor/ingest_state.db')
+# Primary disk -> mirror disk (kept in sync by start_rsync)
+MIRROR_DISKS = {'/mnt/disk1/': '/mnt/disk2/', '/mnt/disk3/': '/mnt/disk4/'}
 
 def get_camera_data():
+    """
+    Camera rows with their snapshot watermarks from camera.snapshot_watermark:
+    area_watermarks ({area_name: newest time in ms}) and last_added_time (newest of those)
+    """
     logger.info("Fetching camera data from database")
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    with get_connection('get_camera_data') as conn:
+        cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("""
-        SELECT c.device_id, c.serial_id, c.site_id, s.name as site_name, c.timezone, ss.last_added_time
-        FROM camera.camera c
-        LEFT JOIN camera.site s ON c.site_id = s.site_id
-        LEFT JOIN (SELECT device_id, MAX(time) last_added_time FROM camera.snapshot GROUP BY device_id) ss
-            ON ss.device_id = c.device_id
-    """)
+        cursor.execute("""
+            SELECT c.device_id, c.serial_id, c.site_id, s.name as site_name, c.timezone
+            FROM camera.camera c
+            LEFT JOIN camera.site s ON c.site_id = s.site_id
+        """)
 
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        results = cursor.fetchall()
+        cursor.close()
+
+    watermarks = load_watermarks()
+    for cam in results:
+        cam['area_watermarks'] = watermarks.get(cam['device_id'], {})
+        cam['last_added_time'] = max(cam['area_watermarks'].values(), default=None)
 
     logger.info(f"Fetched {len(results)} camera records")
     return results
@@ -92,33 +122,6 @@ def clean_subfolder_name(name, serial_id):
 
     return name
 
-def get_disk_usage(path):
-    """Get disk usage percentage for given path"""
-    stat = os.statvfs(path)
-    total = stat.f_blocks * stat.f_frsize
-    free = stat.f_bavail * stat.f_frsize
-    used = total - free
-    usage_percent = (used / total) * 100
-    return usage_percent
-
-def select_destination_disk():
-    """Select disk1 or disk3 based on usage, prioritize disk1"""
-    disk1_usage = get_disk_usage('/mnt/disk1')
-
-    if disk1_usage < 85:
-        logger.info(f"Using disk1 (usage: {disk1_usage:.1f}%)")
-        return Path('/mnt/disk1/media')
-
-    disk3_usage = get_disk_usage('/mnt/disk3')
-
-    if disk3_usage < 85:
-        logger.info(f"disk1 is over 85% ({disk1_usage:.1f}%), using disk3 (usage: {disk3_usage:.1f}%)")
-        return Path('/mnt/disk3/media')
-
-    # Both disks over 85%, still use disk1 but warn
-    logger.warning(f"Both disks over 85% (disk1: {disk1_usage:.1f}%, disk3: {disk3_usage:.1f}%) - using disk1 anyway")
-    return Path('/mnt/disk1/media')
-
 def is_millisecond_format(filename):
     """Check if filename is already in millisecond timestamp format"""
     name_without_ext = Path(filename).stem
@@ -135,99 +138,165 @@ def get_timestamp_from_filename(filename):
         return int(match.group(1))
     return None
 
+def get_image_timestamps(image_paths):
+    """
+    Get timestamps in milliseconds from EXIF DateTimeOriginal for many images
+    Read in-process; exiftool (one batch process) only for files that need it
+    Returns dict {image_path: timestamp_ms or None}
+    """
+    timestamps = {}
+    for image_path, datetime_str in datetime_originals(image_paths).items():
+        # Parse datetime string: "2024:10:23 14:30:45"
+        timestamps[image_path] = parse_exif_datetime(datetime_str) if datetime_str else None
+        if datetime_str and timestamps[image_path] is None:
+            logger.warning(f"Could not parse timestamp '{datetime_str}' for {image_path.name}")
+    return timestamps
+
 def get_image_timestamp(image_path):
-    """Get timestamp in milliseconds from image using exiftool"""
+    """Get timestamp in milliseconds from image EXIF DateTimeOriginal"""
+    return get_image_timestamps([image_path])[image_path]
+
+def scan_folder(folder_path, ingest_state=None):
+    """
+    Walk a camera folder once; the manifest is handed from stage to stage
+    With ingest_state, only subfolders changed since the last run are listed
+    """
+    previous = None
+    if ingest_state is not None:
+        previous = ingest_state.load(folder_path, IMAGE_EXTENSIONS, get_timestamp_from_filename)
+    return FolderManifest.scan(folder_path, IMAGE_EXTENSIONS, get_timestamp_from_filename, previous=previous)
+
+def open_ingest_state():
+    """Open the ingest state database, or None (full scans) if it is unavailable"""
     try:
-        result = subprocess.run(
-            ['exiftool', '-DateTimeOriginal', '-s3', str(image_path)],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-
-        if result.returncode == 0 and result.stdout.strip():
-            # Parse datetime string: "2024:10:23 14:30:45"
-            datetime_str = result.stdout.strip()
-            from datetime import datetime
-            dt = datetime.strptime(datetime_str, '%Y:%m:%d %H:%M:%S')
-            timestamp_ms = int(dt.timestamp() * 1000)
-            return timestamp_ms
+        return IngestState(INGEST_STATE_DB)
     except Exception as e:
-        logger.warning(f"Could not get timestamp for {image_path.name}: {e}")
-
+        logger.warning(f"Ingest state unavailable ({INGEST_STATE_DB}: {e}), scanning every folder in full")
+        return None
+
+def mirror_path(path):
+    """Where start_rsync mirrors path to, or None for paths outside the mirrored disks"""
+    path = str(path)
+    for primary, mirror in MIRROR_DISKS.items():
+        if path.startswith(primary):
+            return Path(mirror + path[len(primary):])
     return None
 
-def create_thumbnail(image_path, thumbnail_dir):
-    """Create a thumbnail (150x84) for the given image"""
+def mark_copied(manifest, source=None):
+    """
+    Flag every file of a folder on a primary disk as copied
+    Status from the source folder's manifest (renamed, thumbnailed) is carried over
+    """
+    for entry in manifest.files.values():
+        if entry.copied:
+            continue
+        flags = ['copied']
+        origin = None
+        if source is not None:
+            origin = source.files.get(source.root / entry.path.relative_to(manifest.root))
+        if origin is not None:
+            flags += [flag for flag in ('renamed', 'thumbnailed') if getattr(origin, flag)]
+        elif entry.timestamp is not None:
+            flags.append('renamed')
+        manifest.mark(entry, *flags)
+
+def mark_mirrored(manifest):
+    """Flag files whose mirror copy exists with the same size (only files not yet flagged are checked)"""
+    for entry in manifest.files.values():
+        if entry.mirrored:
+            continue
+        mirrored = mirror_path(entry.path)
+        try:
+            if mirrored is None or mirrored.stat().st_size == entry.size:
+                manifest.mark(entry, 'mirrored')
+        except OSError:
+            pass
+
+def missing_derivatives(image_path, manifest=None):
+    """Ladder sizes that have no derivative file yet for image_path"""
+    if manifest is not None:
+        return [size for size in DERIVATIVE_SIZES if not manifest.has_file(derivative_path(image_path, size))]
+    return [size for size in DERIVATIVE_SIZES if not derivative_path(image_path, size).exists()]
+
+def create_derivatives(image_path, sizes=None):
+    """
+    Create the missing derivatives (thumbnail 150x84, 640x480, ...) for the given image
+    The image is decoded once for all sizes; each file is written under a
+    temporary name and renamed so the server never sees a partial file
+    """
     try:
-        # Create thumbnail directory if it doesn't exist
-        thumbnail_dir.mkdir(parents=True, exist_ok=True)
-
-        # Check if thumbnail already exists
-        thumbnail_path = thumbnail_dir / image_path.name
-        if thumbnail_path.exists():
+        sizes = missing_derivatives(image_path) if sizes is None else sizes
+        if not sizes:
             return True
 
+        save_format = Image.registered_extensions().get(image_path.suffix.lower())
+
         # Open image
         with Image.open(image_path) as img:
-            # Create thumbnail with size (150, 84)
-            img.thumbnail((150, 84), Image.Resampling.LANCZOS)
-
-            # Save thumbnail with same filename
-            img.save(thumbnail_path, quality=85, optimize=True)
-
-            return True
+            for size, derivative in render_ladder(img, sizes).items():
+                path = derivative_path(image_path, size)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f".{path.name}.tmp")
+                derivative.save(tmp_path, format=save_format, quality=85, optimize=True)
+                os.replace(tmp_path, path)
+
+        return True
     except Exception as e:
-        logger.warning(f"Could not create thumbnail for {image_path.name}: {e}")
+        logger.warning(f"Could not create derivatives for {image_path.name}: {e}")
         return False
 
-def create_thumbnails_for_folder(folder_path):
-    """Create thumbnails for all images in the folder structure"""
-    folder_path = Path(folder_path)
-    image_extensions = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp'}
-
-    logger.info(f"Checking/creating thumbnails for {folder_path.name}")
-
-    # Find all image files
-    all_images = [f for f in folder_path.rglob('*')
-                  if f.is_file() and f.suffix.lower() in image_extensions
-                  and 'thumbnail' not in f.parts]
-
-    if not all_images:
-        logger.info("No images found in folder")
-        return 0
-
-    thumbnail_count = 0
-    created_count = 0
+def create_derivatives_chunk(chunk):
+    """
+    Pool worker: create derivatives for [(image_path, sizes), ...]
+    Returns [(image_path, success, bytes_read), ...]; a failing image only fails itself
+    """
+    results = []
+    for image_path, sizes in chunk:
+        try:
+            size = image_path.stat().st_size
+        except OSError:
+            size = 0
+        results.append((image_path, create_derivatives(image_path, sizes), size))
+    return results
 
-    for img_path in all_images:
-        # Create thumbnail directory in the same subfolder
-        thumbnail_dir = img_path.parent / 'thumbnail'
-        thumbnail_path = thumbnail_dir / img_path.name
-
-        if not thumbnail_path.exists():
-            if create_thumbnail(img_path, thumbnail_dir):
-                created_count += 1
-                thumbnail_count += 1
+def plan_derivatives(manifest):
+    """
+    [(image_path, missing sizes), ...] for the folder's images still missing derivatives
+    Images whose ladder is already complete are flagged thumbnailed on the way
+    """
+    jobs = []
+    for entry in manifest.images():
+        if entry.thumbnailed:
+            continue
+        missing = missing_derivatives(entry.path, manifest)
+        if missing:
+            jobs.append((entry.path, missing))
         else:
-            thumbnail_count += 1
+            manifest.mark(entry, 'thumbnailed')
+    return jobs
 
-    logger.info(f"Thumbnails: {thumbnail_count} total ({created_count} newly created)")
-    return created_count
+def record_derivatives(manifest, image_path, sizes):
+    """Add the derivatives just created for image_path to the manifest and flag the image"""
+    for derivative_size in sizes:
+        manifest.add_file(derivative_path(image_path, derivative_size))
+    manifest.mark(manifest.files[image_path], 'thumbnailed')
 
-def preprocess_folder(folder_path, serial_id):
-    """Clean folder names, rename subfolders, and rename images with timestamps"""
+def preprocess_folder(folder_path, serial_id, manifest=None):
+    """
+    Clean folder names, rename subfolders, and rename images with timestamps
+    Returns the folder manifest, updated with the renames
+    """
     folder_path = Path(folder_path)
+    manifest = manifest or scan_folder(folder_path)
     logger.info(f"Preprocessing folder: {folder_path.name}")
 
     # Step 1: Rename all subfolders (bottom-up to avoid path issues)
-    all_dirs = sorted([d for d in folder_path.rglob('*') if d.is_dir()],
-                      key=lambda x: len(str(x)), reverse=True)
+    all_dirs = sorted(manifest.dirs, key=lambda x: len(str(x)), reverse=True)
 
     renamed_folders = 0
     for subdir in all_dirs:
-        # Skip thumbnail directories
-        if subdir.name == 'thumbnail':
+        # Skip thumbnail/derivative directories
+        if is_derivative(subdir.relative_to(folder_path)):
             continue
 
         cleaned_name = clean_subfolder_name(subdir.name, serial_id)
@@ -235,27 +304,30 @@ def preprocess_folder(folder_path, serial_id):
             new_path = subdir.parent / cleaned_name
             logger.debug(f"Renaming folder: '{subdir.name}' -> '{cleaned_name}'")
             subdir.rename(new_path)
+            manifest.rename_dir(subdir, new_path)
             renamed_folders += 1
 
     if renamed_folders > 0:
         logger.info(f"Renamed {renamed_folders} subfolders")
 
     # Step 2: Rename all images based on timestamp
-    image_extensions = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp'}
-    all_images = [f for f in folder_path.rglob('*')
-                  if f.is_file() and f.suffix.lower() in image_extensions
-                  and 'thumbnail' not in f.parts]
+    all_images = [entry.path for entry in manifest.images()]
 
     renamed_images = 0
     skipped_images = 0
 
+    # Read capture times for all images still to rename in one pass
+    to_rename = [f for f in all_images if not is_millisecond_format(f.name)]
+    timestamps = get_image_timestamps(to_rename)
+
     for img_path in all_images:
         # Skip if already in millisecond format
         if is_millisecond_format(img_path.name):
+            manifest.mark(manifest.files[img_path], 'renamed')
             skipped_images += 1
             continue
 
-        timestamp = get_image_timestamp(img_path)
+        timestamp = timestamps[img_path]
 
         if timestamp:
             new_name = f"{timestamp}{img_path.suffix}"
@@ -263,28 +335,21 @@ def preprocess_folder(folder_path, serial_id):
 
             # Handle duplicate timestamps
             counter = 1
-            while new_path.exists():
+            while manifest.has_file(new_path) or new_path.exists():
                 new_name = f"{timestamp}_{counter}{img_path.suffix}"
                 new_path = img_path.parent / new_name
                 counter += 1
 
             logger.debug(f"Renaming image: {img_path.name} -> {new_name}")
             img_path.rename(new_path)
+            manifest.rename_file(img_path, new_path)
+            manifest.mark(manifest.files[new_path], 'renamed')
             renamed_images += 1
         else:
             logger.warning(f"Keeping original name: {img_path.name} (no timestamp found)")
 
     logger.info(f"Renamed {renamed_images} images, skipped {skipped_images} already processed")
-
-def verify_copy(source, destination):
-    """Verify the copy was successful by comparing file counts and total size"""
-    src_files = list(Path(source).rglob('*'))
-    dst_files = list(Path(destination).rglob('*'))
-
-    src_count = len([f for f in src_files if f.is_file()])
-    dst_count = len([f for f in dst_files if f.is_file()])
-
-    return src_count == dst_count and src_count > 0
+    return manifest
 
 def get_folder_age(folder_path):
     """Get the age of the folder in hours"""
@@ -326,116 +391,102 @@ def get_todays_folders():
     logger.info(f"Found {len(todays_folders)} folders from last 24 hours")
     return todays_folders
 
-def has_thumbnail(image_path):
+def has_thumbnail(image_path, manifest=None):
     """Check if thumbnail exists for the given image"""
     thumbnail_path = image_path.parent / 'thumbnail' / image_path.name
+    if manifest is not None:
+        return manifest.has_file(thumbnail_path)
     return thumbnail_path.exists()
 
-def insert_snapshots_to_db(folder_path, camera_info):
-    """Insert snapshots from folder to database"""
+def snapshot_row(camera_info, img_path, timestamp, area_name, thumbnail):
+    """One camera.snapshot row for an image"""
+    return {
+        'device_id': camera_info['device_id'],
+        'time': timestamp,
+        'url': str(img_path),
+        'thumbnail': 1 if thumbnail else 0,
+        'timezone': camera_info.get('timezone', 'UTC'),
+        'area_name': area_name,
+        'created_by': 0,  # System
+        'updated_by': 0,  # System
+        'preset_id': 0,
+        'adjusted_start_time': 0
+    }
+
+def insert_snapshot_rows(rows, label='insert_snapshots_to_db'):
+    """Write snapshot rows in one transaction (upserts when the unique key exists); returns affected rows"""
+    loader = SnapshotLoader(label=label)
+    loader.add(rows)
+    return loader.flush()
+
+def insert_snapshots_to_db(folder_path, camera_info, manifest=None, loader=None):
+    """
+    Insert snapshots from folder to database
+    With a loader the rows are only queued (written on loader.flush(), together with
+    other folders' rows); returns the number of rows queued or inserted
+    """
     folder_path = Path(folder_path)
-    image_extensions = {'.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp'}
+    manifest = manifest or scan_folder(folder_path)
+    flush = loader is None
+    loader = loader or SnapshotLoader()
 
     logger.info(f"Checking snapshots for device_id: {camera_info['device_id']}")
 
-    # Get all images (excluding thumbnails)
-    all_images = [f for f in folder_path.rglob('*')
-                  if f.is_file() and f.suffix.lower() in image_extensions
-                  and 'thumbnail' not in f.parts]
+    # Get all images not inserted yet (excluding thumbnails and other derivatives)
+    all_images = [entry for entry in manifest.images() if not entry.inserted]
 
     if not all_images:
         logger.info("No images to insert")
         return 0
 
-    # Get last_added_time for this device
-    last_added_time = camera_info.get('last_added_time')
-    if last_added_time:
-        # Convert to milliseconds if it's a datetime object
-        if isinstance(last_added_time, datetime):
-            last_added_time = int(last_added_time.timestamp() * 1000)
-        else:
-            last_added_time = int(last_added_time)
-    else:
-        last_added_time = 0
-
-    # Get max timestamp from folder
-    max_timestamp = 0
-    for img in all_images:
-        timestamp = get_timestamp_from_filename(img.name)
-        if timestamp:
-            max_timestamp = max(max_timestamp, timestamp)
-
-    logger.info(f"Last added time in DB: {last_added_time}, Max timestamp in folder: {max_timestamp}")
+    # Without the (device_id, time, area_name) unique key, the per-area watermarks are what
+    # avoid duplicates; each area is compared with its own watermark so a late area still loads
+    watermarks = {}
+    if not loader.upsert:
+        watermarks = camera_info.get('area_watermarks') or {}
+        logger.info(f"Area watermarks in DB: {watermarks}")
 
-    # If last_added_time matches max_timestamp, skip
-    if last_added_time >= max_timestamp:
-        logger.info("Skipping - DB is up to date")
-        return 0
+        # Images at or before their area's watermark are already in the database
+        for entry in all_images:
+            if entry.timestamp and entry.timestamp <= watermarks.get(entry.area or '', 0):
+                manifest.mark(entry, 'inserted')
 
     # Prepare data for insertion
     snapshots_to_insert = []
+    entries_to_insert = []
 
-    for img_path in all_images:
-        timestamp = get_timestamp_from_filename(img_path.name)
-
-        if not timestamp:
-            logger.warning(f"Could not extract timestamp from {img_path.name}")
+    for entry in all_images:
+        if not entry.timestamp:
+            logger.warning(f"Could not extract timestamp from {entry.path.name}")
             continue
 
         # Skip if already in database
-        if timestamp <= last_added_time:
+        if entry.inserted:
             continue
 
-        # Get area_name (subfolder name)
-        relative_path = img_path.relative_to(folder_path)
-        area_name = relative_path.parts[0] if len(relative_path.parts) > 1 else "unknown"
-
-        # Construct URL
-        url = str(img_path)
-
-        # Check if thumbnail exists (1 or 0)
-        thumbnail_flag = 1 if has_thumbnail(img_path) else 0
-
-        snapshot = {
-            'device_id': camera_info['device_id'],
-            'time': timestamp,
-            'url': url,
-            'thumbnail': thumbnail_flag,
-            'timezone': camera_info.get('timezone', 'UTC'),
-            'area_name': area_name,
-            'created_by': 0,  # System
-            'updated_by': 0,  # System
-            'preset_id': 0,
-            'adjusted_start_time': 0
-        }
-
-        snapshots_to_insert.append(snapshot)
+        # area_name is the subfolder name; thumbnail is 1 if a thumbnail exists
+        snapshots_to_insert.append(snapshot_row(camera_info, entry.path, entry.timestamp, entry.area,
+                                                has_thumbnail(entry.path, manifest)))
+        entries_to_insert.append(entry)
 
     if not snapshots_to_insert:
         logger.info("No new snapshots to insert")
         return 0
 
-    # Insert into database
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+    def on_loaded():
+        for entry in entries_to_insert:
+            manifest.mark(entry, 'inserted')
 
-        insert_query = """
-            INSERT INTO camera.snapshot
-            (device_id, time, url, thumbnail, timezone, area_name, created_by, updated_by, preset_id, adjusted_start_time)
-            VALUES (%(device_id)s, %(time)s, %(url)s, %(thumbnail)s, %(timezone)s, %(area_name)s,
-                    %(created_by)s, %(updated_by)s, %(preset_id)s, %(adjusted_start_time)s)
-        """
+    loader.add(snapshots_to_insert, on_loaded)
+    if not flush:
+        logger.info(f"Queued {len(snapshots_to_insert)} snapshots for device_id: {camera_info['device_id']}")
+        return len(snapshots_to_insert)
 
-        cursor.executemany(insert_query, snapshots_to_insert)
-        conn.commit()
-
-        inserted_count = cursor.rowcount
-        cursor.close()
-        conn.close()
-
-        logger.info(f"Inserted {inserted_count} snapshots for device_id: {camera_info['device_id']}")
-        return inserted_count
+    # Insert into database
+    try:
+        loader.flush()
+        logger.info(f"Inserted {len(snapshots_to_insert)} snapshots for device_id: {camera_info['device_id']}")
+        return len(snapshots_to_insert)
 
     except Exception as e:
         logger.error(f"Error inserting snapshots: {e}", exc_info=True)
@@ -483,43 +534,366 @@ def start_rsync():
         except Exception as e:
             logger.error(f"Error starting rsync for {job['name']}: {e}", exc_info=True)
 
-def update_preset_numbers():
-    """Update preset numbers based on alphabetically ordered area_name for each device"""
-    logger.info("Updating preset numbers based on area_name ordering")
-    
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        update_query = """
-            UPDATE snapshot s
-            JOIN (
-                SELECT 
-                    ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY area_name) AS order_number,
-                    area_name,
-                    device_id
-                FROM snapshot
-                WHERE area_name IS NOT NULL
-                GROUP BY device_id, area_name
-            ) AS area_order ON s.area_name = area_order.area_name 
-                            AND s.device_id = area_order.device_id
-            SET s.preset_id = area_order.order_number
-            WHERE s.area_name IS NOT NULL
-        """
-        
-        cursor.execute(update_query)
-        conn.commit()
-        
-        updated_count = cursor.rowcount
-        cursor.close()
-        conn.close()
-        
-        logger.info(f"Updated preset numbers for {updated_count} snapshot records")
-        return updated_count
-        
-    except Exception as e:
-        logger.error(f"Error updating preset numbers: {e}", exc_info=True)
-        return 0
+class DerivativePool:
+    """
+    One derivative process pool shared by every folder of the run
+    A worker crash breaks the pool; it is replaced and the caller retries its images.
+    Workers come from a forkserver, since forking a process with running threads is unsafe.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.context = multiprocessing.get_context('forkserver')
+        self.executor = self._executor(workers) if workers > 1 else None
+
+    def _executor(self, workers):
+        return ProcessPoolExecutor(max_workers=workers, mp_context=self.context)
+
+    def run(self, chunk):
+        """Results of create_derivatives_chunk(chunk); raises BrokenProcessPool if a worker died"""
+        executor = self.executor
+        if executor is None:
+            return create_derivatives_chunk(chunk)
+        try:
+            return executor.submit(create_derivatives_chunk, chunk).result()
+        except BrokenProcessPool:
+            with self.lock:
+                if self.executor is executor:
+                    executor.shutdown(wait=False)
+                    self.executor = self._executor(self.workers)
+            raise
+
+    def run_isolated(self, chunk):
+        """Run a chunk in a single-process pool of its own; a crash only fails that chunk"""
+        with self._executor(1) as executor:
+            try:
+                return executor.submit(create_derivatives_chunk, chunk).result()
+            except BrokenProcessPool:
+                for img_path, _ in chunk:
+                    logger.error(f"Could not create derivatives for {img_path.name}: worker process crashed")
+                return [(img_path, False, 0) for img_path, _ in chunk]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class FolderJob:
+    """One camera folder on its way through the pipeline"""
+
+    __slots__ = ('folder', 'name', 'serial_id', 'camera', 'from_ftp', 'manifest', 'source_manifest',
+                 'dest_path', 'batch_bytes', 'sizes', 'pending', 'created', 'failed', 'complete', 'bytes_read',
+                 'started', 'transfer', 'lock')
+
+    def __init__(self, folder, serial_id, camera, from_ftp):
+        self.folder = Path(folder)
+        self.name = self.folder.name
+        self.serial_id = serial_id
+        self.camera = camera
+        self.from_ftp = from_ftp
+        self.manifest = None
+        self.source_manifest = None  # the FTP folder's manifest, once the folder is moved
+        self.dest_path = None
+        self.batch_bytes = 0
+        self.sizes = {}  # image path -> derivative sizes being created
+        self.pending = 0  # cpu or copy tasks of this folder still running
+        self.created = 0
+        self.failed = 0
+        self.complete = 0  # images whose derivative ladder was already complete
+        self.bytes_read = 0
+        self.started = None
+        self.transfer = {'files': 0, 'bytes': 0, 'methods': {}, 'failed': [], 'seconds': 0.0}
+        self.lock = threading.Lock()
+
+    @property
+    def key(self):
+        return self.camera['device_id']
+
+
+class FolderPipeline:
+    """
+    Runs the camera folders of one run concurrently on a Scheduler:
+
+        prepare      scan (FTP folders: clean names, timestamp renames), mirror check
+        cpu          derivative ladder, DERIVATIVE_CHUNKSIZE images per task
+        copy:<disk>  FTP folders only: move to the destination disk, COPY_SLICE_FILES per task
+        db           single writer: snapshot rows (batched by SnapshotLoader), then ingest state
+
+    A recent folder sharing its name with an FTP folder waits until that FTP folder
+    is done, since the move may be going into it.
+    """
+
+    def __init__(self, camera_dict, ingest_state=None):
+        self.camera_dict = camera_dict
+        self.ingest_state = ingest_state
+        self.scheduler = Scheduler({'prepare': PREPARE_THREADS, 'cpu': max(1, DERIVATIVE_WORKERS),
+                                    'copy': COPY_STREAMS_PER_DISK, 'db': 1})
+        self.pool = DerivativePool(DERIVATIVE_WORKERS)
+        self.placement = PlacementEngine()
+        self.loader = SnapshotLoader()
+        self.unsaved = []
+        self.deferred = {}  # FTP folder name -> recent folders waiting for it
+        self.lock = threading.Lock()
+        self.stats = {'processed': 0, 'moved': 0, 'settled': 0}
+        # Derivative throughput of the whole run
+        self.derivatives = {'images': 0, 'done': 0, 'failed': 0, 'bytes': 0}
+        self.derive_started = self.derive_ended = None
+        self.last_progress = 0.0
+
+    def _submit(self, stage, job, step, *args):
+        self.scheduler.submit(stage, job.key, self._guarded, job, step, args)
+
+    def _guarded(self, job, step, args):
+        try:
+            step(job, *args)
+        except Exception as e:
+            logger.error(f"Error in {step.__name__.strip('_')} for '{job.name}': {e}", exc_info=True)
+            self._finish(job)
+
+    def add_ftp_folder(self, folder, serial_id):
+        logger.info(f"Queueing '{folder.name}' from FTP")
+        self._submit('prepare', FolderJob(folder, serial_id, self.camera_dict[serial_id], True), self._prepare)
+
+    def add_folder(self, folder, serial_id):
+        """Queue a folder already on a primary disk, unless it is settled"""
+        if self.ingest_state is not None and self.ingest_state.is_settled(folder):
+            logger.debug(f"Skipping '{folder.name}' - unchanged and fully ingested")
+            with self.lock:
+                self.stats['settled'] += 1
+            return
+        logger.info(f"Queueing '{folder.name}' for post-processing")
+        self._submit('prepare', FolderJob(folder, serial_id, self.camera_dict[serial_id], False), self._prepare)
+
+    def defer(self, ftp_name, folder, serial_id):
+        """Post-process folder once the FTP folder named ftp_name is done"""
+        self.deferred.setdefault(ftp_name, []).append((folder, serial_id))
+
+    def _prepare(self, job):
+        if job.from_ftp:
+            job.manifest = preprocess_folder(job.folder, job.serial_id)
+        else:
+            job.manifest = scan_folder(job.folder, self.ingest_state)
+            logger.info(f"'{job.name}': listed {job.manifest.listed_dirs} of {len(job.manifest.dir_mtimes)} "
+                        f"folder(s), {len(job.manifest.changed)} new or changed file(s)")
+            mark_mirrored(job.manifest)
+
+        jobs = plan_derivatives(job.manifest)
+        job.complete = len(job.manifest.images()) - len(jobs)
+        if not jobs:
+            self._derived(job)
+            return
+        job.sizes = dict(jobs)
+        job.started = time.perf_counter()
+        with self.lock:
+            self.derivatives['images'] += len(jobs)
+            if self.derive_started is None:
+                self.derive_started = self.last_progress = job.started
+        chunks = [jobs[i:i + DERIVATIVE_CHUNKSIZE] for i in range(0, len(jobs), DERIVATIVE_CHUNKSIZE)]
+        job.pending = len(chunks)
+        for chunk in chunks:
+            self._submit('cpu', job, self._derive, chunk)
+
+    def _derive(self, job, chunk):
+        try:
+            try:
+                results = self.pool.run(chunk)
+            except BrokenProcessPool:
+                if len(chunk) > 1:
+                    logger.warning(f"Derivative worker crashed, retrying {len(chunk)} image(s) of '{job.name}' "
+                                   f"one at a time")
+                    with job.lock:
+                        job.pending += len(chunk) - 1
+                    for single in chunk:
+                        self._submit('cpu', job, self._derive, [single])
+                    return
+                results = self.pool.run_isolated(chunk)
+        except Exception as e:
+            # Only this chunk fails; the folder goes on once its other chunks are done
+            logger.error(f"Error creating derivatives for '{job.name}': {e}", exc_info=True)
+            results = [(img_path, False, 0) for img_path, _ in chunk]
+
+        with job.lock:
+            job.pending -= 1
+            done = job.pending == 0
+            for img_path, success, size in results:
+                job.bytes_read += size
+                if success:
+                    try:
+                        record_derivatives(job.manifest, img_path, job.sizes[img_path])
+                    except Exception as e:
+                        logger.error(f"Error recording derivatives of {img_path.name}: {e}")
+                        success = False
+                if success:
+                    job.created += 1
+                else:
+                    job.failed += 1
+        self._progress(results)
+        if done:
+            self._derived(job)
+
+    def _progress(self, results):
+        """Count finished images towards the run's throughput, logging it every PROGRESS_INTERVAL seconds"""
+        now = time.perf_counter()
+        with self.lock:
+            totals = self.derivatives
+            totals['done'] += len(results)
+            totals['failed'] += sum(1 for _, success, _ in results if not success)
+            totals['bytes'] += sum(size for _, _, size in results)
+            self.derive_ended = now
+            if now - self.last_progress < PROGRESS_INTERVAL:
+                return
+            self.last_progress = now
+            elapsed = now - self.derive_started
+            done, images, mb_read = totals['done'], totals['images'], totals['bytes'] / 1024 ** 2
+        logger.info(f"Derivatives: {done}/{images} images ({done / elapsed:.1f} images/sec, "
+                    f"{mb_read / elapsed:.1f} MB/sec)")
+
+    def _derived(self, job):
+        if job.sizes:
+            elapsed = max(time.perf_counter() - job.started, 1e-6)
+            images = len(job.sizes)
+            logger.info(f"'{job.name}': created derivatives for {job.created} images in {elapsed:.1f}s "
+                        f"({images / elapsed:.1f} images/sec, {job.bytes_read / elapsed / 1024 ** 2:.1f} MB/sec, "
+                        f"{job.failed} failed)")
+        sizes = ', '.join(f"{w}x{h}" for w, h in DERIVATIVE_SIZES)
+        logger.info(f"'{job.name}': derivatives ({sizes}): {job.complete + job.created} images complete "
+                    f"({job.created} newly created)")
+        if not job.from_ftp:
+            self._submit('db', job, self._record)
+            return
+
+        files = list(job.manifest.files)
+        if not files:
+            remove_empty_dirs(job.folder)
+            self._finish(job)
+            return
+        # The whole folder is one batch for placement; its bytes count as queued on the disk until moved
+        batch_bytes = job.manifest.total_size()
+        timestamps = [entry.timestamp for entry in job.manifest.files.values() if entry.timestamp is not None]
+        dest_base = self.placement.place(job.name, batch_bytes, len(files), min(timestamps, default=None))
+        job.dest_path, job.batch_bytes = dest_base / job.name, batch_bytes
+        job.source_manifest = job.manifest
+        logger.info(f"Moving '{job.name}' to {job.dest_path}")
+        slices = [files[i:i + COPY_SLICE_FILES] for i in range(0, len(files), COPY_SLICE_FILES)]
+        job.pending = len(slices)
+        for files_slice in slices:
+            self._submit(f"copy:{dest_base.parent}", job, self._copy, files_slice)
+
+    def _copy(self, job, files_slice):
+        # Files move one by one; each source file is deleted once its copy is verified
+        try:
+            result = transfer_folder(job.folder, job.dest_path, files=files_slice, remove_empty=False)
+        except Exception as e:
+            # Only this slice fails; its files stay at the source and the folder goes on once the other slices are done
+            logger.error(f"Error moving {len(files_slice)} file(s) of '{job.name}': {e}", exc_info=True)
+            result = {'files': 0, 'bytes': 0, 'methods': {}, 'failed': list(files_slice), 'seconds': 0.0}
+        with job.lock:
+            for key in ('files', 'bytes', 'seconds'):
+                job.transfer[key] += result[key]
+            for method, count in result['methods'].items():
+                job.transfer['methods'][method] = job.transfer['methods'].get(method, 0) + count
+            job.transfer['failed'].extend(result['failed'])
+            job.pending -= 1
+            done = job.pending == 0
+        if done:
+            self._moved(job)
+
+    def _release(self, job):
+        """Stop counting the job's batch as queued on its destination disk (once)"""
+        with job.lock:
+            batch_bytes, job.batch_bytes = job.batch_bytes, 0
+        if batch_bytes:
+            self.placement.done(job.dest_path.parent, batch_bytes)
+
+    def _moved(self, job):
+        self._release(job)
+        result = job.transfer
+        methods = ', '.join(f"{count} {method}" for method, count in result['methods'].items())
+        logger.info(f"Moved {result['files']} files of '{job.name}' ({result['bytes'] / 1024 ** 2:.1f} MB copied"
+                    f"{', ' + methods if methods else ''}) in {result['seconds']:.1f}s")
+        if result['failed']:
+            logger.error(f"{len(result['failed'])} file(s) of '{job.name}' could not be moved - "
+                         f"kept in {job.folder}, the next run resumes them")
+        else:
+            remove_empty_dirs(job.folder)
+        if result['files']:
+            with self.lock:
+                self.stats['moved'] += 1
+        if not job.dest_path.exists():
+            self._finish(job)
+            return
+
+        job.manifest = scan_folder(job.dest_path, self.ingest_state)
+        mark_copied(job.manifest, job.source_manifest)
+        mark_mirrored(job.manifest)
+        job.folder = job.dest_path
+        self._submit('db', job, self._record)
+
+    def _record(self, job):
+        try:
+            inserted = insert_snapshots_to_db(job.folder, job.camera, job.manifest, self.loader)
+        except Exception as e:
+            logger.error(f"Error inserting snapshots for '{job.name}': {e}", exc_info=True)
+            inserted = 0
+        if inserted or job.created or job.transfer['files']:
+            with self.lock:
+                self.stats['processed'] += 1
+        # Everything in a folder on a primary disk, derivatives included, is copied
+        mark_copied(job.manifest)
+        self.unsaved.append(job)
+        # Rows are batched across folders while more are waiting for the writer
+        if self.loader.full or not self.scheduler.stage('db').pending():
+            self.flush()
+
+    def flush(self):
+        """Write the buffered snapshot rows, then save the ingest state of their folders"""
+        try:
+            self.loader.flush()
+        except Exception as e:
+            logger.error(f"Error inserting snapshots: {e}", exc_info=True)
+        jobs, self.unsaved = self.unsaved, []
+        for job in jobs:
+            if self.ingest_state is not None:
+                try:
+                    self.ingest_state.save(job.manifest)
+                except Exception as e:
+                    logger.error(f"Error saving ingest state for '{job.name}': {e}", exc_info=True)
+            self._finish(job)
+
+    def _finish(self, job):
+        if not job.from_ftp:
+            return
+        self._release(job)
+        with self.lock:
+            waiting = self.deferred.pop(job.name, [])
+        for folder, serial_id in waiting:
+            if folder != job.dest_path:
+                self.add_folder(folder, serial_id)
+
+    def run(self):
+        """Wait for every queued folder; returns the stats dict"""
+        try:
+            # A final flush can queue folders deferred behind FTP folders, so go until nothing is left
+            while True:
+                self.scheduler.join()
+                if not self.unsaved:
+                    break
+                self.flush()
+        finally:
+            self.scheduler.close()
+            self.pool.shutdown()
+            self.placement.close()
+        self.scheduler.log_summary()
+        totals = self.derivatives
+        if totals['done']:
+            elapsed = max(self.derive_ended - self.derive_started, 1e-6)
+            logger.info(f"Created derivatives for {totals['done'] - totals['failed']} images in {elapsed:.1f}s with "
+                        f"{self.pool.workers} process(es) ({totals['done'] / elapsed:.1f} images/sec, "
+                        f"{totals['bytes'] / elapsed / 1024 ** 2:.1f} MB/sec, {totals['failed']} failed)")
+        logger.info(f"Placement: {self.placement.info()}")
+        return self.stats
+
 
 def process_ftp_folders():
     logger.info("=" * 60)
@@ -531,128 +905,78 @@ def process_ftp_folders():
     camera_dict = get_camera_dict()
     valid_serial_ids = set(camera_dict.keys())
 
-    processed_count = 0
+    ingest_state = open_ingest_state()
+    pipeline = FolderPipeline(camera_dict, ingest_state)
 
-    # Process folders from FTP location
+    # Folders from the FTP location
+    ftp_folders = []
     if source_base.exists():
         logger.info(f"Checking FTP location: {source_base}")
-        ftp_folders = [f for f in source_base.iterdir() if f.is_dir()]
-        logger.info(f"Found {len(ftp_folders)} folders in FTP location")
-
-        for folder in ftp_folders:
-            folder_name = folder.name
-            serial_id = parse_folder_name(folder_name)
+        for folder in (f for f in source_base.iterdir() if f.is_dir()):
+            serial_id = parse_folder_name(folder.name)
 
             if not serial_id:
-                logger.warning(f"Skipping '{folder_name}' - invalid format")
+                logger.warning(f"Skipping '{folder.name}' - invalid format")
                 continue
 
             if serial_id not in valid_serial_ids:
-                logger.warning(f"Skipping '{folder_name}' - serial_id '{serial_id}' not in database")
-                continue
-
-            logger.info(f"Processing '{folder_name}' from FTP")
-
-            # Preprocess: clean names and rename images
-            try:
-                preprocess_folder(folder, serial_id)
-            except Exception as e:
-                logger.error(f"Error during preprocessing '{folder_name}': {e}", exc_info=True)
+                logger.warning(f"Skipping '{folder.name}' - serial_id '{serial_id}' not in database")
                 continue
 
-            # Create thumbnails before copying
-            try:
-                create_thumbnails_for_folder(folder)
-            except Exception as e:
-                logger.error(f"Error creating thumbnails for '{folder_name}': {e}", exc_info=True)
-                continue
-
-            # Select destination disk based on usage
-            dest_base = select_destination_disk()
-            dest_path = dest_base / folder_name
-
-            logger.info(f"Copying to {dest_path}")
-
-            try:
-                shutil.copytree(folder, dest_path, dirs_exist_ok=True)
-
-                # Verify copy
-                if verify_copy(folder, dest_path):
-                    logger.info(f"Copy verified. Deleting source folder: {folder}")
-                    shutil.rmtree(folder)
-                    logger.info(f"Successfully processed '{folder_name}'")
-                    processed_count += 1
-                else:
-                    logger.error(f"Copy verification failed for '{folder_name}' - source NOT deleted")
-
-            except Exception as e:
-                logger.error(f"Error copying '{folder_name}': {e}", exc_info=True)
+            ftp_folders.append((folder, serial_id))
+        logger.info(f"Found {len(ftp_folders)} folders to move from FTP location")
     else:
         logger.warning(f"FTP location does not exist: {source_base}")
 
-    # Process today's folders that might need post-processing
-    logger.info("=" * 60)
-    logger.info("Post-processing phase")
-    logger.info("=" * 60)
-
-    todays_folders = get_todays_folders()
-
-    total_snapshots_inserted = 0
-
-    for folder in todays_folders:
-        folder_name = folder.name
-        serial_id = parse_folder_name(folder_name)
+    # Today's folders that might need post-processing
+    ftp_names = {folder.name for folder, _ in ftp_folders}
+    recent_folders = []
+    for folder in get_todays_folders():
+        serial_id = parse_folder_name(folder.name)
 
         if not serial_id:
-            logger.warning(f"Skipping '{folder_name}' - invalid format")
+            logger.warning(f"Skipping '{folder.name}' - invalid format")
             continue
 
         if serial_id not in camera_dict:
-            logger.warning(f"Skipping '{folder_name}' - serial_id not in database")
+            logger.warning(f"Skipping '{folder.name}' - serial_id not in database")
             continue
 
-        logger.info(f"Post-processing '{folder_name}'")
-
-        # Check if thumbnails need to be created
-        try:
-            created = create_thumbnails_for_folder(folder)
-            if created > 0:
-                processed_count += 1
-        except Exception as e:
-            logger.error(f"Error processing thumbnails for '{folder_name}': {e}", exc_info=True)
-
-        # Insert snapshots to database
-        try:
-            camera_info = camera_dict[serial_id]
-            inserted = insert_snapshots_to_db(folder, camera_info)
-            total_snapshots_inserted += inserted
-            if inserted > 0:
-                processed_count += 1
-        except Exception as e:
-            logger.error(f"Error inserting snapshots for '{folder_name}': {e}", exc_info=True)
+        if folder.name in ftp_names:
+            pipeline.defer(folder.name, folder, serial_id)
+        else:
+            recent_folders.append((folder, serial_id))
 
-    # Update preset numbers after all snapshots are inserted
     logger.info("=" * 60)
-    logger.info("Updating preset numbers")
+    logger.info(f"Processing {len(ftp_folders)} FTP folder(s) and {len(recent_folders)} recent folder(s)")
     logger.info("=" * 60)
 
-    try:
-        update_preset_numbers()
-    except Exception as e:
-        logger.error(f"Error updating preset numbers: {e}", exc_info=True)
+    for folder, serial_id in ftp_folders:
+        pipeline.add_ftp_folder(folder, serial_id)
+    for folder, serial_id in recent_folders:
+        pipeline.add_folder(folder, serial_id)
+    stats = pipeline.run()
+
+    if stats['settled']:
+        logger.info(f"Skipped {stats['settled']} folder(s) with no changes since the last run")
 
     # Start rsync after processing all folders
     logger.info("=" * 60)
     logger.info("Summary")
     logger.info("=" * 60)
 
+    processed_count = stats['processed'] or stats['moved']
     if processed_count > 0:
-        logger.info(f"Processed {processed_count} folder(s)")
-        logger.info(f"Inserted {total_snapshots_inserted} total snapshots to database")
+        logger.info(f"Processed {stats['processed']} folder(s) ({stats['moved']} moved from FTP)")
+        logger.info(f"Inserted {pipeline.loader.stats['rows']} total snapshots to database")
         start_rsync()
     else:
         logger.info("No folders were processed. Skipping rsync.")
 
+    if ingest_state is not None:
+        ingest_state.close()
+    log_pool_stats()
+
 
 # Usage
 if __name__ == "__main__":
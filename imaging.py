@@ -0,0 +1,182 @@
+import os
+import math
+from io import BytesIO
+from pathlib import Path
+from PIL import Image, features
+
+# Resize quality policy:
+# - 'lanczos': single LANCZOS resample to the final size (best quality)
+# - 'fast': integer reduce() close to the final size, then BICUBIC (cheaper)
+RESIZE_POLICIES = ('lanczos', 'fast')
+RESIZE_POLICY = os.environ.get('RESIZE_POLICY', 'lanczos')
+
+# Let libjpeg decode at 1/2, 1/4 or 1/8 scale when the target is small enough
+JPEG_DRAFT_DECODE = os.environ.get('JPEG_DRAFT_DECODE', '1') != '0'
+
+# Modern formats offered to clients that list them in Accept, in preference order
+# (AVIF only when this Pillow build can encode it)
+NEGOTIABLE_FORMATS = tuple(fmt for fmt in ('WEBP', 'AVIF') if features.check(fmt.lower()))
+
+FORMAT_MIMETYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+
+# Derivative ladder built at ingest, shared by image_processor.py and server.py
+# The 150x84 size keeps its historical 'thumbnail' folder next to the original;
+# the others go to derivatives/WIDTHxHEIGHT
+THUMBNAIL_SIZE = (150, 84)
+DERIVATIVE_DIRS = ('thumbnail', 'derivatives')
+
+
+def parse_size_list(text):
+    """Parse '150x84,640x480' into [(150, 84), (640, 480)]; bad entries are skipped"""
+    sizes = []
+    for item in text.split(','):
+        try:
+            width, height = (int(v) for v in item.strip().lower().split('x'))
+        except ValueError:
+            continue
+        if width > 0 and height > 0:
+            sizes.append((width, height))
+    return sizes
+
+
+DERIVATIVE_SIZES = tuple(sorted(set(parse_size_list(
+    os.environ.get('DERIVATIVE_SIZES', '150x84,640x480,1280x720'))), key=lambda s: s[0] * s[1]))
+
+
+def fit_within(size, target_size):
+    """
+    Size an image will have after fitting inside target_size
+    Preserves aspect ratio and never upscales (same rounding as Image.thumbnail)
+    """
+    width, height = size
+    x, y = target_size
+    if x >= width and y >= height:
+        return width, height
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
+def draft_for_size(img, final_size, enabled=None):
+    """
+    Ask the JPEG decoder for the smallest DCT scale (1/2, 1/4, 1/8) still at
+    or above final_size. Must be called before the image data is loaded.
+    Returns the source box to pass to resample_to, or None
+    """
+    if enabled is None:
+        enabled = JPEG_DRAFT_DECODE
+    if not enabled or img.format != 'JPEG' or final_size == img.size:
+        return None
+
+    result = img.draft(None, final_size)
+    return result[1] if result is not None else None
+
+
+def resample_to(img, final_size, policy=None, box=None):
+    """
+    Shrink img to exactly final_size using the configured quality policy
+    Returns a new image (or img itself if no resize is needed)
+    """
+    policy = policy or RESIZE_POLICY
+    if policy not in RESIZE_POLICIES:
+        raise ValueError(f"Unknown resize policy: {policy}")
+
+    if final_size == img.size and box is None:
+        return img
+
+    if policy == 'fast':
+        factor = min(img.width // final_size[0], img.height // final_size[1])
+        if factor >= 2:
+            img = img.reduce(factor, box=tuple(map(int, box)) if box else None)
+            box = None
+        return img.resize(final_size, Image.Resampling.BICUBIC, box=box)
+
+    return img.resize(final_size, Image.Resampling.LANCZOS, box=box)
+
+
+def shrink_image(img, target_size, policy=None, convert=None):
+    """
+    Decode and shrink an opened (not yet loaded) image to fit inside target_size
+    JPEGs are decoded at a reduced DCT scale first; convert(img) may adjust the
+    mode after decoding and before resampling
+    """
+    final_size = fit_within(img.size, target_size)
+    box = draft_for_size(img, final_size)
+    if convert:
+        img = convert(img)
+    return resample_to(img, final_size, policy, box)
+
+
+def render_ladder(img, sizes, policy=None):
+    """
+    Shrink an opened (not yet loaded) image to every size in sizes with one decode
+    The JPEG draft scale is chosen for the largest output, and every
+    derivative is resampled from that single decoded image
+    Returns dict {target_size: image}
+    """
+    finals = {size: fit_within(img.size, size) for size in sizes}
+    largest = max(finals.values(), key=lambda s: s[0] * s[1])
+    box = draft_for_size(img, largest)
+    return {size: resample_to(img, final, policy, box) for size, final in finals.items()}
+
+
+def derivative_path(image_path, size):
+    """Where the pre-built derivative of image_path for size is stored"""
+    image_path = Path(image_path)
+    if tuple(size) == THUMBNAIL_SIZE:
+        return image_path.parent / 'thumbnail' / image_path.name
+    return image_path.parent / 'derivatives' / f"{size[0]}x{size[1]}" / image_path.name
+
+
+def is_derivative(path):
+    """True for files (or folders) inside a derivative folder"""
+    return any(part in DERIVATIVE_DIRS for part in Path(path).parts)
+
+
+def flatten_to_rgb(img):
+    """Convert image to RGB, compositing transparency onto a white background"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def encode_image(img, output_format):
+    """Encode img as JPEG, PNG, WEBP or AVIF and return the bytes"""
+    img_io = BytesIO()
+    if output_format == 'PNG':
+        img.save(img_io, 'PNG', optimize=True)
+    elif output_format == 'WEBP':
+        img.save(img_io, 'WEBP', quality=80, method=4)
+    elif output_format == 'AVIF':
+        img.save(img_io, 'AVIF', quality=60, speed=8)
+    else:
+        img.save(img_io, 'JPEG', quality=85, optimize=True)
+    return img_io.getvalue()
+
+
+def render_resized(image_path, target_size, output_format, policy=None):
+    """
+    Open, shrink and encode one image
+    Module-level so it can run in a resize worker process
+    """
+    with Image.open(image_path) as img:
+        img = shrink_image(img, target_size, policy, convert=flatten_to_rgb)
+        return encode_image(img, output_format)
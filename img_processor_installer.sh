@@ -12,6 +12,53 @@ CURRENT_DIR=$(pwd)
 echo "Working directory: $CURRENT_DIR"
 echo ""
 
+# --daemon: install the streaming ingest daemon (inotify) instead of the 30-minute timer
+if [ "$1" == "--daemon" ]; then
+    echo "Installing streaming ingest daemon..."
+    sudo tee /etc/systemd/system/image-processor-daemon.service > /dev/null << 'EOF'
+[Unit]
+Description=Image Processor Streaming Ingest
+After=network.target
+
+[Service]
+Type=simple
+User=root
+WorkingDirectory=/home/ubuntu/camera-sensor-media
+ExecStart=/home/ubuntu/camera-sensor-media/myenv/bin/python /home/ubuntu/camera-sensor-media/ingest_daemon.py
+Restart=always
+RestartSec=5
+KillSignal=SIGTERM
+TimeoutStopSec=60
+StandardOutput=append:/var/log/image_processor.log
+StandardError=append:/var/log/image_processor_error.log
+
+[Install]
+WantedBy=multi-user.target
+EOF
+    if [ $? -ne 0 ]; then
+        echo "✗ Failed to install daemon service file"
+        exit 1
+    fi
+
+    # The timer's batch run would move the same FTP folders, so it is turned off
+    sudo systemctl disable --now image-processor.timer 2>/dev/null
+    sudo systemctl daemon-reload
+    sudo systemctl enable --now image-processor-daemon.service
+    if [ $? -eq 0 ]; then
+        echo "✓ Streaming ingest daemon installed and started (timer disabled)"
+    else
+        echo "✗ Failed to start image-processor-daemon.service"
+        exit 1
+    fi
+    echo ""
+    echo "View logs (live):      sudo journalctl -u image-processor-daemon.service -f"
+    echo "Back to the timer:     sudo systemctl disable --now image-processor-daemon.service && $0"
+    exit 0
+fi
+
+# Switching back from the streaming daemon to the timer
+sudo systemctl disable --now image-processor-daemon.service 2>/dev/null
+
 # Step 1: Create service file
 echo "Step 1: Creating service file..."
 cat > /tmp/image-processor.service << 'EOF'
@@ -0,0 +1,417 @@
+"""
+Streaming ingest daemon
+
+Watches the FTP folder with inotify. Each upload goes through the pipeline
+as soon as it is complete: closed for writing (or moved in) and then left
+unchanged for INGEST_QUIESCENCE seconds. The stages run in their own
+threads and are joined by bounded queues, so a slow stage holds the ones
+before it back instead of piling work up in memory:
+
+    watcher -> prepare (timestamp rename) -> derivatives (N threads)
+            -> move to disk1/disk3 -> database writer (batched inserts)
+
+On start, and whenever the kernel reports lost events (queue overflow),
+the whole FTP folder is rescanned, so files uploaded while the daemon was
+down are picked up too.
+
+Usage:
+    python ingest_daemon.py [--source /mnt/disk5/ftpdata/media]
+"""
+import os
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+from pathlib import Path
+from inotify import (Inotify, IN_CLOSE_WRITE, IN_MOVED_TO, IN_MOVED_FROM, IN_MODIFY, IN_CREATE,
+                     IN_DELETE, IN_Q_OVERFLOW, IN_ISDIR)
+from imaging import derivative_path, is_derivative, DERIVATIVE_SIZES
+from transfer import transfer_file
+from placement import PlacementEngine
+import image_processor as ip
+
+logger = logging.getLogger(__name__)
+
+SOURCE_BASE = os.environ.get('INGEST_SOURCE', '/mnt/disk5/ftpdata/media')
+# Seconds an upload must stay unchanged after close before it is processed
+QUIESCENCE_SECONDS = float(os.environ.get('INGEST_QUIESCENCE', 5))
+# Items each stage queue holds before the stage feeding it waits
+QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 64))
+DERIVATIVE_THREADS = int(os.environ.get('INGEST_DERIVATIVE_THREADS', ip.DERIVATIVE_WORKERS))
+# The database writer inserts up to this many rows at once, waiting at most INSERT_BATCH_SECONDS
+INSERT_BATCH_SIZE = 500
+INSERT_BATCH_SECONDS = 1.0
+# Seconds between camera list refreshes when an unknown serial_id shows up
+CAMERA_REFRESH_SECONDS = 300
+# Seconds a camera's destination disk is kept before it is placed again
+PLACEMENT_REFRESH_SECONDS = 300
+# rsync runs at most this often, and only after new snapshots
+RSYNC_INTERVAL = int(os.environ.get('INGEST_RSYNC_INTERVAL', 1800))
+# Seconds between status lines
+STATUS_INTERVAL = 60
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_MODIFY | IN_CREATE | IN_DELETE
+
+
+class IngestItem:
+    """One uploaded image on its way through the pipeline"""
+
+    __slots__ = ('path', 'ready_at', 'camera', 'timestamp', 'area', 'dest_path', 'thumbnail')
+
+    def __init__(self, path, ready_at):
+        self.path = path
+        self.ready_at = ready_at
+        self.camera = None
+        self.timestamp = None
+        self.area = None
+        self.dest_path = None
+        self.thumbnail = False
+
+
+class IngestDaemon:
+    def __init__(self, source_base=SOURCE_BASE, quiescence=QUIESCENCE_SECONDS):
+        self.source_base = Path(source_base)
+        self.quiescence = quiescence
+        self.stop_event = threading.Event()
+
+        self.prepare_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.derivative_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.move_queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.db_queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+        self.pending = {}  # path -> (last event time, size then)
+        self.in_flight = set()  # source paths currently in the pipeline (incl. their renamed names)
+        self.cameras = {}
+        self.cameras_loaded = 0
+        self.destinations = {}  # camera folder name -> (destination folder, when it was placed)
+        self.placement = PlacementEngine()
+        self.skipped_folders = set()
+
+        self.lock = threading.Lock()
+        self.stats = {'prepared': 0, 'derived': 0, 'moved': 0, 'inserted': 0, 'failed': 0}
+        self.latencies = []
+        self.last_rsync = time.monotonic()
+        self.unmirrored = 0  # files moved since the last rsync
+
+    # Watcher
+
+    def _track(self, path, event_time):
+        path = Path(path)
+        if path.name.startswith('.') or path.suffix.lower() not in ip.IMAGE_EXTENSIONS:
+            return
+        try:
+            relative = path.relative_to(self.source_base)
+        except ValueError:
+            return
+        if len(relative.parts) < 2 or is_derivative(relative.parent) or path in self.in_flight:
+            return
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        self.pending[path] = (event_time, size)
+
+    def _watch_tree(self, root, watcher):
+        """Watch root and every folder below it; files already there become pending"""
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not is_derivative(d)]
+            try:
+                watcher.add_watch(dirpath, WATCH_MASK)
+            except OSError as e:
+                logger.warning(f"Cannot watch {dirpath}: {e}")
+                continue
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    # Files that have been quiet long enough are ready on the next tick
+                    self._track(path, os.stat(path).st_mtime - time.time() + time.monotonic())
+                except OSError:
+                    pass
+
+    def _handle_events(self, watcher, events):
+        now = time.monotonic()
+        for dir_path, name, mask, _ in events:
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflowed, rescanning the FTP folder")
+                self._watch_tree(self.source_base, watcher)
+                continue
+            if dir_path is None or not name:
+                continue
+            path = os.path.join(dir_path, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not is_derivative(name):
+                    self._watch_tree(path, watcher)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._track(path, now)
+            elif mask & IN_MODIFY:
+                if Path(path) in self.pending:
+                    self._track(path, now)  # still being written
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.pending.pop(Path(path), None)
+
+    def _release_ready(self):
+        """Hand quiet files to the pipeline, oldest first, while the first queue has room"""
+        now = time.monotonic()
+        for path, (event_time, size) in sorted(self.pending.items(), key=lambda item: item[1][0]):
+            if now - event_time < self.quiescence:
+                break
+            try:
+                current = path.stat().st_size
+            except OSError:
+                del self.pending[path]
+                continue
+            if current != size:
+                self.pending[path] = (now, current)
+                continue
+            with self.lock:
+                self.in_flight.add(path)
+            try:
+                self.prepare_queue.put_nowait(IngestItem(path, now))
+            except queue.Full:
+                with self.lock:
+                    self.in_flight.discard(path)
+                break
+            del self.pending[path]
+
+    def watch(self):
+        watcher = Inotify()
+        self._watch_tree(self.source_base, watcher)
+        logger.info(f"Watching {self.source_base} ({len(watcher.watches)} folders, "
+                    f"{len(self.pending)} file(s) already waiting)")
+        last_status = time.monotonic()
+        try:
+            while not self.stop_event.is_set():
+                self._handle_events(watcher, watcher.read_events(timeout=1.0))
+                self._release_ready()
+                now = time.monotonic()
+                if now - last_status >= STATUS_INTERVAL:
+                    last_status = now
+                    self.log_status()
+                if self.unmirrored and now - self.last_rsync >= RSYNC_INTERVAL:
+                    self.last_rsync = now
+                    self.unmirrored = 0
+                    ip.start_rsync()
+        finally:
+            watcher.close()
+            self.prepare_queue.put(None)
+
+    # Stages
+
+    def _camera_for(self, serial_id):
+        camera = self.cameras.get(serial_id)
+        if camera is None and time.monotonic() - self.cameras_loaded >= CAMERA_REFRESH_SECONDS:
+            self.cameras = ip.get_camera_dict()
+            self.cameras_loaded = time.monotonic()
+            camera = self.cameras.get(serial_id)
+        return camera
+
+    def _destination_for(self, folder_name, file_bytes, timestamp):
+        """
+        Destination folder of a camera (see placement.py), placed again every
+        PLACEMENT_REFRESH_SECONDS so a camera leaves a disk once it fills up
+        """
+        dest, placed_at = self.destinations.get(folder_name, (None, 0.0))
+        if dest is None or time.monotonic() - placed_at >= PLACEMENT_REFRESH_SECONDS:
+            media_root = self.placement.place(folder_name, file_bytes, 1, timestamp)
+            # Files arrive one at a time, so nothing stays queued on the disk
+            self.placement.done(media_root, file_bytes)
+            dest = media_root / folder_name
+            self.destinations[folder_name] = (dest, time.monotonic())
+        return dest
+
+    def _prepare(self, item):
+        relative = item.path.relative_to(self.source_base)
+        folder_name = relative.parts[0]
+        serial_id = ip.parse_folder_name(folder_name)
+        item.camera = self._camera_for(serial_id) if serial_id else None
+        if item.camera is None:
+            if folder_name not in self.skipped_folders:
+                self.skipped_folders.add(folder_name)
+                logger.warning(f"Skipping '{folder_name}' - invalid format or serial_id not in database")
+            return False
+
+        if ip.is_millisecond_format(item.path.name):
+            item.timestamp = ip.get_timestamp_from_filename(item.path.name)
+        else:
+            item.timestamp = ip.get_image_timestamp(item.path)
+            if item.timestamp:
+                new_path = item.path.parent / f"{item.timestamp}{item.path.suffix}"
+                counter = 1
+                while new_path.exists():
+                    new_path = item.path.parent / f"{item.timestamp}_{counter}{item.path.suffix}"
+                    counter += 1
+                with self.lock:
+                    self.in_flight.add(new_path)  # the rename shows up as a new upload otherwise
+                item.path.rename(new_path)
+                self._release(item)
+                item.path = new_path
+            else:
+                logger.warning(f"Keeping original name: {item.path.name} (no timestamp found)")
+
+        # Subfolders are cleaned the same way preprocess_folder renames them
+        subfolders = [ip.clean_subfolder_name(part, serial_id) or part for part in relative.parts[1:-1]]
+        item.area = subfolders[0] if subfolders else 'unknown'
+        item.dest_path = self._destination_for(folder_name, item.path.stat().st_size,
+                                               item.timestamp).joinpath(*subfolders, item.path.name)
+        return True
+
+    def _move(self, item):
+        """Move the derivatives, then the original, into place; returns True once the original is there"""
+        for size in DERIVATIVE_SIZES:
+            source = derivative_path(item.path, size)
+            if source.exists():
+                transfer_file(source, derivative_path(item.dest_path, size))
+                try:
+                    source.parent.rmdir()  # only succeeds once the folder is empty
+                except OSError:
+                    pass
+        try:
+            (item.path.parent / 'derivatives').rmdir()
+        except OSError:
+            pass
+        transfer_file(item.path, item.dest_path)
+        item.thumbnail = ip.has_thumbnail(item.dest_path)
+        return True
+
+    def _release(self, item):
+        """Forget an item's source path once it has left it (renamed, moved or dropped)"""
+        with self.lock:
+            self.in_flight.discard(item.path)
+
+    def _count(self, stat, n=1):
+        with self.lock:
+            self.stats[stat] += n
+
+    def _stage(self, name, source, target, work, workers=1, downstream=1):
+        """
+        Threads running work(item) for items from source, passing the ones it accepts to target
+        Each thread stops at a None; the last one to stop sends a None to each downstream thread
+        """
+        running = [workers]
+
+        def run():
+            while True:
+                item = source.get()
+                if item is None:
+                    break
+                try:
+                    if work(item):
+                        self._count(name)
+                        target.put(item)
+                        continue
+                except Exception as e:
+                    self._count('failed')
+                    logger.error(f"Ingest stage '{name}' failed for {item.path}: {e}", exc_info=True)
+                self._release(item)  # dropped
+            with self.lock:
+                running[0] -= 1
+                last = running[0] == 0
+            if last:
+                for _ in range(downstream):
+                    target.put(None)
+
+        return [threading.Thread(target=run, name=f"ingest-{name}-{i}", daemon=True) for i in range(workers)]
+
+    def _write_batch(self, batch):
+        rows = [ip.snapshot_row(item.camera, item.dest_path, item.timestamp, item.area, item.thumbnail)
+                for item in batch if item.timestamp]
+        if rows:
+            inserted = ip.insert_snapshot_rows(rows, 'ingest_daemon')
+            self._count('inserted', inserted)
+        now = time.monotonic()
+        with self.lock:
+            self.latencies.extend(now - item.ready_at for item in batch)
+
+
+    def db_writer(self):
+        """Single database writer: collects moved items into batched inserts"""
+        finished = False
+        while not finished:
+            item = self.db_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + INSERT_BATCH_SECONDS
+            while len(batch) < INSERT_BATCH_SIZE:
+                try:
+                    item = self.db_queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                self._count('failed', len(batch))
+                logger.error(f"Error inserting {len(batch)} snapshot(s): {e}", exc_info=True)
+
+    def log_status(self):
+        with self.lock:
+            stats = dict(self.stats)
+            latencies = sorted(self.latencies)
+            self.latencies = []
+        latency = ''
+        if latencies:
+            latency = (f", ready->inserted p50 {latencies[len(latencies) // 2]:.1f}s "
+                       f"max {latencies[-1]:.1f}s")
+        queues = '/'.join(str(q.qsize()) for q in (self.prepare_queue, self.derivative_queue,
+                                                    self.move_queue, self.db_queue))
+        logger.info(f"Ingest: {len(self.pending)} waiting, queues {queues}, "
+                    + ', '.join(f"{k} {v}" for k, v in stats.items()) + latency)
+
+    def run(self):
+        self.cameras = ip.get_camera_dict()
+        self.cameras_loaded = time.monotonic()
+
+        def derive(item):
+            if not ip.create_derivatives(item.path):
+                logger.warning(f"Moving {item.path.name} without derivatives")
+            return True
+
+        def move(item):
+            self._move(item)
+            self._release(item)
+            self.unmirrored += 1
+            return True
+
+        threads = (self._stage('prepared', self.prepare_queue, self.derivative_queue, self._prepare,
+                               downstream=DERIVATIVE_THREADS)
+                   + self._stage('derived', self.derivative_queue, self.move_queue, derive,
+                                 workers=DERIVATIVE_THREADS)
+                   + self._stage('moved', self.move_queue, self.db_queue, move)
+                   + [threading.Thread(target=self.db_writer, name='ingest-db', daemon=True)])
+        for thread in threads:
+            thread.start()
+
+        logger.info(f"Ingest daemon started ({DERIVATIVE_THREADS} derivative thread(s), "
+                    f"queues of {QUEUE_SIZE}, quiescence {self.quiescence}s)")
+        try:
+            self.watch()
+        finally:
+            for thread in threads:
+                thread.join()
+            self.log_status()
+            self.placement.close()
+            ip.log_pool_stats()
+            logger.info("Ingest daemon stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default=SOURCE_BASE, help=f"FTP folder to watch (default: {SOURCE_BASE})")
+    parser.add_argument('--quiescence', type=float, default=QUIESCENCE_SECONDS,
+                        help=f"Seconds a closed upload must stay unchanged (default: {QUIESCENCE_SECONDS})")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.source, args.quiescence)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: daemon.stop_event.set())
+    daemon.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Persistent ingest state for the image processor (SQLite)
+
+Keeps, per camera folder, the folder manifest of the last run (every file
+with its size/mtime/inode and ingest status flags) and the mtime of every
+subfolder. The next run then:
+
+- skips a folder outright when nothing is pending and no subfolder mtime
+  changed (one stat per subfolder, no listing)
+- otherwise lists only the subfolders whose mtime changed, reusing the
+  stored entries for the rest (FolderManifest.scan(previous=...))
+
+so the work per run follows the number of new files, not the total.
+"""
+import os
+import time
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from folder_manifest import FolderManifest, ManifestEntry, STATUS_FLAGS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    inode INTEGER,
+    is_thumbnail INTEGER,
+    timestamp INTEGER,
+    area TEXT,
+    renamed INTEGER NOT NULL DEFAULT 0,
+    thumbnailed INTEGER NOT NULL DEFAULT 0,
+    copied INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    mirrored INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_folder ON dirs (folder);
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    files INTEGER NOT NULL,
+    pending INTEGER NOT NULL,
+    updated_at REAL
+);
+"""
+
+FILE_COLUMNS = ('path', 'size', 'mtime', 'inode', 'is_thumbnail', 'timestamp', 'area') + STATUS_FLAGS
+
+
+def is_pending(manifest, entry):
+    """True while an ingest stage still has work to do for this file"""
+    if not entry.copied or not entry.mirrored:
+        return True
+    if entry.is_thumbnail or entry.path.suffix.lower() not in manifest.image_extensions:
+        return False
+    return not entry.thumbnailed or (entry.timestamp is not None and not entry.inserted)
+
+
+class IngestState:
+    """
+    SQLite-backed per-folder manifests and ingest status
+    One connection per process, shared by the scheduler's threads under a lock
+    """
+
+    def __init__(self, path):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.stats = {'settled': 0, 'scanned': 0, 'saved_rows': 0}
+
+    def is_settled(self, folder_path):
+        """True if the folder has nothing pending and none of its subfolders changed"""
+        with self.lock:
+            folder = str(folder_path)
+            row = self.conn.execute('SELECT pending FROM folders WHERE path = ?', (folder,)).fetchone()
+            if row is None or row[0]:
+                return False
+            for path, mtime_ns in self.conn.execute('SELECT path, mtime_ns FROM dirs WHERE folder = ?', (folder,)):
+                try:
+                    if os.stat(path).st_mtime_ns != mtime_ns:
+                        return False
+                except OSError:
+                    return False
+            self.stats['settled'] += 1
+            return True
+
+    def load(self, folder_path, image_extensions, parse_timestamp):
+        """The folder's manifest as saved by the last run, or None if it was never saved"""
+        with self.lock:
+            folder = str(folder_path)
+            manifest = FolderManifest(folder_path, image_extensions, parse_timestamp)
+            manifest.dir_mtimes = dict(self.conn.execute(
+                'SELECT path, mtime_ns FROM dirs WHERE folder = ?', (folder,)))
+            if not manifest.dir_mtimes:
+                return None
+            manifest.dirs = [Path(path) for path in manifest.dir_mtimes if path != folder]
+
+            rows = self.conn.execute(f"SELECT {', '.join(FILE_COLUMNS)} FROM files WHERE folder = ?", (folder,))
+            for row in rows:
+                values = dict(zip(FILE_COLUMNS, row))
+                values['path'] = Path(values['path'])
+                values['is_thumbnail'] = bool(values['is_thumbnail'])
+                manifest.files[values['path']] = ManifestEntry(**values)
+            return manifest
+
+    def save(self, manifest):
+        """Write the entries the run changed or removed, the subfolder mtimes and the pending count"""
+        with self.lock:
+            folder = str(manifest.root)
+            now = time.time()
+            pending = sum(1 for entry in manifest.files.values() if is_pending(manifest, entry))
+
+            rows = []
+            for path in manifest.changed:
+                entry = manifest.files.get(path)
+                if entry is None:
+                    continue
+                values = [getattr(entry, column) for column in FILE_COLUMNS]
+                values[0] = str(entry.path)
+                rows.append(values + [folder, now])
+
+            placeholders = ', '.join('?' * (len(FILE_COLUMNS) + 2))
+            with self.conn:
+                self.conn.executemany('DELETE FROM files WHERE path = ?',
+                                      [(str(path),) for path in manifest.removed if path not in manifest.files])
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO files ({', '.join(FILE_COLUMNS)}, folder, updated_at) "
+                    f"VALUES ({placeholders})", rows)
+                self.conn.execute('DELETE FROM dirs WHERE folder = ?', (folder,))
+                self.conn.executemany('INSERT OR REPLACE INTO dirs (path, folder, mtime_ns) VALUES (?, ?, ?)',
+                                      [(path, folder, mtime_ns) for path, mtime_ns in manifest.dir_mtimes.items()])
+                self.conn.execute('INSERT OR REPLACE INTO folders (path, files, pending, updated_at) VALUES (?, ?, ?, ?)',
+                                  (folder, manifest.file_count(), pending, now))
+
+            self.stats['scanned'] += 1
+            self.stats['saved_rows'] += len(rows)
+            manifest.changed.clear()
+            manifest.removed.clear()
+            logger.info(f"Saved ingest state for {manifest.root.name}: {len(rows)} file(s) updated, {pending} pending")
+            return pending
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,119 @@
+"""
+Load test for the image server
+
+Fires concurrent /image requests for original and resized images and reports
+requests per second and p50/p95/p99 latency per scenario.
+
+Usage:
+    python loadtest.py --url http://localhost:80 --device-id 122 \\
+        --path 1/media/LAWA_01_WTP/Area_1/1729701045123.jpg \\
+        --sizes 640x480,150x84 --concurrency 20 --duration 30
+"""
+import math
+import time
+import argparse
+import threading
+import requests
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = math.ceil(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(index, len(sorted_values) - 1))]
+
+
+def get_token(base_url, device_id):
+    response = requests.get(f"{base_url}/generate-token", params={'device_id': device_id}, timeout=10)
+    response.raise_for_status()
+    return response.json()['token']
+
+
+def run_scenario(base_url, params_list, concurrency, duration):
+    """
+    Hit /image with concurrency threads for duration seconds
+    params_list is cycled so several files can share the load
+    Returns dict with counts, throughput and latency percentiles (ms)
+    """
+    latencies = []
+    errors = {}
+    bytes_received = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+        session = requests.Session()
+        i = offset
+        while time.perf_counter() < deadline:
+            params = params_list[i % len(params_list)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                response = session.get(f"{base_url}/image", params=params, timeout=60)
+                body = response.content
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if response.status_code == 200:
+                        latencies.append(elapsed)
+                        bytes_received[0] += len(body)
+                    else:
+                        errors[response.status_code] = errors.get(response.status_code, 0) + 1
+            except requests.RequestException as e:
+                with lock:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'mb_per_sec': bytes_received[0] / elapsed / 1024 ** 2,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:80', help='Image server base URL')
+    parser.add_argument('--device-id', type=int, required=True)
+    parser.add_argument('--path', action='append', required=True,
+                        help='Image path as passed to /image (repeat for several files)')
+    parser.add_argument('--sizes', default='640x480',
+                        help='Comma separated resize scenarios, empty for originals only')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per scenario')
+    parser.add_argument('--skip-original', action='store_true', help='Do not run the original image scenario')
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    token = get_token(base_url, args.device_id)
+    base_params = [{'path': p, 'device_id': args.device_id, 'token': token} for p in args.path]
+
+    scenarios = []
+    if not args.skip_original:
+        scenarios.append(('original', base_params))
+    for size in filter(None, args.sizes.split(',')):
+        scenarios.append((size, [dict(p, size=size) for p in base_params]))
+
+    print(f"{len(args.path)} file(s), concurrency {args.concurrency}, {args.duration:.0f}s per scenario")
+    print(f"{'scenario':<12}{'requests':>10}{'req/s':>10}{'MB/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  errors")
+
+    for name, params_list in scenarios:
+        result = run_scenario(base_url, params_list, args.concurrency, args.duration)
+        print(f"{name:<12}{result['requests']:>10}{result['rps']:>10.1f}{result['mb_per_sec']:>9.1f}"
+              f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}  {result['errors'] or '-'}")
+
+
+if __name__ == '__main__':
+    main()
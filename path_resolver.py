@@ -0,0 +1,220 @@
+import os
+import stat
+import time
+import errno
+import logging
+import threading
+from collections import OrderedDict
+from placement import file_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class PathResolver:
+    """
+    Maps requested image paths to a real file on one of the media disks
+
+    - Allowed roots are resolved once at startup, not on every request
+    - A miss costs one realpath() and one os.stat() per candidate (the
+      recorded path, then its mirror disk); the stat result is returned so
+      callers get existence, size and mtime without further syscalls
+    - Found files are cached for ttl seconds, missing or denied paths for
+      negative_ttl seconds; the cache is an LRU capped at max_entries
+    - Lookups are counted per disk (the allowed root of the requested path)
+
+    mirrors maps a primary prefix to its mirror, e.g.
+    {'/mnt/disk1/': '/mnt/disk2/'}; a path on either disk of a pair falls
+    back to the other. With a DiskHealthMonitor as health, each pair is
+    tried in the order health.route() picks and every stat is reported to
+    it as a latency sample.
+
+    With a PlacementMap as placements, a camera file (named by its capture
+    time) is looked up on the disk its folder's placement span records for
+    that time, whichever disk the path names, then on that disk's mirror.
+    Only if both miss is the requested path tried as well. Files no span
+    covers are looked up where the path says.
+    """
+
+    def __init__(self, allowed_roots, mirrors, ttl, negative_ttl, max_entries=50000, health=None,
+                 placements=None):
+        self.allowed_roots = tuple(root.rstrip(os.sep) for root in allowed_roots)
+        self.roots = tuple(os.path.realpath(root) for root in self.allowed_roots)
+        self.partners = dict(mirrors)
+        self.partners.update({mirror: primary for primary, mirror in mirrors.items()})
+        self.primaries = {mirror: primary for primary, mirror in mirrors.items()}
+        self.health = health
+        self.placements = placements
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # requested path -> (result, expires_at)
+        self._disk_stats = {}
+
+    def _root_for(self, real_path):
+        for root in self.roots:
+            if real_path == root or real_path.startswith(root + os.sep):
+                return root
+        return None
+
+    def is_safe(self, file_path):
+        """Check the fully resolved path lies within an allowed root"""
+        return self._root_for(os.path.realpath(file_path)) is not None
+
+    def _disk_for(self, file_path):
+        """Stats bucket for a requested path: the allowed root it names, or 'other'"""
+        for root in self.allowed_roots:
+            if file_path.startswith(root + os.sep):
+                return root
+        return 'other'
+
+    def _count(self, disk, counter):
+        entry = self._disk_stats.setdefault(disk, {
+            'hits': 0, 'negative_hits': 0, 'misses': 0, 'mirror': 0, 'placed': 0, 'off_record': 0,
+            'not_found': 0, 'denied': 0
+        })
+        entry[counter] += 1
+
+    def _stat_candidate(self, candidate, disk=None):
+        """
+        Returns tuple (real_path, stat_result, reason); reason is None when the
+        candidate is a regular file inside an allowed root, else 'denied' or 'missing'
+        """
+        started = time.perf_counter()
+        real_path = os.path.realpath(candidate)
+        if self._root_for(real_path) is None:
+            return None, None, 'denied'
+        try:
+            file_stat = os.stat(real_path)
+        except OSError as e:
+            if disk and self.health:
+                self.health.record(disk, time.perf_counter() - started,
+                                   ok=e.errno in (errno.ENOENT, errno.ENOTDIR))
+            return None, None, 'missing'
+        if disk and self.health:
+            self.health.record(disk, time.perf_counter() - started)
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None, None, 'missing'
+        return real_path, file_stat, None
+
+    def _recorded(self, file_path):
+        """
+        file_path on the disk the placement spans record for it, or file_path itself
+        when that is the recorded disk (or its mirror) or no span covers the file
+        """
+        if self.placements is None:
+            return file_path
+        timestamp = file_timestamp(os.path.basename(file_path))
+        if timestamp is None:
+            return file_path
+        for root in self.allowed_roots:
+            if not file_path.startswith(root + os.sep):
+                continue
+            rest = file_path[len(root) + 1:]
+            disk = self.placements.disk_for(rest.split(os.sep, 1)[0], timestamp)
+            # Spans are recorded for the primary; its mirror holds the same files
+            prefix = next((p for p in self.primaries if (root + os.sep).startswith(p)), None)
+            primary_root = self.primaries[prefix] + root[len(prefix):] if prefix else root
+            if disk is None or disk == primary_root:
+                return file_path
+            return os.path.join(disk, rest)
+        return file_path
+
+    def _lookup(self, file_path):
+        """
+        Resolve on a cache miss, trying the mirror disk when the file is missing
+        Returns tuple (result, from_partner, routed) where routed means the
+        health monitor sent the lookup to the partner disk first
+        """
+        prefix = next((p for p in self.partners if file_path.startswith(p)), None)
+        if prefix is None:
+            return self._stat_candidate(file_path), False, False
+
+        partner = self.partners[prefix]
+        rest = file_path[len(prefix):]
+        routed = self.health is not None and self.health.route(prefix) == partner
+        order = [partner, prefix] if routed else [prefix, partner]
+
+        first = self._stat_candidate(order[0] + rest, order[0])
+        if first[2] != 'missing':
+            return first, order[0] == partner, routed
+        second = self._stat_candidate(order[1] + rest, order[1])
+        if second[2] is None:
+            return second, order[1] == partner, routed
+        return first, False, routed
+
+    def resolve(self, file_path):
+        """
+        Locate file_path, falling back to its mirror disk
+        Returns tuple (real_path, stat_result, reason) where reason is None on
+        success, 'denied' for paths outside the allowed roots or 'missing'
+        """
+        disk = self._disk_for(file_path)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(file_path)
+                self._count(disk, 'hits' if entry[0][2] is None else 'negative_hits')
+                return entry[0]
+            self._count(disk, 'misses')
+
+        placed_path = self._recorded(file_path)
+        result, used_mirror, routed = self._lookup(placed_path)
+        off_record = False
+        if result[2] == 'missing' and placed_path != file_path:
+            requested = self._lookup(file_path)
+            if requested[0][2] is None:
+                result, used_mirror, routed = requested
+                off_record = True
+                logger.warning(f"{file_path} is not on the disk its placement records: {placed_path}")
+        reason = result[2]
+        if placed_path != file_path and not off_record:
+            logger.debug(f"{file_path} is on the disk its placement records: {placed_path}")
+        if used_mirror and not routed:
+            logger.info(f"File not found on requested disk, using mirror: {result[0]}")
+        elif routed and not used_mirror and reason is None:
+            logger.debug(f"File not yet on mirror disk, using requested disk: {result[0]}")
+
+        ttl = self.ttl if reason is None else self.negative_ttl
+        with self._lock:
+            if off_record:
+                self._count(disk, 'off_record')
+            elif placed_path != file_path:
+                self._count(disk, 'placed')
+            if used_mirror:
+                self._count(disk, 'mirror')
+            elif reason == 'missing':
+                self._count(disk, 'not_found')
+            elif reason == 'denied':
+                self._count(disk, 'denied')
+            self._entries[file_path] = (result, time.monotonic() + ttl)
+            self._entries.move_to_end(file_path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def forget(self, file_path=None):
+        """Drop one cached lookup (e.g. after the file vanished) or all of them"""
+        with self._lock:
+            if file_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(file_path, None)
+
+    def info(self):
+        """Cache size and per-disk counters (with hit rate) for the health endpoint"""
+        with self._lock:
+            disks = {}
+            for disk, counters in self._disk_stats.items():
+                lookups = counters['hits'] + counters['negative_hits'] + counters['misses']
+                disks[disk] = {
+                    **counters,
+                    'hit_rate': round((counters['hits'] + counters['negative_hits']) / lookups, 3) if lookups else 0.0
+                }
+            return {
+                'entries': len(self._entries),
+                'roots': list(self.roots),
+                'disks': disks
+            }
@@ -0,0 +1,336 @@
+"""
+Destination placement for camera folders moved off the FTP disk
+
+Instead of "disk1 until it is 85% full, then disk3", each incoming batch
+(a camera folder with its size) is placed with its size in mind:
+
+- a camera stays on the primary disk that already holds its folder, as
+  long as that disk stays under PLACEMENT_MAX_USAGE with the batch on it
+- otherwise (new camera, or its disk is full) the batch goes to the
+  primary disk with room that scores best: the share of the disk still
+  free after the batch, discounted by how busy the disk is (from
+  /sys/dev/block io_ticks) and by the bytes this process is already
+  writing to it
+- if no disk has room, the one with the most free space is used
+
+Every decision is recorded in a small SQLite database (PLACEMENT_DB):
+which disks each camera folder has been placed on, the current one first,
+plus a log of the decisions. Files are named by their capture time in
+milliseconds, so each folder also gets spans: from a capture time on, the
+folder's files are on one disk, until the next span. The image server
+reads the spans through PlacementMap and looks a file up on the disk that
+holds it, instead of trying the disk the request names first.
+"""
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Media roots of the primary disks; each is mirrored by start_rsync
+PLACEMENT_DISKS = os.environ.get('PLACEMENT_DISKS', '/mnt/disk1/media,/mnt/disk3/media').split(',')
+# A disk takes no new batches once it would be fuller than this (percent)
+PLACEMENT_MAX_USAGE = float(os.environ.get('PLACEMENT_MAX_USAGE', 85))
+PLACEMENT_DB = os.environ.get('PLACEMENT_DB', '/var/lib/image-processor/placement.db')
+# Bytes being written to a disk that halve its score (spreads concurrent moves)
+PLACEMENT_LOAD_BYTES = 1024 ** 3
+# Seconds between disk busy samples
+BUSY_SAMPLE_SECONDS = 1.0
+# Days of decisions kept in the log
+DECISION_DAYS = 30
+
+# Camera file names: capture time in milliseconds, optionally with a _counter
+TIMESTAMP_NAME = re.compile(r'^(\d{13})(?:_\d+)?\.[^.]+$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS placements (
+    folder TEXT NOT NULL,
+    disk TEXT NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    files INTEGER NOT NULL DEFAULT 0,
+    first_at REAL NOT NULL,
+    last_at REAL NOT NULL,
+    PRIMARY KEY (folder, disk)
+);
+CREATE TABLE IF NOT EXISTS decisions (
+    at REAL NOT NULL,
+    folder TEXT NOT NULL,
+    disk TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    reason TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS decisions_at ON decisions (at);
+CREATE TABLE IF NOT EXISTS spans (
+    folder TEXT NOT NULL,
+    disk TEXT NOT NULL,
+    first_ts INTEGER NOT NULL,
+    placed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spans_folder ON spans (folder, placed_at);
+"""
+
+
+def file_timestamp(file_name):
+    """Capture time in milliseconds from a camera file name, or None"""
+    match = TIMESTAMP_NAME.match(file_name)
+    return int(match.group(1)) if match else None
+
+
+def _io_ticks(path):
+    """Milliseconds the block device holding path has spent doing I/O, or None if unknown"""
+    try:
+        dev = os.stat(path).st_dev
+        with open(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}/stat") as f:
+            return int(f.read().split()[9])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class DiskState:
+    """One primary disk as seen by the placement engine"""
+
+    __slots__ = ('root', 'total', 'free', 'queued', 'busy', 'ticks', 'ticks_at')
+
+    def __init__(self, root):
+        self.root = root
+        self.total = self.free = 0
+        self.queued = 0  # bytes placed on the disk by this process and not yet written
+        self.busy = 0.0  # share of the last sample interval the device was doing I/O
+        self.ticks = _io_ticks(root)
+        self.ticks_at = time.monotonic()
+
+    def refresh(self):
+        stat = os.statvfs(self.root)
+        self.total = stat.f_blocks * stat.f_frsize
+        self.free = stat.f_bavail * stat.f_frsize
+        now = time.monotonic()
+        if now - self.ticks_at >= BUSY_SAMPLE_SECONDS:
+            ticks = _io_ticks(self.root)
+            if ticks is not None and self.ticks is not None:
+                self.busy = min(1.0, max(0.0, (ticks - self.ticks) / ((now - self.ticks_at) * 1000)))
+            self.ticks, self.ticks_at = ticks, now
+
+    def usage_after(self, batch_bytes):
+        """Percent used once the queued bytes and batch_bytes are written"""
+        if not self.total:
+            return 100.0
+        return (self.total - self.free + self.queued + batch_bytes) / self.total * 100
+
+    def score(self, batch_bytes):
+        free_after = max(0, self.free - self.queued - batch_bytes) / self.total if self.total else 0.0
+        return free_after * (1 - self.busy) / (1 + self.queued / PLACEMENT_LOAD_BYTES)
+
+
+class PlacementEngine:
+    """
+    Picks the primary disk for each incoming camera folder and records the decision
+
+    Usage:
+        placement = PlacementEngine()
+        media_root = placement.place('CAM_WTP', batch_bytes, files, first_ts)  # reserves batch_bytes
+        ...move the folder to media_root / 'CAM_WTP'...
+        placement.done(media_root, batch_bytes)
+    """
+
+    def __init__(self, disks=PLACEMENT_DISKS, db_path=PLACEMENT_DB, max_usage=PLACEMENT_MAX_USAGE):
+        self.max_usage = max_usage
+        self.disks = {}
+        for root in disks:
+            if os.path.isdir(root):
+                self.disks[root] = DiskState(root)
+            else:
+                logger.warning(f"Placement disk {root} does not exist, not using it")
+        self.lock = threading.Lock()
+        self.stats = {'kept': 0, 'new': 0, 'spilled': 0, 'full': 0}
+
+        self.conn = None
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(SCHEMA)
+            with self.conn:
+                self.conn.execute('DELETE FROM decisions WHERE at < ?', (time.time() - DECISION_DAYS * 86400,))
+        except sqlite3.Error as e:
+            logger.warning(f"Placement records unavailable ({db_path}: {e}), decisions will not be recorded")
+            self.conn = None
+
+    def current_disk(self, folder_name):
+        """The disk the folder was last placed on; for folders never recorded, the disk it exists on"""
+        if self.conn is not None:
+            row = self.conn.execute('SELECT disk FROM placements WHERE folder = ? ORDER BY last_at DESC LIMIT 1',
+                                    (folder_name,)).fetchone()
+            if row is not None and row[0] in self.disks:
+                return row[0]
+        existing = [(os.stat(Path(root) / folder_name).st_mtime, root)
+                    for root in self.disks if (Path(root) / folder_name).is_dir()]
+        return max(existing)[1] if existing else None
+
+    def place(self, folder_name, batch_bytes, files=0, first_ts=None):
+        """
+        Media root (Path) to move folder_name's batch of batch_bytes to; the bytes stay queued until done()
+        first_ts is the earliest capture time (ms) in the batch, the current time if unknown
+        """
+        with self.lock:
+            if not self.disks:
+                raise RuntimeError("No placement disks available")
+            for disk in self.disks.values():
+                disk.refresh()
+
+            current = self.current_disk(folder_name)
+            with_room = [disk for disk in self.disks.values() if disk.usage_after(batch_bytes) < self.max_usage]
+            if current is not None and self.disks[current] in with_room:
+                disk, reason = self.disks[current], 'kept'
+            elif with_room:
+                disk = max(with_room, key=lambda d: d.score(batch_bytes))
+                reason = 'new' if current is None else 'spilled'
+            else:
+                disk = max(self.disks.values(), key=lambda d: d.free - d.queued)
+                reason = 'full'
+
+            disk.queued += batch_bytes
+            self.stats[reason] += 1
+            self._record(folder_name, disk.root, batch_bytes, files, reason)
+            self._record_span(folder_name, disk.root, current,
+                              int(time.time() * 1000) if first_ts is None else first_ts)
+
+        message = (f"Placing '{folder_name}' ({batch_bytes / 1024 ** 2:.1f} MB) on {disk.root} ({reason}, "
+                   f"{disk.usage_after(0):.1f}% used incl. queued, busy {disk.busy * 100:.0f}%)")
+        if reason == 'full':
+            logger.warning(f"All disks over {self.max_usage:.0f}% - {message}")
+        elif reason == 'spilled':
+            logger.warning(f"{current} has no room for the batch - {message}")
+        else:
+            logger.info(message)
+        return Path(disk.root)
+
+    def done(self, media_root, batch_bytes):
+        """The batch placed on media_root has been written (or given up on)"""
+        with self.lock:
+            disk = self.disks.get(str(media_root))
+            if disk is not None:
+                disk.queued = max(0, disk.queued - batch_bytes)
+
+    def _record_span(self, folder_name, root, current, first_ts):
+        """Start a span on root at first_ts, unless the folder's latest span is already on root"""
+        if self.conn is None:
+            return
+        try:
+            latest = self.conn.execute('SELECT disk FROM spans WHERE folder = ? ORDER BY placed_at DESC LIMIT 1',
+                                       (folder_name,)).fetchone()
+            if latest is not None and latest[0] == root:
+                return
+            now = time.time()
+            if latest is None and current not in (None, root):
+                # The folder's files so far stay on the disk it already exists on
+                spans = [(current, 0, 0.0), (root, first_ts, now)]
+            elif latest is None:
+                spans = [(root, 0, 0.0)]
+            else:
+                spans = [(root, first_ts, now)]
+            with self.conn:
+                self.conn.executemany('INSERT INTO spans (folder, disk, first_ts, placed_at) VALUES (?, ?, ?, ?)',
+                                      [(folder_name, disk, ts, at) for disk, ts, at in spans])
+        except sqlite3.Error as e:
+            logger.error(f"Could not record span of '{folder_name}' on {root}: {e}")
+
+    def _record(self, folder_name, root, batch_bytes, files, reason):
+        if self.conn is None:
+            return
+        now = time.time()
+        try:
+            with self.conn:
+                self.conn.execute("""
+                    INSERT INTO placements (folder, disk, bytes, files, first_at, last_at) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (folder, disk) DO UPDATE SET
+                        bytes = bytes + excluded.bytes, files = files + excluded.files, last_at = excluded.last_at
+                """, (folder_name, root, batch_bytes, files, now, now))
+                self.conn.execute('INSERT INTO decisions (at, folder, disk, bytes, reason) VALUES (?, ?, ?, ?, ?)',
+                                  (now, folder_name, root, batch_bytes, reason))
+        except sqlite3.Error as e:
+            logger.error(f"Could not record placement of '{folder_name}' on {root}: {e}")
+
+    def info(self):
+        with self.lock:
+            return {
+                **self.stats,
+                'disks': {root: {'usage_percent': round(disk.usage_after(0), 1), 'queued_bytes': disk.queued,
+                                 'busy': round(disk.busy, 2)} for root, disk in self.disks.items()}
+            }
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class PlacementMap:
+    """
+    The image server's read-only view of the placement spans:
+    folder name -> [(first_ts, disk), ...], most recently placed first
+
+    The records are reloaded when the database changes, checked at most every
+    check_interval seconds; a missing database means no records.
+    """
+
+    def __init__(self, db_path=PLACEMENT_DB, check_interval=5):
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.folders = {}
+        self.version = None
+        self.checked_at = 0.0
+
+    def _version(self):
+        versions = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                stat = os.stat(path)
+                versions.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                versions.append(None)
+        return tuple(versions)
+
+    def _reload(self):
+        folders = {}
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                for folder, disk, first_ts in conn.execute(
+                        'SELECT folder, disk, first_ts FROM spans ORDER BY placed_at DESC'):
+                    folders.setdefault(folder, []).append((first_ts, disk))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read placement records ({self.db_path}): {e}")
+            return
+        self.folders = folders
+        logger.info(f"Loaded placement spans for {len(folders)} folder(s)")
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self.checked_at >= self.check_interval:
+            with self.lock:
+                if now - self.checked_at >= self.check_interval:
+                    self.checked_at = now
+                    version = self._version()
+                    if version != self.version:
+                        self.version = version
+                        if version[0] is None:
+                            self.folders = {}
+                        else:
+                            self._reload()
+
+    def disk_for(self, folder_name, timestamp):
+        """Media root holding the folder's file captured at timestamp (ms), or None if no span covers it"""
+        self._refresh()
+        for first_ts, disk in self.folders.get(folder_name, ()):
+            if first_ts <= timestamp:
+                return disk
+        return None
+
+    def info(self):
+        return {'folders': len(self.folders), 'spans': sum(map(len, self.folders.values())), 'db': self.db_path}
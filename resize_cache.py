@@ -0,0 +1,203 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# File extension used for each cached output format
+FORMAT_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+    'AVIF': '.avif',
+}
+
+# Mimetype served for each cached file extension
+EXTENSION_MIMETYPES = {
+    '.jpg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+}
+
+
+def make_cache_key(file_path, stat_result, target_size, output_format):
+    """
+    Build a content-addressed cache key for a resized derivative
+    Key covers (resolved path, mtime, size, WIDTHxHEIGHT, output format), so a
+    rewritten original never matches an old derivative. file_path must already
+    be resolved (server.locate_image returns the real path).
+    """
+    raw_string = (f"{file_path}|{stat_result.st_mtime_ns}|{stat_result.st_size}|"
+                  f"{target_size[0]}x{target_size[1]}|{output_format}")
+    return hashlib.sha256(raw_string.encode()).hexdigest()
+
+
+class ResizeCache:
+    """
+    Two-tier cache of encoded resized images
+
+    - Hot tier: in-process LRU of encoded bytes, bounded by hot_max_bytes
+    - Disk tier: one file per derivative under cache_dir, bounded by max_bytes
+      with LRU eviction (file mtime is bumped on every hit)
+
+    Each server process keeps its own disk index; files evicted by another
+    process are treated as misses.
+    """
+
+    def __init__(self, cache_dir, max_bytes, hot_max_bytes):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_bytes = max_bytes
+        self.hot_max_bytes = hot_max_bytes
+
+        self._lock = threading.Lock()
+        self._hot = OrderedDict()  # key -> (data, mimetype)
+        self._hot_bytes = 0
+        self._disk = OrderedDict()  # key -> (path, size)
+        self._disk_bytes = 0
+
+        self.stats = {'hot_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        if self.cache_dir and self.max_bytes > 0:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                self._load_disk_index()
+            except OSError as e:
+                logger.warning(f"Resize cache disk tier disabled ({self.cache_dir}): {e}")
+                self.cache_dir = None
+        else:
+            self.cache_dir = None
+
+    def _load_disk_index(self):
+        """Rebuild the LRU index from files already on disk, oldest first"""
+        entries = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.'):
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime, Path(entry.path).stem, entry.path, st.st_size))
+
+        entries.sort()
+        for _, key, path, size in entries:
+            self._disk[key] = (path, size)
+            self._disk_bytes += size
+
+        self._evict_disk()
+        logger.info(f"Resize cache loaded {len(self._disk)} entries ({self._disk_bytes:,} bytes) from {self.cache_dir}")
+
+    def get(self, key):
+        """Return (data, mimetype) for key, or None on a miss"""
+        with self._lock:
+            hot = self._hot.get(key)
+            if hot is not None:
+                self._hot.move_to_end(key)
+                self.stats['hot_hits'] += 1
+                return hot
+
+            disk = self._disk.get(key)
+            if disk is not None:
+                self._disk.move_to_end(key)
+
+        if disk is not None:
+            path, _ = disk
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                # Evicted by another process
+                with self._lock:
+                    self._forget_disk(key)
+                    self.stats['misses'] += 1
+                return None
+
+            mimetype = EXTENSION_MIMETYPES.get(Path(path).suffix, 'application/octet-stream')
+            with self._lock:
+                self.stats['disk_hits'] += 1
+                self._put_hot(key, data, mimetype)
+            return data, mimetype
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, data, output_format):
+        """Store encoded image bytes in both tiers"""
+        ext = FORMAT_EXTENSIONS.get(output_format, '.bin')
+        mimetype = EXTENSION_MIMETYPES.get(ext, 'application/octet-stream')
+
+        with self._lock:
+            self._put_hot(key, data, mimetype)
+
+        if not self.cache_dir or len(data) > self.max_bytes:
+            return
+
+        shard_dir = self.cache_dir / key[:2]
+        path = shard_dir / f"{key}{ext}"
+        try:
+            shard_dir.mkdir(exist_ok=True)
+            # Write to a temp file and rename so readers never see partial files
+            fd, tmp_path = tempfile.mkstemp(dir=shard_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write resize cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            self._forget_disk(key)
+            self._disk[key] = (str(path), len(data))
+            self._disk_bytes += len(data)
+            self._evict_disk()
+
+    def _put_hot(self, key, data, mimetype):
+        if len(data) > self.hot_max_bytes:
+            return
+
+        old = self._hot.pop(key, None)
+        if old is not None:
+            self._hot_bytes -= len(old[0])
+
+        self._hot[key] = (data, mimetype)
+        self._hot_bytes += len(data)
+
+        while self._hot_bytes > self.hot_max_bytes:
+            _, (old_data, _) = self._hot.popitem(last=False)
+            self._hot_bytes -= len(old_data)
+
+    def _forget_disk(self, key):
+        old = self._disk.pop(key, None)
+        if old is not None:
+            self._disk_bytes -= old[1]
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_bytes and self._disk:
+            key, (path, size) = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.stats['evictions'] += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not evict resize cache entry {path}: {e}")
+
+    def info(self):
+        """Cache sizes and hit counters for the health endpoint"""
+        with self._lock:
+            return {
+                'hot_entries': len(self._hot),
+                'hot_bytes': self._hot_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'disk_enabled': self.cache_dir is not None,
+                **self.stats
+            }
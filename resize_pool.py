@@ -0,0 +1,97 @@
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """Raised when the resize queue is full and the request should be retried later"""
+
+
+class ResizePool:
+    """
+    Bounded process pool for CPU-bound resize/encode jobs
+
+    - At most max_pending jobs are queued or running; beyond that submit()
+      raises PoolSaturated instead of letting work pile up
+    - Jobs with the same key share one future, so simultaneous requests for
+      the same derivative trigger a single resize
+
+    The executor is created lazily so each server worker process (after the
+    gunicorn fork) gets its own pool.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._inflight = {}  # key -> Future
+
+        self.stats = {'submitted': 0, 'coalesced': 0, 'rejected': 0, 'failed': 0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: never fork a multi-threaded server process
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            logger.info(f"Started resize pool with {self.max_workers} processes (max pending: {self.max_pending})")
+        return self._executor
+
+    def submit(self, key, fn, *args):
+        """
+        Submit fn(*args) under key, or join an identical job already in flight
+        Returns tuple (future, created) where created is False for coalesced jobs
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future, False
+
+            if len(self._inflight) >= self.max_pending:
+                self.stats['rejected'] += 1
+                raise PoolSaturated(f"{len(self._inflight)} resize jobs pending")
+
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a corrupt image); start a fresh pool
+                logger.error("Resize pool is broken, restarting it")
+                self._executor = None
+                future = self._get_executor().submit(fn, *args)
+
+            self._inflight[key] = future
+            self.stats['submitted'] += 1
+
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return future, True
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if future.cancelled() or future.exception() is not None:
+                self.stats['failed'] += 1
+
+    def info(self):
+        """Pool size and counters for the health endpoint"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': len(self._inflight),
+                **self.stats
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,188 @@
+"""
+Work scheduler for the image processor's per-folder pipeline
+
+Work is split into stages, one per resource (CPU, each destination disk,
+the database), each with its own fixed number of worker threads, so
+different camera folders keep every resource busy at the same time
+instead of taking turns. A task may submit follow-up tasks to other
+stages; the run is over when no task is queued or running anywhere.
+
+Each stage queue is served round-robin by key (the device), so a camera
+with a large backlog gets its turn like every other camera instead of
+holding them up. Every stage records its busy time and wall-clock span,
+reported by summary().
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class FairQueue:
+    """Blocking queue that hands out items round-robin by key, oldest first within a key"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.items = OrderedDict()  # key -> deque, in turn order
+        self.size = 0
+        self.closed = False
+
+    def put(self, key, item):
+        with self.cond:
+            self.items.setdefault(key, deque()).append(item)
+            self.size += 1
+            self.cond.notify()
+
+    def get(self):
+        """The next key's oldest item; None once the queue is closed and empty"""
+        with self.cond:
+            while not self.items:
+                if self.closed:
+                    return None
+                self.cond.wait()
+            key, items = self.items.popitem(last=False)
+            item = items.popleft()
+            if items:
+                self.items[key] = items  # back of the line
+            self.size -= 1
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        with self.cond:
+            return self.size
+
+
+class Stage:
+    """A pool of worker threads running the tasks submitted to one resource"""
+
+    def __init__(self, scheduler, name, workers):
+        self.scheduler = scheduler
+        self.name = name
+        self.workers = workers
+        self.queue = FairQueue()
+        self.lock = threading.Lock()
+        self.stats = {'tasks': 0, 'failed': 0, 'busy': 0.0, 'first_start': None, 'last_end': None}
+        self.threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            fn, args = task
+            started = time.perf_counter()
+            failed = False
+            try:
+                fn(*args)
+            except Exception as e:
+                failed = True
+                logger.error(f"Stage '{self.name}' task {getattr(fn, '__name__', fn)} failed: {e}", exc_info=True)
+            ended = time.perf_counter()
+            with self.lock:
+                self.stats['tasks'] += 1
+                self.stats['failed'] += failed
+                self.stats['busy'] += ended - started
+                if self.stats['first_start'] is None:
+                    self.stats['first_start'] = started
+                self.stats['last_end'] = ended
+            self.scheduler._task_done()
+
+    def pending(self):
+        """Tasks waiting for a worker"""
+        return len(self.queue)
+
+    def close(self):
+        self.queue.close()
+        for thread in self.threads:
+            thread.join()
+
+
+class Scheduler:
+    """
+    Stages by name, created on first use; tasks are submitted with the key they are shared by
+
+    Usage:
+        scheduler = Scheduler({'cpu': 4, 'db': 1})
+        scheduler.submit('cpu', device_id, fn, arg)  # fn may submit further tasks
+        scheduler.wait()
+        scheduler.log_summary()
+    """
+
+    def __init__(self, workers):
+        self.workers = dict(workers)  # stage name (or prefix before ':') -> worker threads
+        self.stages = OrderedDict()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.outstanding = 0
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        with self.lock:
+            if name not in self.stages:
+                workers = self.workers.get(name, self.workers.get(name.split(':')[0], 1))
+                self.stages[name] = Stage(self, name, workers)
+            return self.stages[name]
+
+    def submit(self, stage, key, fn, *args):
+        stage = self.stage(stage)
+        with self.lock:
+            self.outstanding += 1
+        stage.queue.put(key, (fn, args))
+
+    def _task_done(self):
+        with self.lock:
+            self.outstanding -= 1
+            if self.outstanding == 0:
+                self.idle.notify_all()
+
+    def join(self):
+        """Block until every submitted task (and the tasks they submitted) has run"""
+        with self.lock:
+            while self.outstanding:
+                self.idle.wait()
+
+    def close(self):
+        """Stop the worker threads; submit nothing afterwards"""
+        with self.lock:
+            stages = list(self.stages.values())
+        for stage in stages:
+            stage.close()
+
+    def wait(self):
+        self.join()
+        self.close()
+
+    def summary(self):
+        """Per stage: workers, tasks, failed, busy seconds, wall-clock span and utilisation"""
+        summary = OrderedDict()
+        for name, stage in self.stages.items():
+            with stage.lock:
+                stats = dict(stage.stats)
+            span = (stats['last_end'] - stats['first_start']) if stats['first_start'] is not None else 0.0
+            summary[name] = {
+                'workers': stage.workers,
+                'tasks': stats['tasks'],
+                'failed': stats['failed'],
+                'busy_seconds': round(stats['busy'], 2),
+                'span_seconds': round(span, 2),
+                'utilisation': round(stats['busy'] / (span * stage.workers), 2) if span else 0.0,
+            }
+        return summary
+
+    def log_summary(self):
+        elapsed = time.perf_counter() - self.started
+        logger.info(f"Scheduler: {elapsed:.1f}s wall clock")
+        for name, entry in self.summary().items():
+            logger.info(f"Stage {name}: {entry['tasks']} task(s) ({entry['failed']} failed) on {entry['workers']} "
+                        f"worker(s), busy {entry['busy_seconds']:.1f}s over {entry['span_seconds']:.1f}s "
+                        f"({entry['utilisation'] * 100:.0f}% utilised)")
@@ -0,0 +1,99 @@
+"""
+Production entry point for the image server
+
+Runs the Flask app from server.py under gunicorn's pre-fork server so resize
+requests are spread over several processes instead of the single-process
+Werkzeug development server.
+
+Settings come from the command line or environment variables:
+    PORT                          Listen port (default: 80)
+    IMAGE_SERVER_WORKERS          Worker processes (default: CPU count)
+    IMAGE_SERVER_THREADS          Threads per worker (default: 4)
+    IMAGE_SERVER_TIMEOUT          Seconds before a stuck worker is restarted (default: 60)
+    IMAGE_SERVER_GRACEFUL_TIMEOUT Seconds workers get to finish on reload/stop (default: 30)
+    IMAGE_SERVER_MAX_REQUESTS     Recycle a worker after this many requests, 0 = never (default: 0)
+    IMAGE_SERVER_SENDFILE         1 = send original images with os.sendfile, 0 = copy in Python (default: 1)
+
+Graceful reload (new code, no dropped requests):
+    sudo systemctl reload image-server      # sends SIGHUP to the master process
+"""
+import os
+import argparse
+import logging
+from gunicorn.app.base import BaseApplication
+
+logger = logging.getLogger(__name__)
+
+
+def worker_exit(server, worker):
+    """Gunicorn hook: stop the worker's resize processes along with it"""
+    from server import stop_workers
+    stop_workers()
+
+
+class ImageServerApplication(BaseApplication):
+    """Gunicorn application that loads server:app in each worker"""
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if value is not None and key in self.cfg.settings:
+                self.cfg.set(key, value)
+
+    def load(self):
+        # Imported in the worker so each process gets its own caches and pools
+        from server import app, warm_caches
+        warm_caches()
+        return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 80)))
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('IMAGE_SERVER_WORKERS', os.cpu_count() or 2)))
+    parser.add_argument('--threads', type=int,
+                        default=int(os.environ.get('IMAGE_SERVER_THREADS', 4)))
+    parser.add_argument('--timeout', type=int,
+                        default=int(os.environ.get('IMAGE_SERVER_TIMEOUT', 60)))
+    parser.add_argument('--graceful-timeout', type=int,
+                        default=int(os.environ.get('IMAGE_SERVER_GRACEFUL_TIMEOUT', 30)))
+    parser.add_argument('--max-requests', type=int,
+                        default=int(os.environ.get('IMAGE_SERVER_MAX_REQUESTS', 0)))
+    parser.add_argument('--sendfile', type=int, choices=(0, 1),
+                        default=int(os.environ.get('IMAGE_SERVER_SENDFILE', 1)))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    options = {
+        'bind': f"{args.host}:{args.port}",
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10 if args.max_requests else 0,
+        'keepalive': 5,
+        'sendfile': bool(args.sendfile),
+        'worker_exit': worker_exit,
+    }
+
+    logger.info(f"Starting image server on {options['bind']}: {args.workers} workers x {args.threads} threads, "
+                f"timeout {args.timeout}s, graceful timeout {args.graceful_timeout}s")
+    ImageServerApplication(options).run()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s:%(lineno)d - %(message)s'
+    )
+    main()
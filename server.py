@@ -1,26 +1,44 @@
 import os
+import json
+import time
+import uuid
 import logging
-import hashlib
 from pathlib import Path
-from urllib.parse import unquote
-from flask import Flask, send_file, jsonify, request
+from urllib.parse import unquote, quote
+from collections import deque
+from flask import Flask, Response, send_file, jsonify, request
 from werkzeug.exceptions import NotFound, BadRequest
 import base64
+import ipaddress
 from datetime import datetime, timezone, timedelta
-from configparser import ConfigParser
-import mysql.connector
-from PIL import Image
+from db import get_connection, pool_stats
 from io import BytesIO
+from imaging import (render_resized, RESIZE_POLICY, JPEG_DRAFT_DECODE, DERIVATIVE_SIZES, derivative_path,
+                     NEGOTIABLE_FORMATS, FORMAT_MIMETYPES)
+from resize_cache import ResizeCache, make_cache_key
+from resize_pool import ResizePool, PoolSaturated
+from device_cache import DeviceRegistry
+from token_auth import TokenVerifier, token_for_window
+from path_resolver import PathResolver
+from placement import PlacementMap, PLACEMENT_DB
+from disk_health import DiskHealthMonitor
+from byte_ranges import parse_ranges, can_sendfile, file_body, multipart_body, content_range
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+
+# Under `python server.py`, every spawned resize worker re-runs this file as __mp_main__
+# before it takes a job; workers only need imaging, so they skip the setup guarded below
+SPAWNED_WORKER = __name__ == '__mp_main__'
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s:%(lineno)d - %(message)s',
-    handlers=[
-        logging.FileHandler('image_server.log'),
-        logging.StreamHandler()
-    ]
-)
+if not SPAWNED_WORKER:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s:%(lineno)d - %(message)s',
+        handlers=[
+            logging.FileHandler('image_server.log'),
+            logging.StreamHandler()
+        ]
+    )
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -39,26 +57,88 @@ ALLOWED_BASE_PATHS = [
     '/mnt/disk4/media'
 ]
 
+# Mirror disk checked when a file is missing from its primary disk
+MIRROR_DISKS = {
+    '/mnt/disk1/': '/mnt/disk2/',
+    '/mnt/disk3/': '/mnt/disk4/'
+}
+
+# Path lookup cache; missing files are cached for a shorter time
+PATH_CACHE_TTL = int(os.environ.get('PATH_CACHE_TTL', 30))
+PATH_CACHE_NEGATIVE_TTL = int(os.environ.get('PATH_CACHE_NEGATIVE_TTL', 5))
+
+# Disk health probing; reads go to the faster healthy disk of each mirror pair
+DISK_HEALTH_INTERVAL = int(os.environ.get('DISK_HEALTH_INTERVAL', 5))
+DISK_SLOW_FACTOR = float(os.environ.get('DISK_SLOW_FACTOR', 3.0))
+DISK_ERROR_THRESHOLD = float(os.environ.get('DISK_ERROR_THRESHOLD', 0.2))
+
+if not SPAWNED_WORKER:
+    disk_monitor = DiskHealthMonitor(MIRROR_DISKS, interval=DISK_HEALTH_INTERVAL,
+                                     error_threshold=DISK_ERROR_THRESHOLD, slow_factor=DISK_SLOW_FACTOR)
+
+    # Disks the image processor placed each camera folder on (see placement.py)
+    placement_map = PlacementMap(PLACEMENT_DB)
+
+    path_resolver = PathResolver(ALLOWED_BASE_PATHS, MIRROR_DISKS, PATH_CACHE_TTL, PATH_CACHE_NEGATIVE_TTL,
+                                 health=disk_monitor, placements=placement_map)
+    # Cached lookups point at the old disk after a routing switch
+    disk_monitor.on_route_change = path_resolver.forget
+
 # Allowed image extensions
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
 
-def get_db_connection():
-    """Get database connection"""
-    config = ConfigParser()
-    config.read('credentials.ini')
-
-    return mysql.connector.connect(
-        host=config.get('database', 'db_host'),
-        database=config.get('database', 'db_name'),
-        user=config.get('database', 'db_user'),
-        password=config.get('database', 'db_password'),
-        port=config.getint('database', 'db_port')
-    )
-
-def get_device_by_id(device_id):
-    """Get device information from database"""
-    try:
-        conn = get_db_connection()
+# Mimetype of original images by extension
+MIMETYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.tiff': 'image/tiff',
+    '.tif': 'image/tiff',
+    '.webp': 'image/webp'
+}
+
+# Snapshot files are named by millisecond timestamp and never rewritten
+IMAGE_CACHE_CONTROL = os.environ.get('IMAGE_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+
+# Formats offered to clients that list them in Accept, in preference order
+NEGOTIATE_FORMATS = [fmt for fmt in os.environ.get('NEGOTIATE_FORMATS', ','.join(NEGOTIABLE_FORMATS)).upper().split(',')
+                     if fmt in NEGOTIABLE_FORMATS]
+
+# Hand original downloads to the server's zero-copy sendfile path (gunicorn only)
+ORIGINAL_SENDFILE = os.environ.get('ORIGINAL_SENDFILE', '1') == '1'
+
+# Resized image cache (disk tier with LRU eviction plus in-process hot tier)
+RESIZE_CACHE_DIR = os.environ.get('RESIZE_CACHE_DIR', '/var/cache/image-server/resized')
+RESIZE_CACHE_MAX_BYTES = int(os.environ.get('RESIZE_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+RESIZE_CACHE_HOT_BYTES = int(os.environ.get('RESIZE_CACHE_HOT_BYTES', 64 * 1024 ** 2))
+
+if not SPAWNED_WORKER:
+    resize_cache = ResizeCache(RESIZE_CACHE_DIR, RESIZE_CACHE_MAX_BYTES, RESIZE_CACHE_HOT_BYTES)
+
+# Resize worker pool (per server process); requests beyond the queue depth get 503
+RESIZE_POOL_WORKERS = int(os.environ.get('RESIZE_POOL_WORKERS', 2))
+RESIZE_POOL_MAX_PENDING = int(os.environ.get('RESIZE_POOL_MAX_PENDING', 16))
+RESIZE_TIMEOUT = int(os.environ.get('RESIZE_TIMEOUT', 30))
+RESIZE_RETRY_AFTER = int(os.environ.get('RESIZE_RETRY_AFTER', 2))
+
+resize_pool = ResizePool(RESIZE_POOL_WORKERS, RESIZE_POOL_MAX_PENDING)
+
+# Maximum images in one /images/batch request
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 100))
+# Resizes one /images/batch request may have in the pool at once, so a batch leaves room for other requests
+BATCH_MAX_IN_FLIGHT = int(os.environ.get('BATCH_MAX_IN_FLIGHT', 3))
+
+# Device lookup cache; unknown device IDs are cached for a shorter time
+DEVICE_CACHE_TTL = int(os.environ.get('DEVICE_CACHE_TTL', 300))
+DEVICE_CACHE_NEGATIVE_TTL = int(os.environ.get('DEVICE_CACHE_NEGATIVE_TTL', 60))
+# Touched on invalidation so every server worker process drops its cache
+DEVICE_CACHE_INVALIDATION_FILE = os.environ.get('DEVICE_CACHE_INVALIDATION_FILE', '/tmp/image-server-devices.invalidate')
+
+def fetch_device(device_id):
+    """Load one device row from the database (raises on database errors)"""
+    with get_connection('fetch_device') as conn:
         cursor = conn.cursor(dictionary=True)
 
         cursor.execute("""
@@ -69,13 +149,55 @@ def get_device_by_id(device_id):
 
         result = cursor.fetchone()
         cursor.close()
-        conn.close()
 
-        return result
+    return result
+
+def fetch_all_devices():
+    """Load every device row from the database"""
+    with get_connection('fetch_all_devices') as conn:
+        cursor = conn.cursor(dictionary=True)
+
+        cursor.execute("""
+            SELECT device_id, serial_id, site_id, timezone
+            FROM camera.camera
+        """)
+
+        results = cursor.fetchall()
+        cursor.close()
+
+    return results
+
+if not SPAWNED_WORKER:
+    device_registry = DeviceRegistry(
+        fetch_device,
+        fetch_all_devices,
+        ttl=DEVICE_CACHE_TTL,
+        negative_ttl=DEVICE_CACHE_NEGATIVE_TTL,
+        invalidation_file=DEVICE_CACHE_INVALIDATION_FILE
+    )
+
+def get_device_by_id(device_id):
+    """Get device information (cached, see DeviceRegistry)"""
+    try:
+        return device_registry.get(device_id)
     except Exception as e:
         logger.error(f"Error fetching device {device_id}: {e}")
         return None
 
+def warm_caches():
+    """Preload caches and start background monitors when a server process starts"""
+    try:
+        device_registry.warm()
+    except Exception as e:
+        logger.error(f"Device cache warm-up failed: {e}")
+    disk_monitor.start()
+
+def stop_workers():
+    """Stop the resize worker processes when a server process exits"""
+    resize_pool.shutdown()
+
+token_verifier = TokenVerifier(TOKEN_KEYWORD, TOKEN_VALIDITY_MINUTES)
+
 def get_current_time_window():
     """
     Get current 30-minute time window
@@ -94,38 +216,20 @@ def create_token(device_id, keyword=TOKEN_KEYWORD):
     Where MM is rounded to nearest 30-minute interval (00 or 30)
     """
     time_window = get_current_time_window()
+    token = token_for_window(device_id, keyword, time_window)
 
-    # Format: YYYY-MM-DD-HH-MM (e.g., "2025-10-24-14-30")
-    time_str = time_window.strftime("%Y-%m-%d-%H-%M")
-
-    # Concatenate the device_id, keyword, and time window
-    raw_string = f"{device_id}-{keyword}-{time_str}"
-
-    # Generate a hash of the concatenated string
-    token = hashlib.sha256(raw_string.encode()).hexdigest()
-
-    logger.debug(f"Generated token for device {device_id} at time window {time_str}: {token}")
+    logger.debug(f"Generated token for device {device_id} at time window {time_window:%Y-%m-%d-%H-%M}: {token}")
     return token, time_window
 
 def validate_token(device_id, provided_token):
     """
     Validate the provided token against the calculated token
     Checks current 30-minute window and previous window (grace period)
+    Expected tokens are cached per window (see TokenVerifier)
     """
-    # Check current time window
-    current_token, current_window = create_token(device_id)
-    if provided_token == current_token:
-        logger.info(f"Token validated for device {device_id} (current window)")
-        return True
-
-    # Check previous time window (grace period for requests near boundary)
-    previous_window = get_current_time_window() - timedelta(minutes=TOKEN_VALIDITY_MINUTES)
-    previous_time_str = previous_window.strftime("%Y-%m-%d-%H-%M")
-    raw_string = f"{device_id}-{TOKEN_KEYWORD}-{previous_time_str}"
-    previous_token = hashlib.sha256(raw_string.encode()).hexdigest()
-
-    if provided_token == previous_token:
-        logger.info(f"Token validated for device {device_id} (previous window - grace period)")
+    matched = token_verifier.verify(device_id, provided_token)
+    if matched:
+        logger.debug(f"Token validated for device {device_id} ({matched} window)")
         return True
 
     logger.warning(f"Token validation failed for device {device_id}")
@@ -134,15 +238,7 @@ def validate_token(device_id, provided_token):
 def is_safe_path(file_path):
     """Check if the requested path is within allowed directories"""
     try:
-        # Resolve to absolute path
-        abs_path = Path(file_path).resolve()
-
-        # Check if path is within any allowed base path
-        for base_path in ALLOWED_BASE_PATHS:
-            if str(abs_path).startswith(str(Path(base_path).resolve())):
-                return True
-
-        return False
+        return path_resolver.is_safe(file_path)
     except Exception as e:
         logger.error(f"Error checking path safety: {e}")
         return False
@@ -151,6 +247,53 @@ def is_allowed_extension(file_path):
     """Check if file has an allowed image extension"""
     return Path(file_path).suffix.lower() in ALLOWED_EXTENSIONS
 
+def decode_path_param(encoded_path, encoding):
+    """
+    Decode a 'path' parameter (URL or base64 encoded) into a file path
+    Shortened paths starting with a digit get '/mnt/disk' prepended
+    Raises ValueError for invalid base64
+    """
+    if encoding == 'base64':
+        try:
+            file_path = base64.b64decode(encoded_path).decode('utf-8')
+        except Exception as e:
+            raise ValueError(str(e)) from e
+        logger.info(f"Decoded base64 path: {file_path}")
+    else:
+        # URL decode
+        file_path = unquote(encoded_path)
+        logger.info(f"Decoded URL path: {file_path}")
+
+    # Handle shortened path format: if path starts with a digit, prepend '/mnt/disk'
+    if file_path and file_path[0].isdigit():
+        file_path = f"/mnt/disk{file_path}"
+        logger.info(f"Converted shortened path to: {file_path}")
+
+    return file_path
+
+def locate_image(file_path):
+    """
+    Apply security checks and find the file, falling back to the mirror disk
+    Returns tuple (file_path, file_stat, error_message, status_code); file_path
+    is the resolved path, or None on error
+    """
+    resolved_path, file_stat, reason = path_resolver.resolve(file_path)
+
+    # Security checks
+    if reason == 'denied':
+        logger.warning(f"Unsafe path requested: {file_path}")
+        return None, None, 'Access denied', 403
+
+    if not is_allowed_extension(file_path):
+        logger.warning(f"Invalid file extension requested: {file_path}")
+        return None, None, 'Invalid file type', 400
+
+    if reason == 'missing':
+        logger.warning(f"File not found: {file_path} (mirror disk checked if any)")
+        return None, None, 'File not found', 404
+
+    return resolved_path, file_stat, None, None
+
 def parse_size_parameter(size_str):
     """
     Parse size parameter in format 'WIDTHxHEIGHT' (e.g., '640x480')
@@ -175,53 +318,151 @@ def parse_size_parameter(size_str):
     except (ValueError, AttributeError):
         return None
 
-def resize_image(image_path, target_size):
+def get_output_format(image_path):
     """
-    Resize image to target size
-    Returns BytesIO object containing resized image
+    Determine output format for a resized image based on original extension
+    Returns tuple (PIL format, mimetype), defaulting to JPEG
     """
-    try:
-        # Open image
-        with Image.open(image_path) as img:
-            # Convert to RGB if necessary (for transparency)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create white background
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize image maintaining aspect ratio
-            img.thumbnail(target_size, Image.Resampling.LANCZOS)
-            
-            # Save to BytesIO
-            img_io = BytesIO()
-            
-            # Determine format based on original extension
-            ext = Path(image_path).suffix.lower()
-            if ext in ['.jpg', '.jpeg']:
-                img.save(img_io, 'JPEG', quality=85, optimize=True)
-                mimetype = 'image/jpeg'
-            elif ext == '.png':
-                img.save(img_io, 'PNG', optimize=True)
-                mimetype = 'image/png'
-            elif ext == '.webp':
-                img.save(img_io, 'WEBP', quality=85)
-                mimetype = 'image/webp'
-            else:
-                # Default to JPEG for other formats
-                img.save(img_io, 'JPEG', quality=85, optimize=True)
-                mimetype = 'image/jpeg'
-            
-            img_io.seek(0)
-            return img_io, mimetype
-            
-    except Exception as e:
-        logger.error(f"Error resizing image {image_path}: {e}")
-        raise
+    ext = Path(image_path).suffix.lower()
+    if ext == '.png':
+        return 'PNG', 'image/png'
+    if ext == '.webp':
+        return 'WEBP', 'image/webp'
+    return 'JPEG', 'image/jpeg'
+
+def mimetype_for_format(output_format):
+    """Mimetype of a resized image encoded as output_format"""
+    return FORMAT_MIMETYPES.get(output_format, 'image/jpeg')
+
+def preferred_formats():
+    """
+    Negotiable formats the client lists explicitly in Accept, in server preference order
+    A bare */* does not count, so clients that never mention WebP/AVIF keep getting JPEG
+    """
+    accepted = {value for value, quality in request.accept_mimetypes if quality > 0}
+    return [fmt for fmt in NEGOTIATE_FORMATS if FORMAT_MIMETYPES[fmt] in accepted]
+
+def negotiate_output_format(image_path, preferred):
+    """
+    Output format for a resized image: the first preferred format, else the source-based default
+    Returns tuple (PIL format, mimetype)
+    """
+    if preferred:
+        return preferred[0], mimetype_for_format(preferred[0])
+    return get_output_format(image_path)
+
+def find_derivative(file_path, target_size):
+    """
+    Look for a derivative pre-built at ingest that covers target_size
+    Returns tuple (path, exact): an exact one (same size) is sent as is, in the
+    source format it was built in, rather than re-encoded into a negotiated
+    format; otherwise it is a much smaller source to resize from;
+    (None, False) when none exists
+    """
+    for size in DERIVATIVE_SIZES:
+        if size[0] < target_size[0] or size[1] < target_size[1]:
+            continue
+        path, _, reason = path_resolver.resolve(str(derivative_path(file_path, size)))
+        if reason is None:
+            return path, size == tuple(target_size)
+    return None, False
+
+def submit_resize(file_path, target_size, output_format, cache_key):
+    """
+    Queue a resize in the worker pool, sharing the job with identical
+    in-flight requests. The first requester stores the result in the cache.
+    Returns a future with the encoded bytes; raises PoolSaturated when the queue is full
+    """
+    future, created = resize_pool.submit(cache_key, render_resized, file_path, target_size, output_format)
+    if created:
+        future.add_done_callback(
+            lambda f: resize_cache.put(cache_key, f.result(), output_format)
+            if not f.cancelled() and f.exception() is None else None
+        )
+    return future
+
+def resize_in_pool(file_path, target_size, output_format, cache_key):
+    """Resize in the worker pool and wait for the encoded bytes"""
+    future = submit_resize(file_path, target_size, output_format, cache_key)
+    return future.result(timeout=RESIZE_TIMEOUT)
+
+def image_etag(file_stat, target_size=None, output_format=None):
+    """
+    Strong ETag for an image response from (inode, size, mtime, requested size, format)
+    """
+    variant = f"{target_size[0]}x{target_size[1]}" if target_size else 'original'
+    if output_format:
+        variant += f"-{output_format.lower()}"
+    return f"{file_stat.st_ino:x}-{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}-{variant}"
+
+def is_not_modified(etag, mtime):
+    """Check If-None-Match (preferred) or If-Modified-Since against the file"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return int(mtime) <= request.if_modified_since.timestamp()
+    return False
+
+def with_cache_headers(response, etag, mtime, vary=None):
+    """
+    Attach validators and the long-lived Cache-Control to an image response
+    vary names a request header the body depends on (Accept for negotiated formats)
+    """
+    response.set_etag(etag)
+    if vary:
+        response.vary.add(vary)
+    response.last_modified = datetime.fromtimestamp(int(mtime), timezone.utc)
+    response.headers['Cache-Control'] = IMAGE_CACHE_CONTROL
+    return response
+
+def range_applies(etag, mtime):
+    """If-Range: only honor Range when the client's copy is still current"""
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return int(mtime) == int(if_range.date.timestamp())
+    return True
+
+def send_original(file_path, file_stat, mimetype, etag):
+    """
+    Response for an original image: the whole file (200), one byte range (206)
+    or several as multipart/byteranges (206); 416 if no range fits the file
+    """
+    length = file_stat.st_size
+    ranges = None
+    if range_applies(etag, file_stat.st_mtime):
+        ranges = parse_ranges(request.headers.get('Range'), length)
+
+    if ranges == []:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f"bytes */{length}"
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    use_sendfile = ORIGINAL_SENDFILE and can_sendfile(request.environ)
+
+    if ranges is None or ranges == [(0, length)]:
+        response = Response(file_body(request.environ, file_path, 0, length, use_sendfile),
+                            mimetype=mimetype, direct_passthrough=True)
+        response.content_length = length
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        logger.info(f"Serving bytes {start}-{end - 1}/{length} of {file_path}")
+        response = Response(file_body(request.environ, file_path, start, end, use_sendfile),
+                            status=206, mimetype=mimetype, direct_passthrough=True)
+        response.content_length = end - start
+        response.headers['Content-Range'] = content_range(start, end, length)
+    else:
+        logger.info(f"Serving {len(ranges)} byte ranges of {file_path}")
+        body, content_length, boundary = multipart_body(file_path, ranges, length, mimetype)
+        response = Response(body, status=206, direct_passthrough=True,
+                            content_type=f"multipart/byteranges; boundary={boundary}")
+        response.content_length = content_length
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers.set('Content-Disposition', 'inline', filename=Path(file_path).name)
+    return with_cache_headers(response, etag, file_stat.st_mtime)
 
 @app.route('/image', methods=['GET'])
 def get_image():
@@ -282,109 +523,335 @@ def get_image():
         logger.info(f"Authenticated request from device {device_id} (serial: {device['serial_id']})")
 
         # Decode path based on encoding type
-        if encoding == 'base64':
-            try:
-                file_path = base64.b64decode(encoded_path).decode('utf-8')
-                logger.info(f"Decoded base64 path: {file_path}")
-            except Exception as e:
-                logger.error(f"Failed to decode base64 path: {e}")
-                return jsonify({'error': 'Invalid base64 encoding'}), 400
-        else:
-            # URL decode
-            file_path = unquote(encoded_path)
-            logger.info(f"Decoded URL path: {file_path}")
+        try:
+            file_path = decode_path_param(encoded_path, encoding)
+        except ValueError as e:
+            logger.error(f"Failed to decode base64 path: {e}")
+            return jsonify({'error': 'Invalid base64 encoding'}), 400
 
-        # Handle shortened path format: if path starts with a digit, prepend '/mnt/disk'
-        if file_path and file_path[0].isdigit():
-            file_path = f"/mnt/disk{file_path}"
-            logger.info(f"Converted shortened path to: {file_path}")
-
-        # Security checks
-        if not is_safe_path(file_path):
-            logger.warning(f"Unsafe path requested: {file_path}")
-            return jsonify({'error': 'Access denied'}), 403
-
-        if not is_allowed_extension(file_path):
-            logger.warning(f"Invalid file extension requested: {file_path}")
-            return jsonify({'error': 'Invalid file type'}), 400
-
-        # Check if file exists, with fallback disk logic
-        if not os.path.isfile(file_path):
-            # If file doesn't exist on disk1, try disk2
-            if '/mnt/disk1/' in file_path:
-                fallback_path = file_path.replace('/mnt/disk1/', '/mnt/disk2/')
-                if os.path.isfile(fallback_path):
-                    logger.info(f"File not found on disk1, using disk2: {fallback_path}")
-                    file_path = fallback_path
-                else:
-                    logger.warning(f"File not found: {file_path} (also checked disk2)")
-                    return jsonify({'error': 'File not found'}), 404
-            # If file doesn't exist on disk3, try disk4
-            elif '/mnt/disk3/' in file_path:
-                fallback_path = file_path.replace('/mnt/disk3/', '/mnt/disk4/')
-                if os.path.isfile(fallback_path):
-                    logger.info(f"File not found on disk3, using disk4: {fallback_path}")
-                    file_path = fallback_path
-                else:
-                    logger.warning(f"File not found: {file_path} (also checked disk4)")
-                    return jsonify({'error': 'File not found'}), 404
-            else:
-                logger.warning(f"File not found: {file_path}")
-                return jsonify({'error': 'File not found'}), 404
+        requested_path = file_path
+        file_path, file_stat, error, status = locate_image(file_path)
+        if error:
+            return jsonify({'error': error}), status
 
-        # Get file size for logging
-        file_size = os.path.getsize(file_path)
+        # The resolver's single stat gives size for logging plus the validators for caching
+        file_size = file_stat.st_size
 
         # Parse size parameter if provided
         target_size = parse_size_parameter(size_param)
-        
+
+        # Resized images are encoded in the best format the client accepts
+        output_format = None
+        vary = None
+        derivative, exact = None, False
         if target_size:
-            # Resize the image
-            logger.info(f"Resizing image to {target_size[0]}x{target_size[1]} for device {device_id}: {file_path}")
-            try:
-                img_io, mimetype = resize_image(file_path, target_size)
-                resized_size = img_io.getbuffer().nbytes
-                logger.info(f"Serving resized image to device {device_id}: {file_path} (original: {file_size:,} bytes, resized: {resized_size:,} bytes)")
-                
-                return send_file(
-                    img_io,
+            output_format, _ = negotiate_output_format(file_path, preferred_formats())
+            vary = 'Accept'
+            # An ingest-time derivative of exactly this size is served in its own format, not re-encoded
+            derivative, exact = find_derivative(file_path, target_size)
+            if exact:
+                output_format = get_output_format(derivative)[0]
+
+        # Snapshot files never change once written, so answer revalidation without opening them
+        etag = image_etag(file_stat, target_size, output_format)
+        if is_not_modified(etag, file_stat.st_mtime):
+            logger.info(f"Not modified for device {device_id}: {file_path}")
+            return with_cache_headers(Response(status=304), etag, file_stat.st_mtime, vary)
+
+        if target_size:
+            # Serve the ingest-time derivative when it is exactly what was asked for
+            if exact:
+                logger.info(f"Serving pre-built derivative to device {device_id}: {derivative}")
+                return with_cache_headers(send_file(
+                    derivative,
+                    mimetype=mimetype_for_format(output_format),
+                    as_attachment=False,
+                    download_name=Path(file_path).name,
+                    etag=False
+                ), etag, file_stat.st_mtime, vary)
+
+            cache_key = make_cache_key(file_path, file_stat, target_size, output_format)
+
+            # Serve pre-encoded buffer if this derivative was already produced
+            cached = resize_cache.get(cache_key)
+            if cached:
+                data, mimetype = cached
+                logger.info(f"Serving cached resized image to device {device_id}: {file_path} ({target_size[0]}x{target_size[1]}, {len(data):,} bytes)")
+                return with_cache_headers(send_file(
+                    BytesIO(data),
                     mimetype=mimetype,
                     as_attachment=False,
                     download_name=Path(file_path).name
-                )
+                ), etag, file_stat.st_mtime, vary)
+
+            # Resize in the worker pool, from the closest larger derivative if there is one
+            source = derivative or file_path
+            logger.info(f"Resizing image to {target_size[0]}x{target_size[1]} for device {device_id}: {source}")
+            try:
+                data = resize_in_pool(source, target_size, output_format, cache_key)
+            except PoolSaturated as e:
+                logger.warning(f"Resize pool saturated, rejecting request for {file_path}: {e}")
+                response = jsonify({'error': 'Server busy, retry later'})
+                response.headers['Retry-After'] = str(RESIZE_RETRY_AFTER)
+                return response, 503
+            except FuturesTimeoutError:
+                logger.error(f"Resize timed out after {RESIZE_TIMEOUT}s: {file_path}")
+                return jsonify({'error': 'Resize timed out'}), 504
             except Exception as e:
                 logger.error(f"Error resizing image: {e}")
                 return jsonify({'error': 'Failed to resize image'}), 500
+
+            logger.info(f"Serving resized image to device {device_id}: {file_path} (original: {file_size:,} bytes, resized: {len(data):,} bytes)")
+            return with_cache_headers(send_file(
+                BytesIO(data),
+                mimetype=mimetype_for_format(output_format),
+                as_attachment=False,
+                download_name=Path(file_path).name
+            ), etag, file_stat.st_mtime, vary)
         else:
             # Return original image
             # Determine mimetype
             ext = Path(file_path).suffix.lower()
-            mimetype_map = {
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.gif': 'image/gif',
-                '.bmp': 'image/bmp',
-                '.tiff': 'image/tiff',
-                '.tif': 'image/tiff',
-                '.webp': 'image/webp'
-            }
-            mimetype = mimetype_map.get(ext, 'application/octet-stream')
+            mimetype = MIMETYPES.get(ext, 'application/octet-stream')
 
             logger.info(f"Serving original image to device {device_id}: {file_path} ({file_size:,} bytes)")
 
-            # Send file
-            return send_file(
-                file_path,
-                mimetype=mimetype,
-                as_attachment=False,
-                download_name=Path(file_path).name
-            )
+            # Send file (honors Range / If-Range)
+            try:
+                return send_original(file_path, file_stat, mimetype, etag)
+            except FileNotFoundError:
+                # Removed since it was cached; look it up afresh next time
+                path_resolver.forget(requested_path)
+                logger.warning(f"File disappeared: {file_path}")
+                return jsonify({'error': 'File not found'}), 404
 
     except Exception as e:
         logger.error(f"Error serving image: {e}", exc_info=True)
         return jsonify({'error': 'Internal server error'}), 500
 
+def fetch_snapshot_paths(device_id, snapshot_ids):
+    """Map snapshot IDs belonging to device_id to their stored file paths"""
+    with get_connection('fetch_snapshot_paths') as conn:
+        cursor = conn.cursor(dictionary=True)
+
+        cursor.execute(f"""
+            SELECT id, url
+            FROM camera.snapshot
+            WHERE device_id = %s AND id IN ({','.join(['%s'] * len(snapshot_ids))})
+        """, (device_id, *snapshot_ids))
+
+        rows = cursor.fetchall()
+        cursor.close()
+
+    return {row['id']: row['url'] for row in rows}
+
+def multipart_part(boundary, label, status, data, mimetype):
+    """Encode one part of a multipart/mixed batch response"""
+    headers = (
+        f"--{boundary}\r\n"
+        f"Content-Type: {mimetype}\r\n"
+        f"Content-Location: {quote(label, safe='/:')}\r\n"
+        f"X-Status: {status}\r\n"
+        f"Content-Length: {len(data)}\r\n\r\n"
+    )
+    return headers.encode() + data + b"\r\n"
+
+def error_part(boundary, label, status, message):
+    return multipart_part(boundary, label, status, json.dumps({'error': message}).encode(), 'application/json')
+
+def stream_batch(items, target_size, boundary, preferred=()):
+    """
+    Yield multipart parts for items [(label, file_path, file_stat, error, status), ...] in order
+    Resizes are fanned out to the worker pool ahead of the part being written,
+    at most BATCH_MAX_IN_FLIGHT at a time; the remaining items (and any that do
+    not fit in a full pool) are queued until earlier ones finish.
+    Resized parts use the first of preferred formats (see preferred_formats())
+    """
+    jobs = [None] * len(items)  # Future, (data, mimetype), or Exception
+    formats = [None] * len(items)
+    deferred = deque(i for i, item in enumerate(items) if item[1] and target_size)
+    in_flight = set()  # this batch's resizes still running in the pool
+
+    def submit(i):
+        file_path, file_stat = items[i][1:3]
+        derivative, exact = find_derivative(file_path, target_size)
+        if exact:
+            with open(derivative, 'rb') as f:
+                jobs[i] = (f.read(), get_output_format(derivative)[1])
+            return
+
+        output_format, _ = negotiate_output_format(file_path, preferred)
+        cache_key = make_cache_key(file_path, file_stat, target_size, output_format)
+        formats[i] = output_format
+        cached = resize_cache.get(cache_key)
+        if cached:
+            jobs[i] = cached
+        else:
+            jobs[i] = submit_resize(derivative or file_path, target_size, output_format, cache_key)
+            in_flight.add(jobs[i])
+
+    def top_up():
+        in_flight.difference_update([job for job in in_flight if job.done()])
+        while deferred and len(in_flight) < BATCH_MAX_IN_FLIGHT:
+            try:
+                submit(deferred[0])
+            except PoolSaturated:
+                return
+            except Exception as e:
+                jobs[deferred[0]] = e
+            deferred.popleft()
+
+    for i, (label, file_path, file_stat, error, status) in enumerate(items):
+        top_up()
+
+        if error:
+            yield error_part(boundary, label, status, error)
+            continue
+
+        try:
+            if not target_size:
+                with open(file_path, 'rb') as f:
+                    data = f.read()
+                mimetype = MIMETYPES.get(Path(file_path).suffix.lower(), 'application/octet-stream')
+            else:
+                # Pool busy with other requests: wait for room
+                deadline = time.monotonic() + RESIZE_TIMEOUT
+                while jobs[i] is None:
+                    if time.monotonic() > deadline:
+                        raise PoolSaturated('no room in resize pool')
+                    time.sleep(0.05)
+                    top_up()
+
+                job = jobs[i]
+                if isinstance(job, Exception):
+                    raise job
+                if isinstance(job, Future):
+                    data, mimetype = job.result(timeout=RESIZE_TIMEOUT), mimetype_for_format(formats[i])
+                else:
+                    data, mimetype = job
+        except PoolSaturated:
+            logger.warning(f"Resize pool saturated, skipping batch item {file_path}")
+            yield error_part(boundary, label, 503, 'Server busy, retry later')
+            continue
+        except FuturesTimeoutError:
+            logger.error(f"Resize timed out after {RESIZE_TIMEOUT}s: {file_path}")
+            yield error_part(boundary, label, 504, 'Resize timed out')
+            continue
+        except Exception as e:
+            logger.error(f"Error preparing batch item {file_path}: {e}")
+            yield error_part(boundary, label, 500, 'Failed to read or resize image')
+            continue
+
+        yield multipart_part(boundary, label, 200, data, mimetype)
+
+    yield f"--{boundary}--\r\n".encode()
+
+@app.route('/images/batch', methods=['POST'])
+def get_images_batch():
+    """
+    Serve many images in one multipart/mixed response, authenticating once
+
+    JSON body:
+    - device_id: Device ID (required)
+    - token: Authentication token (required)
+    - paths: List of image paths, encoded as for /image
+    - snapshot_ids: List of camera.snapshot IDs of this device (alternative or in addition to paths)
+    - encoding: 'base64' or 'url' for paths (default: 'url')
+    - size: Optional size in format 'WIDTHxHEIGHT' applied to every image
+
+    Each part has Content-Location (the requested path, or 'snapshot:<id>') and
+    X-Status (200, or an error status with a JSON error body), in request order.
+
+    Example:
+    - curl -X POST http://localhost/images/batch -H 'Content-Type: application/json' \\
+        -d '{"device_id": 122, "token": "abc123...", "size": "150x84", "paths": ["1/media/LAWA_01_WTP/Area_1/1729701045123.jpg"]}'
+    """
+    try:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({'error': 'Expected JSON body'}), 400
+
+        device_id = body.get('device_id')
+        provided_token = body.get('token')
+        encoding = body.get('encoding', 'url')
+        paths = body.get('paths') or []
+        snapshot_ids = body.get('snapshot_ids') or []
+
+        if not device_id:
+            return jsonify({'error': 'Missing device_id parameter'}), 401
+
+        if not provided_token or not isinstance(provided_token, str):
+            return jsonify({'error': 'Missing token parameter'}), 401
+
+        try:
+            device_id = int(device_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid device_id'}), 400
+
+        if not isinstance(paths, list) or not isinstance(snapshot_ids, list):
+            return jsonify({'error': 'paths and snapshot_ids must be lists'}), 400
+
+        item_count = len(paths) + len(snapshot_ids)
+        if item_count == 0:
+            return jsonify({'error': 'Missing paths or snapshot_ids'}), 400
+        if item_count > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'Too many images (max {BATCH_MAX_ITEMS})'}), 400
+
+        target_size = None
+        if body.get('size'):
+            target_size = parse_size_parameter(str(body['size']))
+            if not target_size:
+                return jsonify({'error': 'Invalid size parameter'}), 400
+
+        # Authenticate once for the whole batch
+        if not validate_token(device_id, provided_token):
+            logger.warning(f"Invalid or expired token for device {device_id}")
+            return jsonify({'error': 'Invalid or expired token'}), 403
+
+        device = get_device_by_id(device_id)
+        if not device:
+            logger.warning(f"Device not found: {device_id}")
+            return jsonify({'error': 'Device not found'}), 404
+
+        items = []
+        for encoded_path in paths:
+            label = str(encoded_path)
+            try:
+                file_path = decode_path_param(label, encoding)
+            except ValueError:
+                items.append((label, None, None, 'Invalid base64 encoding', 400))
+                continue
+            items.append((label, *locate_image(file_path)))
+
+        if snapshot_ids:
+            try:
+                snapshot_ids = [int(sid) for sid in snapshot_ids]
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid snapshot_ids'}), 400
+
+            snapshot_paths = fetch_snapshot_paths(device_id, snapshot_ids)
+            for sid in snapshot_ids:
+                label = f"snapshot:{sid}"
+                if sid not in snapshot_paths:
+                    items.append((label, None, None, 'Snapshot not found', 404))
+                    continue
+                items.append((label, *locate_image(snapshot_paths[sid])))
+
+        size_label = f"{target_size[0]}x{target_size[1]}" if target_size else 'original'
+        logger.info(f"Serving batch of {len(items)} images ({size_label}) to device {device_id} (serial: {device['serial_id']})")
+
+        boundary = uuid.uuid4().hex
+        response = Response(
+            stream_batch(items, target_size, boundary, preferred_formats()),
+            mimetype=f'multipart/mixed; boundary={boundary}'
+        )
+        response.vary.add('Accept')
+        return response
+
+    except Exception as e:
+        logger.error(f"Error serving image batch: {e}", exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/generate-token', methods=['GET'])
 def generate_token():
     """
@@ -433,7 +900,61 @@ def generate_token():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'image-server'}), 200
+    return jsonify({
+        'status': 'healthy',
+        'service': 'image-server',
+        'resize_cache': resize_cache.info(),
+        'resize_pool': resize_pool.info(),
+        'device_cache': device_registry.info(),
+        'token_cache': token_verifier.info(),
+        'paths': path_resolver.info(),
+        'placements': placement_map.info(),
+        'disks': disk_monitor.info(),
+        'db': pool_stats()
+    }), 200
+
+def is_loopback(address):
+    """True for 127.0.0.0/8, ::1 and IPv4-mapped loopback addresses"""
+    try:
+        ip = ipaddress.ip_address(address or '')
+    except ValueError:
+        return False
+    mapped = getattr(ip, 'ipv4_mapped', None)
+    return (mapped or ip).is_loopback
+
+@app.route('/devices/invalidate', methods=['POST'])
+def invalidate_devices():
+    """
+    Drop cached device rows after camera.camera changes
+    Only accepted from the server host itself (403 otherwise)
+
+    Query parameters:
+    - device_id: Device to invalidate (optional, all devices if omitted)
+
+    Example:
+    - curl -X POST 'http://localhost/devices/invalidate?device_id=122'
+    """
+    if not is_loopback(request.remote_addr):
+        logger.warning(f"Rejected device cache invalidation from {request.remote_addr}")
+        return jsonify({'error': 'Only allowed from localhost'}), 403
+
+    try:
+        device_id = request.args.get('device_id')
+
+        if device_id:
+            try:
+                device_id = int(device_id)
+            except ValueError:
+                return jsonify({'error': 'Invalid device_id'}), 400
+
+        device_registry.invalidate(device_id)
+        logger.info(f"Device cache invalidated for {device_id if device_id else 'all devices'}")
+
+        return jsonify({'invalidated': device_id if device_id else 'all'}), 200
+
+    except Exception as e:
+        logger.error(f"Error invalidating device cache: {e}", exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/encode', methods=['GET'])
 def encode_path():
@@ -457,7 +978,6 @@ def encode_path():
         result = {'original': file_path}
 
         if encoding in ['url', 'both']:
-            from urllib.parse import quote
             result['url_encoded'] = quote(file_path, safe='')
 
         if encoding in ['base64', 'both']:
@@ -571,7 +1091,15 @@ if __name__ == '__main__':
     logger.info(f"Token validity: {TOKEN_VALIDITY_MINUTES} minutes")
     logger.info(f"Allowed base paths: {ALLOWED_BASE_PATHS}")
     logger.info(f"Token keyword: {TOKEN_KEYWORD}")
+    logger.info(f"Resize policy: {RESIZE_POLICY} (JPEG draft decode: {JPEG_DRAFT_DECODE})")
+    logger.info(f"Resize pool: {RESIZE_POOL_WORKERS} processes, max {RESIZE_POOL_MAX_PENDING} pending")
+    logger.info(f"Resize cache: {RESIZE_CACHE_DIR} ({RESIZE_CACHE_MAX_BYTES:,} bytes disk, {RESIZE_CACHE_HOT_BYTES:,} bytes hot)")
     logger.info("=" * 60)
 
+    warm_caches()
+
     # Run on port 8080 (no sudo needed)
-    app.run(host='0.0.0.0', port=port, debug=False)
+    try:
+        app.run(host='0.0.0.0', port=port, debug=False)
+    finally:
+        stop_workers()
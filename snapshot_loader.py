@@ -0,0 +1,483 @@
+"""
+Bulk loading of camera.snapshot rows
+
+Rows from every folder of a run are buffered and written together:
+
+- multi-row INSERT statements (ROWS_PER_STATEMENT rows each) for normal runs
+- LOAD DATA LOCAL INFILE from a streamed temporary CSV into a temporary
+  staging table, then one INSERT ... SELECT, for large flushes (backfills)
+
+Each write also raises the newest snapshot time per (device_id, area_name)
+in camera.snapshot_watermark, in the same transaction, so readers get the
+watermarks without aggregating the snapshot table (writes to other tables,
+e.g. the benchmark's scratch copy, leave the watermarks alone).
+
+preset_id (the 1-based alphabetical position of area_name among the
+device's areas) comes from camera.device_area_preset and is written with
+the row. Only when a device gains an area are its areas renumbered, and
+only that device's snapshot rows whose number changed are updated.
+
+When camera.snapshot has a unique key on (device_id, time, area_name),
+writes are upserts (INSERT ... ON DUPLICATE KEY UPDATE), so loading the
+same image twice is harmless and images older than the device's newest
+snapshot are no longer skipped. Add the key once with:
+
+    python snapshot_loader.py --add-unique-key
+"""
+import os
+import time
+import logging
+import argparse
+import tempfile
+import mysql.connector
+from db import get_connection, get_direct_connection
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TABLE = 'camera.snapshot'
+SNAPSHOT_COLUMNS = ('device_id', 'time', 'url', 'thumbnail', 'timezone', 'area_name',
+                    'created_by', 'updated_by', 'preset_id', 'adjusted_start_time')
+UNIQUE_KEY_COLUMNS = ('device_id', 'time', 'area_name')
+UNIQUE_KEY_NAME = 'uq_snapshot_device_time_area'
+# A re-loaded image keeps its row; only where the file is and whether it has a thumbnail change
+UPDATE_ON_DUPLICATE = ("url = VALUES(url), thumbnail = GREATEST(thumbnail, VALUES(thumbnail)), "
+                       "preset_id = VALUES(preset_id)")
+
+ROWS_PER_STATEMENT = int(os.environ.get('SNAPSHOT_ROWS_PER_STATEMENT', 1000))
+# Flushes with at least this many rows go through LOAD DATA LOCAL INFILE (0 disables it)
+LOAD_DATA_MIN_ROWS = int(os.environ.get('SNAPSHOT_LOAD_DATA_MIN_ROWS', 20000))
+# Errors meaning the server or client refuses LOAD DATA LOCAL INFILE (ER_NOT_ALLOWED_COMMAND,
+# ER_CLIENT_LOCAL_FILES_DISABLED, CR_LOAD_DATA_LOCAL_INFILE_REJECTED); anything else only fails one flush
+LOCAL_INFILE_REFUSED_ERRNOS = {1148, 3948, 2068}
+# Rows buffered before a run flushes early instead of at the end
+BUFFER_ROWS = int(os.environ.get('SNAPSHOT_BUFFER_ROWS', 100000))
+
+WATERMARK_TABLE = 'camera.snapshot_watermark'
+WATERMARK_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+        device_id INT NOT NULL,
+        area_name VARCHAR(255) NOT NULL,
+        last_time BIGINT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (device_id, area_name)
+    )
+"""
+RAISE_WATERMARK = "last_time = GREATEST(last_time, VALUES(last_time))"
+
+PRESET_TABLE = 'camera.device_area_preset'
+# A device's row here is locked while its areas are numbered
+DEVICE_TABLE = 'camera.camera'
+PRESET_SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {PRESET_TABLE} (
+        device_id INT NOT NULL,
+        area_name VARCHAR(255) NOT NULL,
+        preset_id INT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (device_id, area_name)
+    )
+"""
+
+_upsert_supported = {}
+_watermark_ready = False
+_preset_ready = False
+
+
+def _split_table(table):
+    schema, _, name = table.rpartition('.')
+    return schema or None, name
+
+
+def has_unique_key(cursor, table=SNAPSHOT_TABLE):
+    """True if table has a unique index on exactly (device_id, time, area_name)"""
+    schema, name = _split_table(table)
+    cursor.execute("""
+        SELECT INDEX_NAME, GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX)
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = COALESCE(%s, DATABASE()) AND TABLE_NAME = %s AND NON_UNIQUE = 0
+        GROUP BY INDEX_NAME
+    """, (schema, name))
+    return any(set(columns.split(',')) == set(UNIQUE_KEY_COLUMNS) for _, columns in cursor.fetchall())
+
+
+def upsert_supported(table=SNAPSHOT_TABLE):
+    """Whether writes to table can be upserts (checked once per process)"""
+    if table not in _upsert_supported:
+        with get_connection('snapshot_schema') as conn:
+            cursor = conn.cursor()
+            _upsert_supported[table] = has_unique_key(cursor, table)
+            cursor.close()
+        if not _upsert_supported[table]:
+            logger.warning(f"{table} has no unique key on ({', '.join(UNIQUE_KEY_COLUMNS)}); "
+                           f"plain inserts, duplicates avoided by the area watermarks only "
+                           f"(run: python snapshot_loader.py --add-unique-key)")
+    return _upsert_supported[table]
+
+
+def ensure_watermark_table():
+    """
+    Create camera.snapshot_watermark if needed (once per process)
+    An empty table is seeded from camera.snapshot with a one-off GROUP BY
+    """
+    global _watermark_ready
+    if _watermark_ready:
+        return
+    with get_connection('snapshot_watermark') as conn:
+        cursor = conn.cursor()
+        cursor.execute(WATERMARK_SCHEMA)
+        cursor.execute(f"SELECT 1 FROM {WATERMARK_TABLE} LIMIT 1")
+        if cursor.fetchone() is None:
+            logger.info(f"Seeding {WATERMARK_TABLE} from {SNAPSHOT_TABLE} (one-off)")
+            cursor.execute(f"""
+                INSERT INTO {WATERMARK_TABLE} (device_id, area_name, last_time)
+                SELECT device_id, COALESCE(area_name, ''), MAX(time) FROM {SNAPSHOT_TABLE}
+                GROUP BY device_id, COALESCE(area_name, '')
+                ON DUPLICATE KEY UPDATE {RAISE_WATERMARK}
+            """)
+            conn.commit()
+        cursor.close()
+    _watermark_ready = True
+
+
+def load_watermarks():
+    """Newest snapshot time per device and area: {device_id: {area_name: ms}}"""
+    ensure_watermark_table()
+    watermarks = {}
+    with get_connection('snapshot_watermark') as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT device_id, area_name, last_time FROM {WATERMARK_TABLE}")
+        for device_id, area_name, last_time in cursor.fetchall():
+            watermarks.setdefault(device_id, {})[area_name] = last_time
+        cursor.close()
+    return watermarks
+
+
+def update_watermarks(cursor, rows):
+    """Raise the watermarks for the (device_id, area_name) pairs in rows; run before the commit"""
+    newest = {}
+    for row in rows:
+        key = (row['device_id'], row['area_name'] or '')
+        if row['time'] > newest.get(key, -1):
+            newest[key] = row['time']
+    if not newest:
+        return
+    cursor.execute(
+        f"INSERT INTO {WATERMARK_TABLE} (device_id, area_name, last_time) VALUES "
+        + ', '.join(['(%s, %s, %s)'] * len(newest))
+        + f" ON DUPLICATE KEY UPDATE {RAISE_WATERMARK}",
+        [value for (device_id, area_name), last_time in newest.items()
+         for value in (device_id, area_name, last_time)])
+
+
+def renumber_snapshots(cursor, device_id, area_name, preset_id):
+    """Give one device area's snapshot rows a new preset_id; returns rows changed"""
+    cursor.execute(f"UPDATE {SNAPSHOT_TABLE} SET preset_id = %s "
+                   f"WHERE device_id = %s AND area_name = %s AND preset_id <> %s",
+                   (preset_id, device_id, area_name, preset_id))
+    return cursor.rowcount
+
+
+def rebuild_presets():
+    """
+    Rebuild camera.device_area_preset from the areas in camera.snapshot (one full scan)
+    Snapshot rows are rewritten only where their preset_id differs. Returns rows changed.
+    """
+    logger.info(f"Rebuilding {PRESET_TABLE} from {SNAPSHOT_TABLE}")
+    renumbered = 0
+    with get_connection('snapshot_presets') as conn:
+        cursor = conn.cursor()
+        cursor.execute(PRESET_SCHEMA)
+        cursor.execute(f"""
+            SELECT device_id, area_name,
+                   ROW_NUMBER() OVER (PARTITION BY device_id ORDER BY area_name) AS preset_id
+            FROM (SELECT DISTINCT device_id, area_name FROM {SNAPSHOT_TABLE} WHERE area_name IS NOT NULL) a
+        """)
+        presets = cursor.fetchall()
+        cursor.execute(f"SELECT device_id, area_name, preset_id FROM {PRESET_TABLE}")
+        current = {(device_id, area_name): preset_id for device_id, area_name, preset_id in cursor.fetchall()}
+        cursor.execute(f"DELETE FROM {PRESET_TABLE}")
+        for i in range(0, len(presets), ROWS_PER_STATEMENT):
+            chunk = presets[i:i + ROWS_PER_STATEMENT]
+            cursor.execute(f"INSERT INTO {PRESET_TABLE} (device_id, area_name, preset_id) VALUES "
+                           + ', '.join(['(%s, %s, %s)'] * len(chunk)),
+                           [value for preset in chunk for value in preset])
+        for device_id, area_name, preset_id in presets:
+            if current.get((device_id, area_name)) != preset_id:
+                renumbered += renumber_snapshots(cursor, device_id, area_name, preset_id)
+        conn.commit()
+        cursor.close()
+    logger.info(f"{PRESET_TABLE}: {len(presets)} device areas, {renumbered} snapshot rows renumbered")
+    return renumbered
+
+
+def ensure_preset_table():
+    """Create camera.device_area_preset if needed (once per process), seeding an empty one"""
+    global _preset_ready
+    if _preset_ready:
+        return
+    with get_connection('snapshot_presets') as conn:
+        cursor = conn.cursor()
+        cursor.execute(PRESET_SCHEMA)
+        cursor.execute(f"SELECT 1 FROM {PRESET_TABLE} LIMIT 1")
+        empty = cursor.fetchone() is None
+        cursor.close()
+    if empty:
+        rebuild_presets()
+    _preset_ready = True
+
+
+def _add_areas(cursor, device_id, area_names):
+    """
+    Register new areas of one device and renumber its areas alphabetically
+    Returns ({area_name: preset_id}, snapshot rows renumbered)
+    """
+    # Lock the device first: FOR UPDATE on the mapping locks nothing while the device has no areas yet,
+    # so concurrent writers adding its first areas would otherwise both insert them
+    cursor.execute(f"SELECT device_id FROM {DEVICE_TABLE} WHERE device_id = %s FOR UPDATE", (device_id,))
+    cursor.fetchall()
+    cursor.execute(f"SELECT area_name FROM {PRESET_TABLE} WHERE device_id = %s FOR UPDATE", (device_id,))
+    known = {area_name for (area_name,) in cursor.fetchall()}
+    new = sorted(set(area_names) - known)
+    if new:
+        # IGNORE: a writer that got in first (e.g. for a device with no camera row) already added them
+        cursor.execute(f"INSERT IGNORE INTO {PRESET_TABLE} (device_id, area_name, preset_id) VALUES "
+                       + ', '.join(['(%s, %s, 0)'] * len(new)),
+                       [value for area_name in new for value in (device_id, area_name)])
+        logger.info(f"Device {device_id}: new area(s) {', '.join(new)}")
+
+    # ORDER BY in the database, so the order follows the column collation like the old renumbering;
+    # a locking read sees the latest committed areas, including any the INSERT IGNORE skipped
+    cursor.execute(f"SELECT area_name, preset_id FROM {PRESET_TABLE} WHERE device_id = %s "
+                   f"ORDER BY area_name FOR UPDATE", (device_id,))
+    presets, renumbered = {}, 0
+    for number, (area_name, preset_id) in enumerate(cursor.fetchall(), 1):
+        presets[area_name] = number
+        if preset_id != number:
+            cursor.execute(f"UPDATE {PRESET_TABLE} SET preset_id = %s WHERE device_id = %s AND area_name = %s",
+                           (number, device_id, area_name))
+            # preset_id 0 marks an area inserted just now, which has no snapshot rows yet
+            if preset_id:
+                renumbered += renumber_snapshots(cursor, device_id, area_name, number)
+    return presets, renumbered
+
+
+def assign_presets(cursor, rows):
+    """
+    Fill in preset_id on rows (in the caller's transaction, before the rows are written)
+    Returns the number of existing snapshot rows renumbered because a device gained an area
+    """
+    areas = {}
+    for row in rows:
+        if row['area_name'] is not None:
+            areas.setdefault(row['device_id'], set()).add(row['area_name'])
+    if not areas:
+        return 0
+
+    presets = {device_id: {} for device_id in areas}
+    cursor.execute(f"SELECT device_id, area_name, preset_id FROM {PRESET_TABLE} WHERE device_id IN ("
+                   + ', '.join(['%s'] * len(areas)) + ")", list(areas))
+    for device_id, area_name, preset_id in cursor.fetchall():
+        presets[device_id][area_name] = preset_id
+
+    renumbered = 0
+    for device_id, area_names in areas.items():
+        if not area_names <= presets[device_id].keys():
+            presets[device_id], changed = _add_areas(cursor, device_id, area_names)
+            renumbered += changed
+    for row in rows:
+        if row['area_name'] is not None:
+            row['preset_id'] = presets[row['device_id']][row['area_name']]
+    if renumbered:
+        logger.info(f"Renumbered presets of {renumbered} existing snapshot rows")
+    return renumbered
+
+
+def insert_statement(table, row_count, upsert):
+    placeholders = '(' + ', '.join(['%s'] * len(SNAPSHOT_COLUMNS)) + ')'
+    query = (f"INSERT INTO {table} ({', '.join(SNAPSHOT_COLUMNS)}) VALUES "
+             + ', '.join([placeholders] * row_count))
+    if upsert:
+        query += f" ON DUPLICATE KEY UPDATE {UPDATE_ON_DUPLICATE}"
+    return query
+
+
+def insert_rows(cursor, rows, table=SNAPSHOT_TABLE, upsert=True, rows_per_statement=ROWS_PER_STATEMENT):
+    """Write row dicts with multi-row INSERTs; returns (affected rows, statements)"""
+    affected = statements = 0
+    for i in range(0, len(rows), rows_per_statement):
+        chunk = rows[i:i + rows_per_statement]
+        params = [row[column] for row in chunk for column in SNAPSHOT_COLUMNS]
+        cursor.execute(insert_statement(table, len(chunk), upsert), params)
+        affected += cursor.rowcount
+        statements += 1
+    return affected, statements
+
+
+def load_data_field(value):
+    """
+    One field of the LOAD DATA file: \\N for NULL, numbers bare, anything else quoted
+    and backslash-escaped, so the string 'NULL' is not read back as SQL NULL
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, (int, float)):
+        return str(value)
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+    return f'"{text}"'
+
+
+def load_rows(rows, table=SNAPSHOT_TABLE, upsert=True):
+    """
+    Write row dicts through LOAD DATA LOCAL INFILE into a staging table, then INSERT ... SELECT
+    Returns affected rows. Raises mysql.connector.Error, with an errno in
+    LOCAL_INFILE_REFUSED_ERRNOS if local infile is disabled.
+    """
+    columns = ', '.join(SNAPSHOT_COLUMNS)
+    with get_direct_connection('snapshot_load_data', allow_local_infile=True) as conn, \
+            tempfile.NamedTemporaryFile('w', newline='', suffix='.csv', prefix='snapshots-') as csv_file:
+        cursor = conn.cursor()
+        if table == SNAPSHOT_TABLE:
+            assign_presets(cursor, rows)
+        for row in rows:
+            csv_file.write(','.join(load_data_field(row[column]) for column in SNAPSHOT_COLUMNS) + '\n')
+        csv_file.flush()
+
+        cursor.execute(f"CREATE TEMPORARY TABLE snapshot_stage LIKE {table}")
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE %s INTO TABLE snapshot_stage
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY '\\\\'
+            LINES TERMINATED BY '\\n' ({columns})
+        """, (csv_file.name,))
+        query = f"INSERT INTO {table} ({columns}) SELECT {columns} FROM snapshot_stage"
+        if upsert:
+            query += f" ON DUPLICATE KEY UPDATE {UPDATE_ON_DUPLICATE}"
+        cursor.execute(query)
+        affected = cursor.rowcount
+        if table == SNAPSHOT_TABLE:
+            cursor.execute(f"""
+                INSERT INTO {WATERMARK_TABLE} (device_id, area_name, last_time)
+                SELECT device_id, COALESCE(area_name, ''), MAX(time) FROM snapshot_stage
+                GROUP BY device_id, COALESCE(area_name, '')
+                ON DUPLICATE KEY UPDATE {RAISE_WATERMARK}
+            """)
+        conn.commit()
+        cursor.close()
+    return affected
+
+
+class SnapshotLoader:
+    """
+    Buffers snapshot rows across folders and writes them in bulk
+
+    Usage:
+        loader = SnapshotLoader()
+        loader.add(rows, on_loaded=lambda: ...)  # called once the rows are committed
+        loader.flush()
+    """
+
+    def __init__(self, table=SNAPSHOT_TABLE, rows_per_statement=ROWS_PER_STATEMENT,
+                 load_data_min_rows=LOAD_DATA_MIN_ROWS, label='snapshot_loader'):
+        self.table = table
+        self.rows_per_statement = rows_per_statement
+        self.load_data_min_rows = load_data_min_rows
+        self.label = label
+        self.rows = []
+        self.callbacks = []
+        self.load_data_available = load_data_min_rows > 0
+        self.stats = {'rows': 0, 'affected': 0, 'statements': 0, 'load_data_rows': 0, 'seconds': 0.0}
+
+    @property
+    def upsert(self):
+        return upsert_supported(self.table)
+
+    @property
+    def full(self):
+        return len(self.rows) >= BUFFER_ROWS
+
+    def add(self, rows, on_loaded=None):
+        self.rows.extend(rows)
+        if on_loaded is not None:
+            self.callbacks.append(on_loaded)
+
+    def flush(self):
+        """Write everything buffered in one transaction (or one LOAD DATA); returns affected rows"""
+        rows, callbacks = self.rows, self.callbacks
+        self.rows, self.callbacks = [], []
+        if not rows:
+            for callback in callbacks:
+                callback()
+            return 0
+
+        upsert = self.upsert
+        if self.table == SNAPSHOT_TABLE:
+            ensure_watermark_table()
+            ensure_preset_table()
+        started = time.perf_counter()
+        affected = None
+        if self.load_data_available and len(rows) >= self.load_data_min_rows:
+            try:
+                affected = load_rows(rows, self.table, upsert)
+                self.stats['load_data_rows'] += len(rows)
+            except mysql.connector.Error as e:
+                if e.errno in LOCAL_INFILE_REFUSED_ERRNOS:
+                    self.load_data_available = False
+                    logger.warning(f"LOAD DATA LOCAL INFILE unavailable ({e}), using multi-row inserts")
+                else:
+                    logger.warning(f"LOAD DATA LOCAL INFILE failed ({e}), using multi-row inserts for this flush")
+        if affected is None:
+            with get_connection(self.label) as conn:
+                cursor = conn.cursor()
+                if self.table == SNAPSHOT_TABLE:
+                    assign_presets(cursor, rows)
+                affected, statements = insert_rows(cursor, rows, self.table, upsert, self.rows_per_statement)
+                if self.table == SNAPSHOT_TABLE:
+                    update_watermarks(cursor, rows)
+                conn.commit()
+                cursor.close()
+            self.stats['statements'] += statements
+
+        elapsed = time.perf_counter() - started
+        self.stats['rows'] += len(rows)
+        self.stats['affected'] += affected
+        self.stats['seconds'] += elapsed
+        logger.info(f"Loaded {len(rows)} snapshot rows in {elapsed:.2f}s "
+                    f"({len(rows) / elapsed if elapsed else 0:.0f} rows/sec, {affected} affected)")
+        for callback in callbacks:
+            callback()
+        return affected
+
+
+def add_unique_key(table=SNAPSHOT_TABLE):
+    """Add the (device_id, time, area_name) unique key, refusing while duplicate rows exist"""
+    with get_connection('snapshot_schema') as conn:
+        cursor = conn.cursor()
+        if has_unique_key(cursor, table):
+            logger.info(f"{table} already has a unique key on ({', '.join(UNIQUE_KEY_COLUMNS)})")
+            return True
+        key = ', '.join(UNIQUE_KEY_COLUMNS)
+        cursor.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} GROUP BY {key} HAVING COUNT(*) > 1) d")
+        duplicates = cursor.fetchone()[0]
+        if duplicates:
+            logger.error(f"{duplicates} ({key}) combination(s) occur more than once in {table}; "
+                         f"remove the duplicates before adding the key")
+            return False
+        logger.info(f"Adding unique key {UNIQUE_KEY_NAME} ({key}) to {table}")
+        cursor.execute(f"ALTER TABLE {table} ADD UNIQUE KEY {UNIQUE_KEY_NAME} ({key})")
+        cursor.close()
+    _upsert_supported.pop(table, None)
+    return True
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--add-unique-key', action='store_true',
+                        help=f"Add the ({', '.join(UNIQUE_KEY_COLUMNS)}) unique key to {SNAPSHOT_TABLE}")
+    parser.add_argument('--rebuild-presets', action='store_true',
+                        help=f"Rebuild {PRESET_TABLE} from {SNAPSHOT_TABLE} and fix preset_id where it differs")
+    args = parser.parse_args()
+    if args.add_unique_key:
+        raise SystemExit(0 if add_unique_key() else 1)
+    if args.rebuild_presets:
+        rebuild_presets()
+        raise SystemExit(0)
+    parser.print_help()
@@ -0,0 +1,117 @@
+import email.parser
+
+import pytest
+
+import byte_ranges
+from byte_ranges import parse_ranges, multipart_body, content_range, file_body, read_chunks, can_sendfile
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', [(0, 100)]),
+    ('bytes=100-', [(100, 1000)]),
+    ('bytes=-100', [(900, 1000)]),
+    ('bytes=-5000', [(0, 1000)]),  # suffix longer than the file
+    ('bytes=900-5000', [(900, 1000)]),  # end clamped to the file
+    ('bytes=0-0', [(0, 1)]),
+    ('bytes=999-999', [(999, 1000)]),
+    ('bytes=500-599,0-99', [(0, 100), (500, 600)]),  # sorted
+    ('bytes=0-99,50-149', [(0, 150)]),  # overlapping
+    ('bytes=0-99,100-199', [(0, 200)]),  # adjacent
+    ('bytes=0-499,100-199', [(0, 500)]),  # contained
+    ('bytes=-100,0-99', [(0, 100), (900, 1000)]),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_ranges(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=1000-1999', 'bytes=5000-6000,2000-'])
+def test_unsatisfiable_ranges(header):
+    assert parse_ranges(header, 1000) == []
+
+
+def test_any_satisfiable_range_is_kept():
+    assert parse_ranges('bytes=5000-6000,0-9', 1000) == [(0, 10)]
+
+
+def test_empty_file_has_no_satisfiable_range():
+    assert parse_ranges('bytes=0-', 0) == []
+    assert parse_ranges('bytes=-10', 0) == []
+
+
+@pytest.mark.parametrize('header', [None, '', 'items=0-10', 'bytes=abc', 'bytes=10-5', 'bytes 0-10'])
+def test_whole_file_for_missing_or_invalid_header(header):
+    assert parse_ranges(header, 1000) is None
+
+
+def test_too_many_ranges_serves_whole_file():
+    header = 'bytes=' + ','.join(f"{i * 10}-{i * 10 + 1}" for i in range(byte_ranges.MAX_RANGES + 1))
+    assert parse_ranges(header, 1000) is None
+    header = 'bytes=' + ','.join(f"{i * 10}-{i * 10 + 1}" for i in range(byte_ranges.MAX_RANGES))
+    assert len(parse_ranges(header, 1000)) == byte_ranges.MAX_RANGES
+
+
+def test_content_range():
+    assert content_range(0, 100, 1000) == 'bytes 0-99/1000'
+    assert content_range(999, 1000, 1000) == 'bytes 999-999/1000'
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / 'original.jpg'
+    path.write_bytes(bytes(range(256)) * 40)
+    return path
+
+
+def test_multipart_framing(data_file):
+    data = data_file.read_bytes()
+    ranges = [(0, 10), (100, 300), (10000, 10240)]
+    body, content_length, boundary = multipart_body(str(data_file), ranges, len(data), 'image/jpeg')
+    payload = b''.join(body)
+    assert len(payload) == content_length
+    assert payload.startswith(f"--{boundary}\r\n".encode())
+    assert payload.endswith(f"\r\n--{boundary}--\r\n".encode())
+
+    message = email.parser.BytesParser().parsebytes(
+        f"Content-Type: multipart/byteranges; boundary={boundary}\r\n\r\n".encode() + payload)
+    parts = message.get_payload()
+    assert len(parts) == len(ranges)
+    for part, (start, end) in zip(parts, ranges):
+        assert part['Content-Type'] == 'image/jpeg'
+        assert part['Content-Range'] == content_range(start, end, len(data))
+        assert part.get_payload(decode=True) == data[start:end]
+
+
+def test_multipart_chunks_large_ranges(data_file, monkeypatch):
+    monkeypatch.setattr(byte_ranges, 'CHUNK_SIZE', 7)
+    data = data_file.read_bytes()
+    body, content_length, _ = multipart_body(str(data_file), [(0, 50), (60, 200)], len(data), 'image/jpeg')
+    assert len(b''.join(body)) == content_length
+
+
+def test_streamed_body_reads_only_the_range(data_file, monkeypatch):
+    monkeypatch.setattr(byte_ranges, 'CHUNK_SIZE', 16)
+    data = data_file.read_bytes()
+    chunks = list(file_body({}, str(data_file), 100, 150, use_sendfile=False))
+    assert b''.join(chunks) == data[100:150]
+    assert max(map(len, chunks)) <= 16
+
+
+def test_read_chunks_stops_at_eof_and_closes(data_file):
+    file_obj = open(data_file, 'rb')
+    file_obj.seek(10200)
+    assert b''.join(read_chunks(file_obj, 1000)) == data_file.read_bytes()[10200:]
+    assert file_obj.closed
+
+
+def test_sendfile_body_is_positioned_wrapper(data_file):
+    wrapped = []
+    environ = {'wsgi.file_wrapper': lambda file_obj, size: wrapped.append(file_obj) or file_obj}
+    body = file_body(environ, str(data_file), 300, 400, use_sendfile=True)
+    assert body.tell() == 300
+    body.close()
+
+
+def test_can_sendfile_only_under_gunicorn():
+    assert can_sendfile({'wsgi.file_wrapper': object, 'SERVER_SOFTWARE': 'gunicorn/23.0.0'})
+    assert not can_sendfile({'wsgi.file_wrapper': object, 'SERVER_SOFTWARE': 'Werkzeug/3.1'})
+    assert not can_sendfile({'SERVER_SOFTWARE': 'gunicorn/23.0.0'})
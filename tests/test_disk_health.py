@@ -0,0 +1,53 @@
+from disk_health import DiskHealthMonitor, percentile
+
+
+def make_monitor(tmp_path):
+    primary, mirror = tmp_path / 'disk1', tmp_path / 'disk2'
+    primary.mkdir()
+    mirror.mkdir()
+    return DiskHealthMonitor({str(primary): str(mirror)}), str(primary), str(mirror)
+
+
+def test_percentile():
+    assert percentile([], 50) == 0.0
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 99) == 4
+
+
+def test_cached_lookups_do_not_hide_a_slow_primary(tmp_path):
+    monitor, primary, mirror = make_monitor(tmp_path)
+    # The busy primary answers lookups from the dentry cache, but its uncached probes are slow
+    for _ in range(200):
+        monitor.record(primary, 0.00001)
+    for _ in range(10):
+        monitor._probes[primary].append(400.0)
+        monitor._probes[mirror].append(8.0)
+
+    assert monitor.update_routes()
+    assert monitor.route(primary) == mirror
+    summary = monitor.info()['disks'][primary]
+    assert summary['p50_ms'] == 400.0 and summary['passive_p95_ms'] < 1
+
+
+def test_passive_errors_mark_disk_unhealthy(tmp_path):
+    monitor, primary, mirror = make_monitor(tmp_path)
+    for _ in range(10):
+        monitor.record(primary, 0.001, ok=False)
+        monitor.record(mirror, 0.001)
+    monitor.update_routes()
+    assert monitor.route(primary) == mirror
+    assert monitor.info()['disks'][primary]['error_rate'] == 1.0
+
+
+def test_failed_probe_routes_to_mirror(tmp_path):
+    monitor, primary, mirror = make_monitor(tmp_path)
+    (tmp_path / 'disk1' / 'a.jpg').write_bytes(b'x' * 100)
+    assert monitor.probe(primary)
+    assert len(monitor._probes[primary]) == 1 and not monitor._samples[primary]
+
+    (tmp_path / 'disk1' / 'a.jpg').unlink()
+    (tmp_path / 'disk1').rmdir()
+    assert not monitor.probe(primary)
+    assert len(monitor._probes[primary]) == 1
+    monitor.update_routes()
+    assert monitor.route(primary) == mirror
@@ -0,0 +1,155 @@
+import io
+import struct
+
+import pytest
+from PIL import Image
+
+from exif_time import (jpeg_datetime_original, pillow_datetime_original, parse_exif_datetime,
+                       datetime_originals, EXIF_IFD_POINTER, DATETIME_ORIGINAL)
+
+TAKEN = '2024:03:05 14:07:09'
+
+
+def tiff_block(order='<', value=TAKEN, value_type=2, pointer=True):
+    """TIFF block: IFD0 with an Exif IFD pointer, Exif IFD with DateTimeOriginal"""
+    raw = value.encode('ascii') + b'\x00'
+    header = (b'II' if order == '<' else b'MM') + struct.pack(order + 'HI', 42, 8)
+    ifd0 = struct.pack(order + 'H', 1)
+    exif_offset = 8 + 2 + 12 + 4
+    tag = EXIF_IFD_POINTER if pointer else 0x010F  # Make, when there is no Exif IFD
+    ifd0 += struct.pack(order + 'HHII', tag, 4, 1, exif_offset) + struct.pack(order + 'I', 0)
+    data_offset = exif_offset + 2 + 12 + 4
+    if len(raw) <= 4:
+        field = raw.ljust(4, b'\x00')
+        data = b''
+    else:
+        field = struct.pack(order + 'I', data_offset)
+        data = raw
+    exif = (struct.pack(order + 'H', 1) + struct.pack(order + 'HHI', DATETIME_ORIGINAL, value_type, len(raw))
+            + field + struct.pack(order + 'I', 0))
+    return header + ifd0 + exif + data
+
+
+def segment(code, payload):
+    return bytes([0xFF, code]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def base_jpeg():
+    buf = io.BytesIO()
+    Image.new('RGB', (16, 16), (90, 120, 150)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def jpeg(tmp_path, *segments, name='image.jpg'):
+    """A decodable JPEG with segments inserted right after SOI"""
+    data = base_jpeg()
+    path = tmp_path / name
+    path.write_bytes(data[:2] + b''.join(segments) + data[2:])
+    return path
+
+
+def exif_app1(tiff):
+    return segment(0xE1, b'Exif\x00\x00' + tiff)
+
+
+XMP_APP1 = segment(0xE1, b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta xmlns:x="adobe:ns:meta/"/>')
+
+
+@pytest.mark.parametrize('order', ['<', '>'])
+def test_byte_orders(tmp_path, order):
+    path = jpeg(tmp_path, exif_app1(tiff_block(order)))
+    assert jpeg_datetime_original(path) == TAKEN
+    assert pillow_datetime_original(path) == TAKEN
+
+
+def test_pillow_written_exif(tmp_path):
+    exif = Image.Exif()
+    exif.get_ifd(EXIF_IFD_POINTER)[DATETIME_ORIGINAL] = TAKEN
+    path = tmp_path / 'pillow.jpg'
+    Image.new('RGB', (16, 16)).save(path, 'JPEG', exif=exif)
+    assert jpeg_datetime_original(path) == pillow_datetime_original(path) == TAKEN
+
+
+def test_xmp_app1_before_exif(tmp_path):
+    path = jpeg(tmp_path, XMP_APP1, exif_app1(tiff_block('>')))
+    assert jpeg_datetime_original(path) == pillow_datetime_original(path) == TAKEN
+
+
+def test_fill_bytes_between_segments(tmp_path):
+    path = jpeg(tmp_path, b'\xff\xff\xff', segment(0xE0, b'JFIF\x00\x01\x01'), b'\xff\xff',
+                exif_app1(tiff_block()))
+    assert jpeg_datetime_original(path) == TAKEN
+
+
+@pytest.mark.parametrize('order', ['<', '>'])
+def test_inline_value(tmp_path, order):
+    # count <= 4: the value sits in the entry itself instead of at an offset
+    path = jpeg(tmp_path, exif_app1(tiff_block(order, value='201')))
+    assert jpeg_datetime_original(path) == pillow_datetime_original(path) == '201'
+
+
+def test_no_exif(tmp_path):
+    path = jpeg(tmp_path)
+    assert jpeg_datetime_original(path) is None
+    assert pillow_datetime_original(path) is None
+
+
+def test_only_xmp(tmp_path):
+    path = jpeg(tmp_path, XMP_APP1)
+    assert jpeg_datetime_original(path) is None
+    assert pillow_datetime_original(path) is None
+
+
+def test_no_exif_ifd_pointer(tmp_path):
+    path = jpeg(tmp_path, exif_app1(tiff_block(pointer=False)))
+    assert jpeg_datetime_original(path) is None
+    assert pillow_datetime_original(path) is None
+
+
+def test_wrong_value_type_ignored(tmp_path):
+    path = jpeg(tmp_path, exif_app1(tiff_block(value_type=7)))  # UNDEFINED, not ASCII
+    assert jpeg_datetime_original(path) is None
+
+
+@pytest.mark.parametrize('cut', [1, 3, 5, 20, 40, 60])
+def test_truncated_file(tmp_path, cut):
+    full = jpeg(tmp_path, exif_app1(tiff_block())).read_bytes()
+    start = full.index(b'Exif')
+    path = tmp_path / 'truncated.jpg'
+    path.write_bytes(full[:start + cut])
+    assert jpeg_datetime_original(path) is None
+
+
+def test_corrupt_segment_length(tmp_path):
+    path = tmp_path / 'corrupt.jpg'
+    path.write_bytes(b'\xff\xd8\xff\xe0\x00\x00' + b'\x00' * 32)
+    assert jpeg_datetime_original(path) is None
+
+
+@pytest.mark.parametrize('data', [b'', b'GIF89a', b'\xff\xd8', b'\xff\xd8\x00\x00'])
+def test_not_a_jpeg(tmp_path, data):
+    path = tmp_path / 'bad.jpg'
+    path.write_bytes(data)
+    assert jpeg_datetime_original(path) is None
+
+
+def test_missing_file(tmp_path):
+    assert jpeg_datetime_original(tmp_path / 'missing.jpg') is None
+
+
+def test_parse_exif_datetime():
+    assert parse_exif_datetime(TAKEN) == parse_exif_datetime(TAKEN + '\x00')
+    assert parse_exif_datetime(TAKEN) % 1000 == 0
+    assert parse_exif_datetime('0000:00:00 00:00:00') is None
+    assert parse_exif_datetime(None) is None
+
+
+def test_datetime_originals_dispatch(tmp_path):
+    jpg = jpeg(tmp_path, exif_app1(tiff_block('>')))
+    webp = tmp_path / 'image.webp'
+    exif = Image.Exif()
+    exif.get_ifd(EXIF_IFD_POINTER)[DATETIME_ORIGINAL] = TAKEN
+    Image.new('RGB', (16, 16)).save(webp, 'WEBP', exif=exif)
+    bare = jpeg(tmp_path, name='bare.jpg')
+    values = datetime_originals([jpg, webp, bare], use_exiftool=False)
+    assert values == {jpg: TAKEN, webp: TAKEN, bare: None}
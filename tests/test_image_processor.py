@@ -0,0 +1,99 @@
+import os
+import time
+import importlib
+import threading
+from pathlib import Path
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from scheduler import Scheduler
+
+
+@pytest.fixture(scope='module')
+def image_processor(tmp_path_factory):
+    """image_processor imported with its log file under a temporary directory"""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('image_processor'))
+    try:
+        module = importlib.import_module('image_processor')
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+class CrashingPool:
+    """Stands in for DerivativePool: any chunk holding a 'crash' image breaks the pool"""
+
+    def __init__(self):
+        self.isolated = []
+
+    def run(self, chunk):
+        if any('crash' in img_path.name for img_path, _ in chunk):
+            raise BrokenProcessPool('worker died')
+        return [(img_path, True, 100) for img_path, _ in chunk]
+
+    def run_isolated(self, chunk):
+        self.isolated.append(chunk)
+        return [(img_path, False, 0) for img_path, _ in chunk]
+
+
+@pytest.fixture
+def pipeline(image_processor, monkeypatch):
+    """A FolderPipeline with just what the cpu stage needs: a scheduler and a fake pool"""
+    monkeypatch.setattr(image_processor, 'record_derivatives', lambda manifest, img_path, sizes: None)
+    pipeline = object.__new__(image_processor.FolderPipeline)
+    pipeline.scheduler = Scheduler({'cpu': 2})
+    pipeline.pool = CrashingPool()
+    pipeline.lock = threading.Lock()
+    pipeline.derivatives = {'images': 0, 'done': 0, 'failed': 0, 'bytes': 0}
+    pipeline.derive_started = pipeline.last_progress = time.perf_counter()
+    pipeline.derived = []
+    pipeline._derived = pipeline.derived.append
+    yield pipeline
+    pipeline.scheduler.close()
+
+
+def run_chunks(image_processor, pipeline, chunks):
+    job = image_processor.FolderJob(Path('/mnt/disk1/CAM_WTP'), 'CAM', {'device_id': 7}, False)
+    job.sizes = {img_path: [(640, 480)] for chunk in chunks for img_path, _ in chunk}
+    job.started = time.perf_counter()
+    job.pending = len(chunks)
+    for chunk in chunks:
+        pipeline._submit('cpu', job, pipeline._derive, chunk)
+    pipeline.scheduler.join()
+    return job
+
+
+def images(*names):
+    return [(Path('/mnt/disk1/CAM_WTP') / name, [(640, 480)]) for name in names]
+
+
+def test_chunks_complete_the_job_once(image_processor, pipeline):
+    job = run_chunks(image_processor, pipeline, [images('1.jpg', '2.jpg'), images('3.jpg')])
+    assert pipeline.derived == [job]
+    assert (job.created, job.failed, job.pending) == (3, 0, 0)
+    assert pipeline.derivatives['done'] == 3
+
+
+def test_crashing_worker_retries_images_one_at_a_time(image_processor, pipeline):
+    chunks = [images('1.jpg', 'crash.jpg', '3.jpg'), images('4.jpg', '5.jpg')]
+    job = run_chunks(image_processor, pipeline, chunks)
+    # The job completes exactly once, after every retried image is accounted for
+    assert pipeline.derived == [job]
+    assert job.pending == 0
+    assert (job.created, job.failed) == (4, 1)
+    assert [[img_path.name for img_path, _ in chunk] for chunk in pipeline.pool.isolated] == [['crash.jpg']]
+    assert pipeline.derivatives['done'] == 5
+    assert pipeline.derivatives['failed'] == 1
+
+
+def test_unexpected_error_fails_only_its_chunk(image_processor, pipeline, monkeypatch):
+    def run(chunk):
+        if chunk[0][0].name == 'bad.jpg':
+            raise OSError('disk gone')
+        return [(img_path, True, 100) for img_path, _ in chunk]
+    monkeypatch.setattr(pipeline.pool, 'run', run)
+    job = run_chunks(image_processor, pipeline, [images('bad.jpg', 'x.jpg'), images('ok.jpg')])
+    assert pipeline.derived == [job]
+    assert (job.created, job.failed, job.pending) == (1, 2, 0)
@@ -0,0 +1,175 @@
+import os
+
+import pytest
+
+from folder_manifest import FolderManifest, STATUS_FLAGS
+from ingest_state import IngestState, is_pending
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg'}
+
+
+def parse_timestamp(name):
+    stem = name.split('.')[0]
+    return int(stem) if stem.isdigit() else None
+
+
+def touch(path, data=b'jpeg'):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def bump_mtime(folder):
+    """Move a folder's mtime forward, as a new file would on a filesystem with coarse timestamps"""
+    st = os.stat(folder)
+    os.utime(folder, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    root = tmp_path / 'disk1' / 'CAM_WTP'
+    touch(root / 'Area_1' / '1700000000000.jpg')
+    touch(root / 'Area_1' / '1700000001000.jpg')
+    touch(root / 'Area_2' / '1700000002000.jpg')
+    touch(root / 'Area_1' / 'thumbnail' / '1700000000000.jpg')
+    return root
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = IngestState(str(tmp_path / 'state' / 'ingest_state.db'))
+    yield state
+    state.close()
+
+
+def scan(folder, state=None):
+    previous = state.load(folder, IMAGE_EXTENSIONS, parse_timestamp) if state is not None else None
+    return FolderManifest.scan(folder, IMAGE_EXTENSIONS, parse_timestamp, previous=previous)
+
+
+def ingest(manifest):
+    """Mark every file as fully ingested"""
+    for entry in manifest.files.values():
+        manifest.mark(entry, *STATUS_FLAGS)
+
+
+def test_first_scan_lists_everything(folder):
+    manifest = scan(folder)
+    assert manifest.file_count() == 4
+    assert manifest.listed_dirs == 4
+    assert manifest.changed == set(manifest.files)
+    assert {entry.area for entry in manifest.images()} == {'Area_1', 'Area_2'}
+    assert len(manifest.images()) == 3
+
+
+def test_save_and_load_round_trip(folder, state):
+    manifest = scan(folder)
+    ingest(manifest)
+    assert state.save(manifest) == 0
+    loaded = state.load(folder, IMAGE_EXTENSIONS, parse_timestamp)
+    assert set(loaded.files) == set(manifest.files)
+    assert loaded.dir_mtimes == manifest.dir_mtimes
+    for path, entry in loaded.files.items():
+        assert all(getattr(entry, flag) for flag in STATUS_FLAGS)
+        assert entry.inode == manifest.files[path].inode
+    assert state.load(folder.parent / 'other', IMAGE_EXTENSIONS, parse_timestamp) is None
+
+
+def test_unchanged_folder_is_settled_and_not_listed(folder, state):
+    manifest = scan(folder)
+    ingest(manifest)
+    state.save(manifest)
+    assert state.is_settled(folder)
+
+    rescanned = scan(folder, state)
+    assert rescanned.listed_dirs == 0
+    assert rescanned.changed == set()
+    assert rescanned.removed == set()
+    assert set(rescanned.files) == set(manifest.files)
+
+
+def test_new_file_lists_only_its_folder(folder, state):
+    manifest = scan(folder)
+    ingest(manifest)
+    state.save(manifest)
+
+    new = touch(folder / 'Area_2' / '1700000003000.jpg')
+    bump_mtime(folder / 'Area_2')
+    assert not state.is_settled(folder)
+
+    rescanned = scan(folder, state)
+    assert rescanned.listed_dirs == 1
+    assert rescanned.changed == {new}
+    assert not rescanned.files[new].thumbnailed
+    # Files of the listed folder that were already known keep their status
+    assert rescanned.files[folder / 'Area_2' / '1700000002000.jpg'].inserted
+    assert state.save(rescanned) == 1
+    assert not state.is_settled(folder)
+
+
+def test_removed_file(folder, state):
+    manifest = scan(folder)
+    ingest(manifest)
+    state.save(manifest)
+
+    gone = folder / 'Area_1' / '1700000001000.jpg'
+    gone.unlink()
+    bump_mtime(folder / 'Area_1')
+    rescanned = scan(folder, state)
+    assert rescanned.removed == {gone}
+    state.save(rescanned)
+    assert gone not in state.load(folder, IMAGE_EXTENSIONS, parse_timestamp).files
+
+
+def test_copied_but_not_mirrored_is_pending(folder, state):
+    manifest = scan(folder)
+    ingest(manifest)
+    entry = manifest.files[folder / 'Area_1' / '1700000000000.jpg']
+    entry.mirrored = False
+    assert is_pending(manifest, entry)
+    assert state.save(manifest) == 1
+    assert not state.is_settled(folder)
+
+    # The next run reuses the stored entry, still pending, without listing the folder
+    rescanned = scan(folder, state)
+    assert rescanned.listed_dirs == 0
+    assert not rescanned.files[entry.path].mirrored
+    rescanned.mark(rescanned.files[entry.path], 'mirrored')
+    assert state.save(rescanned) == 0
+    assert state.is_settled(folder)
+
+
+def test_pending_rules(folder):
+    manifest = scan(folder)
+    ingest(manifest)
+    image = manifest.files[folder / 'Area_1' / '1700000000000.jpg']
+    thumbnail = manifest.files[folder / 'Area_1' / 'thumbnail' / '1700000000000.jpg']
+    assert not is_pending(manifest, image)
+    image.inserted = False
+    assert is_pending(manifest, image)
+    thumbnail.thumbnailed = thumbnail.inserted = False
+    assert not is_pending(manifest, thumbnail)
+    thumbnail.copied = False
+    assert is_pending(manifest, thumbnail)
+
+
+def test_missing_subfolder_is_not_settled(folder, state):
+    manifest = scan(folder)
+    ingest(manifest)
+    state.save(manifest)
+    for path in (folder / 'Area_2').iterdir():
+        path.unlink()
+    (folder / 'Area_2').rmdir()
+    assert not state.is_settled(folder)
+
+
+def test_rename_dir_moves_entries(folder):
+    manifest = scan(folder)
+    manifest.changed.clear()
+    manifest.rename_dir(folder / 'Area_1', folder / 'Gate')
+    moved = folder / 'Gate' / '1700000000000.jpg'
+    assert moved in manifest.files
+    assert manifest.files[moved].area == 'Gate'
+    assert folder / 'Area_1' / '1700000000000.jpg' in manifest.removed
+    assert moved in manifest.changed
+    assert str(folder / 'Gate' / 'thumbnail') in manifest.dir_mtimes
@@ -0,0 +1,99 @@
+import pytest
+
+import placement
+from placement import PlacementEngine, PlacementMap, file_timestamp
+from path_resolver import PathResolver
+
+
+@pytest.fixture
+def disks(tmp_path):
+    d1, d3 = tmp_path / 'd1' / 'media', tmp_path / 'd3' / 'media'
+    d1.mkdir(parents=True)
+    d3.mkdir(parents=True)
+    return d1, d3
+
+
+def make_engine(tmp_path, disks, monkeypatch, full=()):
+    """Engine over disks whose usage is 100% for roots in full, 10% otherwise"""
+    monkeypatch.setattr(placement.DiskState, 'refresh', lambda self: None)
+    monkeypatch.setattr(placement.DiskState, 'usage_after',
+                        lambda self, batch_bytes: 100.0 if self.root in full else 10.0)
+    engine = PlacementEngine(disks=[str(d) for d in disks], db_path=str(tmp_path / 'placement.db'))
+    for disk in engine.disks.values():
+        disk.total, disk.free = 100, 90
+    return engine
+
+
+def write(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'x')
+    return path
+
+
+def test_file_timestamp():
+    assert file_timestamp('1729701045123.jpg') == 1729701045123
+    assert file_timestamp('1729701045123_2.jpg') == 1729701045123
+    assert file_timestamp('IMG_0001.jpg') is None
+
+
+def test_spill_keeps_existing_files_on_their_disk(tmp_path, disks, monkeypatch):
+    d1, d3 = disks
+    old = write(d1 / 'CAM_WTP' / 'Area_1' / '1000000000000.jpg')
+
+    engine = make_engine(tmp_path, disks, monkeypatch, full={str(d1)})
+    assert engine.place('CAM_WTP', 10, 1, first_ts=2000000000000) == d3
+    engine.close()
+    new = write(d3 / 'CAM_WTP' / 'Area_1' / '2000000000001.jpg')
+
+    spans = PlacementMap(str(tmp_path / 'placement.db'), check_interval=0)
+    assert spans.disk_for('CAM_WTP', 1000000000000) == str(d1)
+    assert spans.disk_for('CAM_WTP', 2000000000001) == str(d3)
+    assert spans.disk_for('OTHER_WTP', 2000000000001) is None
+
+    resolver = PathResolver([str(d1), str(d3)], {}, 60, 60, placements=spans)
+    # Each file is found on its recorded disk, whichever disk the request names
+    assert resolver.resolve(str(d3 / 'CAM_WTP' / 'Area_1' / old.name))[0] == str(old)
+    assert resolver.resolve(str(d1 / 'CAM_WTP' / 'Area_1' / new.name))[0] == str(new)
+    assert resolver.resolve(str(new))[0] == str(new)
+    assert resolver.resolve(str(d1 / 'CAM_WTP' / 'Area_1' / '2000000000002.jpg'))[2] == 'missing'
+    stats = resolver.info()['disks']
+    assert stats[str(d3)]['placed'] == 1 and stats[str(d1)]['placed'] == 2
+
+
+def test_recorded_disk_is_stat_first(tmp_path, disks, monkeypatch):
+    d1, d3 = disks
+    engine = make_engine(tmp_path, disks, monkeypatch, full={str(d1)})
+    engine.place('CAM_WTP', 10, 1, first_ts=1)
+    engine.close()
+    found = write(d3 / 'CAM_WTP' / '1500000000000.jpg')
+
+    resolver = PathResolver([str(d1), str(d3)], {}, 60, 60,
+                            placements=PlacementMap(str(tmp_path / 'placement.db'), check_interval=0))
+    statted = []
+    stat_candidate = resolver._stat_candidate
+    monkeypatch.setattr(resolver, '_stat_candidate', lambda path, disk=None: statted.append(path)
+                        or stat_candidate(path, disk))
+    assert resolver.resolve(str(d1 / 'CAM_WTP' / found.name))[0] == str(found)
+    assert statted == [str(found)]
+
+
+def test_same_disk_adds_no_span(tmp_path, disks, monkeypatch):
+    engine = make_engine(tmp_path, disks, monkeypatch)
+    first = engine.place('CAM_WTP', 10, 1, first_ts=1)
+    assert engine.place('CAM_WTP', 10, 1, first_ts=2) == first
+    assert engine.conn.execute('SELECT COUNT(*) FROM spans').fetchone()[0] == 1
+    engine.close()
+
+
+def test_off_record_file_is_still_found(tmp_path, disks, monkeypatch):
+    d1, d3 = disks
+    engine = make_engine(tmp_path, disks, monkeypatch, full={str(d1)})
+    engine.place('CAM_WTP', 10, 1, first_ts=1)
+    engine.close()
+    # A late file landed on d1 although the span says d3
+    stray = write(d1 / 'CAM_WTP' / '1500000000000.jpg')
+
+    resolver = PathResolver([str(d1), str(d3)], {}, 60, 60,
+                            placements=PlacementMap(str(tmp_path / 'placement.db'), check_interval=0))
+    assert resolver.resolve(str(stray))[0] == str(stray)
+    assert resolver.info()['disks'][str(d1)]['off_record'] == 1
@@ -0,0 +1,89 @@
+import threading
+
+from scheduler import FairQueue, Scheduler
+
+
+def test_fair_queue_round_robin_by_key():
+    queue = FairQueue()
+    for i in range(3):
+        queue.put('big', f"big{i}")
+    queue.put('small', 'small0')
+    queue.put('other', 'other0')
+    queue.put('small', 'small1')
+    order = [queue.get() for _ in range(6)]
+    assert order == ['big0', 'small0', 'other0', 'big1', 'small1', 'big2']
+    assert len(queue) == 0
+
+
+def test_fair_queue_drains_before_closing():
+    queue = FairQueue()
+    queue.put('a', 1)
+    queue.close()
+    assert queue.get() == 1
+    assert queue.get() is None
+
+
+def test_fair_queue_close_wakes_waiting_getter():
+    queue = FairQueue()
+    got = []
+    thread = threading.Thread(target=lambda: got.append(queue.get()))
+    thread.start()
+    queue.close()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert got == [None]
+
+
+def test_backlogged_key_does_not_hold_up_others():
+    scheduler = Scheduler({'cpu': 1})
+    started, release = threading.Event(), threading.Event()
+    order = []
+
+    def task(name):
+        if name == 'first':
+            started.set()
+            release.wait(5)
+        order.append(name)
+
+    scheduler.submit('cpu', 'big', task, 'first')
+    started.wait(5)
+    for i in range(5):
+        scheduler.submit('cpu', 'big', task, f"big{i}")
+    scheduler.submit('cpu', 'small', task, 'small')
+    release.set()
+    scheduler.wait()
+    # 'first' was already running; 'small' goes before the rest of the backlog
+    assert order[:3] == ['first', 'big0', 'small']
+    assert len(order) == 7
+
+
+def test_follow_up_tasks_and_failures():
+    scheduler = Scheduler({'prepare': 2, 'db': 1})
+    done = []
+
+    def prepare(n):
+        if n == 3:
+            raise RuntimeError('bad folder')
+        scheduler.submit('db', n, record, n)
+
+    def record(n):
+        done.append(n)
+
+    for n in range(5):
+        scheduler.submit('prepare', n, prepare, n)
+    scheduler.wait()
+    assert sorted(done) == [0, 1, 2, 4]
+    summary = scheduler.summary()
+    assert summary['prepare']['tasks'] == 5
+    assert summary['prepare']['failed'] == 1
+    assert summary['prepare']['workers'] == 2
+    assert summary['db']['tasks'] == 4
+
+
+def test_stage_workers_by_prefix():
+    scheduler = Scheduler({'copy': 3})
+    scheduler.submit('copy:/mnt/disk1', 'a', lambda: None)
+    scheduler.submit('other', 'a', lambda: None)
+    scheduler.wait()
+    assert scheduler.summary()['copy:/mnt/disk1']['workers'] == 3
+    assert scheduler.summary()['other']['workers'] == 1
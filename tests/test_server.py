@@ -0,0 +1,162 @@
+import os
+import sys
+import importlib
+import subprocess
+import threading
+from concurrent.futures import Future
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import quote
+
+import pytest
+from PIL import Image
+
+from imaging import derivative_path
+from path_resolver import PathResolver
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    """server.py imported with its log file and resize cache under a temporary directory"""
+    workdir = tmp_path_factory.mktemp('server')
+    cwd = os.getcwd()
+    os.environ['RESIZE_CACHE_DIR'] = str(workdir / 'resized')
+    os.chdir(workdir)
+    try:
+        module = importlib.import_module('server')
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+@pytest.fixture
+def media(tmp_path, server, monkeypatch):
+    root = tmp_path / 'media'
+    monkeypatch.setattr(server, 'path_resolver', PathResolver([str(root)], {}, 60, 5))
+    monkeypatch.setattr(server, 'get_device_by_id', lambda device_id: {'serial_id': 'CAM'})
+    return root
+
+
+def jpeg(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new('RGB', size, (200, 10, 10)).save(path, format='JPEG')
+    return path
+
+
+def image_url(server, path, size):
+    token, _ = server.create_token(7)
+    return f"/image?path={quote(str(path), safe='')}&device_id=7&token={token}&size={size}"
+
+
+def test_exact_derivative_served_as_is_to_webp_clients(server, media, monkeypatch):
+    original = jpeg(media / 'CAM_WTP' / 'Area_1' / '1729701045123.jpg', (1920, 1080))
+    derivative = jpeg(derivative_path(original, (640, 480)), (640, 360))
+
+    def no_resize(*args):
+        raise AssertionError('exact derivative must not be resized')
+    monkeypatch.setattr(server, 'resize_in_pool', no_resize)
+
+    response = server.app.test_client().get(image_url(server, original, '640x480'),
+                                            headers={'Accept': 'image/avif,image/webp,*/*'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert 'Accept' in response.headers['Vary']
+    assert response.data == derivative.read_bytes()
+    assert response.headers['ETag'].endswith('-640x480-jpeg"')
+
+
+def test_other_sizes_use_negotiated_format(server, media, monkeypatch):
+    original = jpeg(media / 'CAM_WTP' / 'Area_1' / '1729701045124.jpg', (1920, 1080))
+    jpeg(derivative_path(original, (640, 480)), (640, 360))
+    sources = []
+
+    def resize(source, target_size, output_format, cache_key):
+        sources.append((source, output_format))
+        out = BytesIO()
+        Image.new('RGB', target_size).save(out, format=output_format)
+        return out.getvalue()
+    monkeypatch.setattr(server, 'resize_in_pool', resize)
+
+    response = server.app.test_client().get(image_url(server, original, '320x240'),
+                                            headers={'Accept': 'image/webp,*/*'})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    # Resized from the covering derivative, not the original
+    assert sources == [(str(derivative_path(original, (640, 480))), 'WEBP')]
+
+
+def original_url(server, path):
+    token, _ = server.create_token(7)
+    return f"/image?path={quote(str(path), safe='')}&device_id=7&token={token}"
+
+
+def test_original_byte_ranges(server, media):
+    original = media / 'CAM_WTP' / 'Area_1' / '1729701045125.jpg'
+    original.parent.mkdir(parents=True)
+    data = bytes(range(256)) * 8
+    original.write_bytes(data)
+    client = server.app.test_client()
+
+    response = client.get(original_url(server, original), headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes {len(data) - 10}-{len(data) - 1}/{len(data)}"
+    assert response.data == data[-10:]
+
+    response = client.get(original_url(server, original), headers={'Range': 'bytes=100-199,0-9,150-249'})
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert response.content_length == len(response.data)
+    assert data[100:250] in response.data and data[0:10] in response.data
+
+    response = client.get(original_url(server, original), headers={'Range': f"bytes={len(data)}-"})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f"bytes */{len(data)}"
+
+    response = client.get(original_url(server, original), headers={'Range': 'bytes=0-'})
+    assert response.status_code == 200 and response.data == data
+
+
+@pytest.mark.parametrize('address, status', [
+    ('127.0.0.1', 200), ('::1', 200), ('::ffff:127.0.0.1', 200),
+    ('10.0.0.5', 403), ('::ffff:10.0.0.5', 403), ('', 403),
+])
+def test_device_invalidation_only_from_loopback(server, monkeypatch, address, status):
+    invalidated = []
+    monkeypatch.setattr(server.device_registry, 'invalidate', invalidated.append)
+    response = server.app.test_client().post('/devices/invalidate?device_id=122',
+                                             environ_base={'REMOTE_ADDR': address})
+    assert response.status_code == status
+    assert invalidated == ([122] if status == 200 else [])
+
+
+def test_batch_caps_resizes_in_flight(server, media, monkeypatch):
+    futures = []
+
+    def fake_submit(file_path, target_size, output_format, cache_key):
+        running = sum(1 for future in futures if not future.done())
+        assert running < server.BATCH_MAX_IN_FLIGHT
+        future = Future()
+        futures.append(future)
+        threading.Timer(0.02, future.set_result, (b'resized',)).start()
+        return future
+    monkeypatch.setattr(server, 'submit_resize', fake_submit)
+
+    items = []
+    for n in range(10):
+        path = jpeg(media / 'CAM_WTP' / 'Area_1' / f"17297010451{n:02d}.jpg", (64, 48))
+        items.append((str(n), str(path), os.stat(path), None, 200))
+    parts = b''.join(server.stream_batch(items, (32, 24), 'b'))
+    assert len(futures) == 10
+    assert parts.count(b'X-Status: 200') == 10
+
+
+def test_spawned_worker_skips_server_setup(tmp_path):
+    # What a spawned resize worker does under `python server.py` before taking a job
+    root = Path(__file__).resolve().parent.parent
+    server_file = root / 'server.py'
+    env = dict(os.environ, RESIZE_CACHE_DIR=str(tmp_path / 'resized'), PYTHONPATH=str(root))
+    code = (f"import runpy, sys; module = runpy.run_path({str(server_file)!r}, run_name='__mp_main__'); "
+            "sys.exit(0 if module['SPAWNED_WORKER'] and 'resize_cache' not in module else 1)")
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env, check=True)
+    assert not (tmp_path / 'image_server.log').exists()
+    assert not (tmp_path / 'resized').exists()
@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+
+import pytest
+
+import snapshot_loader
+from snapshot_loader import load_data_field, load_rows, SNAPSHOT_COLUMNS
+
+
+@pytest.mark.parametrize('value, field', [
+    (None, '\\N'),
+    (0, '0'),
+    (1729701045123, '1729701045123'),
+    ('NULL', '"NULL"'),  # the string, not SQL NULL
+    ('\\N', '"\\\\N"'),
+    ('Area_1', '"Area_1"'),
+    ('Gate "A", north', '"Gate \\"A\\", north"'),
+    ('C:\\media\\a.jpg', '"C:\\\\media\\\\a.jpg"'),
+    ('two\nlines\r', '"two\\nlines\\r"'),
+])
+def test_load_data_field(value, field):
+    assert load_data_field(value) == field
+
+
+class FakeCursor:
+    def __init__(self, loaded):
+        self.loaded = loaded
+        self.rowcount = 0
+
+    def execute(self, statement, params=()):
+        if 'LOAD DATA' in statement:
+            with open(params[0]) as f:
+                self.loaded.append((statement, f.read()))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, loaded):
+        self.loaded = loaded
+
+    def cursor(self):
+        return FakeCursor(self.loaded)
+
+    def commit(self):
+        pass
+
+
+def test_load_rows_file(monkeypatch):
+    loaded = []
+
+    @contextmanager
+    def connection(label, **options):
+        assert options == {'allow_local_infile': True}
+        yield FakeConnection(loaded)
+    monkeypatch.setattr(snapshot_loader, 'get_direct_connection', connection)
+
+    row = dict.fromkeys(SNAPSHOT_COLUMNS)
+    row.update(device_id=7, time=1729701045123, url='1/media/CAM_WTP/NULL/1729701045123.jpg',
+               area_name='NULL', created_by=0)
+    load_rows([row], table='camera.snapshot_copy')
+
+    (statement, content), = loaded
+    assert "ESCAPED BY '\\\\'" in statement
+    assert content == ('7,1729701045123,"1/media/CAM_WTP/NULL/1729701045123.jpg",\\N,\\N,"NULL",'
+                       '0,\\N,\\N,\\N\n')
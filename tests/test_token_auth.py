@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import token_auth
+from token_auth import TokenVerifier, token_for_window
+
+NOW = 1_700_000_100  # halfway through a 30-minute window
+
+
+@pytest.fixture
+def verifier(monkeypatch):
+    monkeypatch.setattr(token_auth.time, 'time', lambda: NOW)
+    return TokenVerifier('secret', 30)
+
+
+def token(device_id, window_offset=0):
+    window_start = (NOW // 1800 + window_offset) * 1800
+    return token_for_window(device_id, 'secret', datetime.fromtimestamp(window_start, timezone.utc))
+
+
+def test_current_and_previous_windows(verifier):
+    assert verifier.verify(7, token(7)) == 'current'
+    assert verifier.verify(7, token(7, -1)) == 'previous'
+    assert verifier.verify(7, token(7, -2)) is None
+    assert verifier.verify(8, token(7)) is None
+
+
+def test_matching_digest_is_cached(verifier):
+    verifier.verify(7, token(7))
+    verifier.verify(7, token(7))
+    assert verifier.stats['hits'] == 1
+    assert verifier.info()['cached_tokens'] == 1
+
+
+def test_rejected_device_ids_are_not_cached(verifier):
+    for device_id in range(1000):
+        assert verifier.verify(device_id, 'f' * 64) is None
+    assert verifier.info()['cached_tokens'] == 0
+    assert verifier.stats['rejected'] == 1000
+
+
+def test_cache_capped_per_window(monkeypatch):
+    monkeypatch.setattr(token_auth.time, 'time', lambda: NOW)
+    verifier = TokenVerifier('secret', 30, max_cached=5)
+    for device_id in range(20):
+        assert verifier.verify(device_id, token(device_id)) == 'current'
+    assert verifier.info()['cached_tokens'] == 5
+    # Devices past the cap are still accepted, just not cached
+    assert verifier.verify(19, token(19)) == 'current'
+
+
+def test_old_windows_dropped(verifier, monkeypatch):
+    verifier.verify(7, token(7))
+    monkeypatch.setattr(token_auth.time, 'time', lambda: NOW + 2 * 1800)
+    verifier.verify(7, 'f' * 64)
+    assert verifier.info()['cached_windows'] == 0
@@ -0,0 +1,161 @@
+import os
+import errno
+
+import pytest
+
+import transfer
+from transfer import transfer_file, transfer_folder, part_path, TransferError
+
+DATA = bytes(range(256)) * 4096  # 1 MB
+
+
+@pytest.fixture
+def src(tmp_path):
+    path = tmp_path / 'ftp' / 'cam1' / '1700000000000.jpg'
+    path.parent.mkdir(parents=True)
+    path.write_bytes(DATA)
+    return path
+
+
+@pytest.fixture
+def dst(tmp_path):
+    return tmp_path / 'disk1' / 'cam1' / '1700000000000.jpg'
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    """Make every transfer take the copy path, as between two disks"""
+    monkeypatch.setattr(transfer, 'same_filesystem', lambda src_stat, dst_dir: False)
+
+
+def unsupported(errno_value):
+    def fail(*args, **kwargs):
+        raise OSError(errno_value, os.strerror(errno_value))
+    return fail
+
+
+def test_same_filesystem_renames(src, dst):
+    assert transfer_file(src, dst) == ('rename', 0)
+    assert not src.exists()
+    assert dst.read_bytes() == DATA
+
+
+@pytest.mark.skipif(not hasattr(os, 'copy_file_range'), reason='no copy_file_range')
+def test_copy_file_range(cross_device, src, dst):
+    mtime = src.stat().st_mtime
+    assert transfer_file(src, dst) == ('copy_file_range', len(DATA))
+    assert not src.exists()
+    assert not part_path(dst).exists()
+    assert dst.read_bytes() == DATA
+    assert int(dst.stat().st_mtime) == int(mtime)
+
+
+def test_sendfile_fallback(cross_device, monkeypatch, src, dst):
+    monkeypatch.setattr(os, 'copy_file_range', unsupported(errno.EXDEV), raising=False)
+    assert transfer_file(src, dst) == ('sendfile', len(DATA))
+    assert not src.exists()
+    assert dst.read_bytes() == DATA
+
+
+def test_read_write_fallback(cross_device, monkeypatch, src, dst):
+    monkeypatch.setattr(os, 'copy_file_range', unsupported(errno.ENOSYS), raising=False)
+    monkeypatch.setattr(os, 'sendfile', unsupported(errno.EINVAL))
+    assert transfer_file(src, dst) == ('read/write', len(DATA))
+    assert not src.exists()
+    assert dst.read_bytes() == DATA
+
+
+def test_copy_error_keeps_source(cross_device, monkeypatch, src, dst):
+    monkeypatch.setattr(os, 'copy_file_range', unsupported(errno.EIO), raising=False)
+    monkeypatch.setattr(os, 'sendfile', unsupported(errno.EIO))
+    with pytest.raises(OSError):
+        transfer_file(src, dst)
+    assert src.read_bytes() == DATA
+    assert not dst.exists()
+
+
+def test_resumes_from_part(cross_device, src, dst):
+    dst.parent.mkdir(parents=True)
+    part_path(dst).write_bytes(DATA[:300000])
+    assert transfer_file(src, dst) == ('resumed', len(DATA) - 300000)
+    assert not part_path(dst).exists()
+    assert dst.read_bytes() == DATA
+
+
+def test_part_larger_than_source_restarts(cross_device, src, dst):
+    dst.parent.mkdir(parents=True)
+    part_path(dst).write_bytes(DATA + b'stale')
+    method, copied = transfer_file(src, dst)
+    assert method != 'resumed' and copied == len(DATA)
+    assert dst.read_bytes() == DATA
+
+
+def test_short_copy_fails_and_keeps_source(cross_device, monkeypatch, src, dst):
+    def short_copy(fd_in, fd_out, offset, size):
+        os.write(fd_out, DATA[:1000])
+        return 'copy_file_range', 1000
+    monkeypatch.setattr(transfer, '_copy_range', short_copy)
+    with pytest.raises(TransferError, match='copied 1000 of'):
+        transfer_file(src, dst)
+    assert src.read_bytes() == DATA
+    assert not dst.exists()
+    assert not part_path(dst).exists()
+
+
+def test_checksum_passes(cross_device, src, dst):
+    method, copied = transfer_file(src, dst, checksum=True)
+    assert copied == len(DATA)
+    assert dst.read_bytes() == DATA
+
+
+def test_checksum_mismatch_fails_and_keeps_source(cross_device, monkeypatch, src, dst):
+    def corrupt_copy(fd_in, fd_out, offset, size):
+        os.write(fd_out, b'\0' * size)
+        return 'copy_file_range', size
+    monkeypatch.setattr(transfer, '_copy_range', corrupt_copy)
+    with pytest.raises(TransferError, match='checksum'):
+        transfer_file(src, dst, checksum=True)
+    assert src.read_bytes() == DATA
+    assert not dst.exists()
+    assert not part_path(dst).exists()
+
+
+def test_existing_copy_only_removes_source(cross_device, src, dst):
+    dst.parent.mkdir(parents=True)
+    dst.write_bytes(DATA)
+    st = src.stat()
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert transfer_file(src, dst) == ('existing', 0)
+    assert not src.exists()
+    assert dst.read_bytes() == DATA
+
+
+@pytest.mark.parametrize('checksum', [False, True])
+def test_existing_with_other_content_is_overwritten(cross_device, src, dst, checksum):
+    # Same size and mtime but different bytes: the source must not be deleted as "already there"
+    dst.parent.mkdir(parents=True)
+    dst.write_bytes(b'\xff' * len(DATA))
+    st = src.stat()
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+    method, copied = transfer_file(src, dst, checksum=checksum)
+    assert method != 'existing' and copied == len(DATA)
+    assert not src.exists()
+    assert dst.read_bytes() == DATA
+
+
+def test_transfer_folder(cross_device, tmp_path, src):
+    (src.parent / 'sub').mkdir()
+    (src.parent / 'sub' / '1700000000001.jpg').write_bytes(b'second')
+    stats = transfer_folder(src.parent, tmp_path / 'disk1' / 'cam1')
+    assert stats['files'] == 2
+    assert stats['bytes'] == len(DATA) + len(b'second')
+    assert stats['failed'] == []
+    assert not src.parent.exists()
+    assert (tmp_path / 'disk1' / 'cam1' / 'sub' / '1700000000001.jpg').read_bytes() == b'second'
+
+
+def test_transfer_folder_keeps_failed_files(cross_device, monkeypatch, tmp_path, src):
+    monkeypatch.setattr(transfer, '_copy_range', lambda fd_in, fd_out, offset, size: ('read/write', 0))
+    stats = transfer_folder(src.parent, tmp_path / 'disk1' / 'cam1')
+    assert stats['failed'] == [src]
+    assert src.read_bytes() == DATA
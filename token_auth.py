@@ -0,0 +1,98 @@
+import hmac
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+
+def token_for_window(device_id, keyword, time_window):
+    """
+    SHA256(device_id-keyword-YYYY-MM-DD-HH-MM) for the window starting at time_window
+    """
+    time_str = time_window.strftime("%Y-%m-%d-%H-%M")
+    raw_string = f"{device_id}-{keyword}-{time_str}"
+    return hashlib.sha256(raw_string.encode()).hexdigest()
+
+
+class TokenVerifier:
+    """
+    Validates device tokens against the current and previous time windows
+
+    Expected digests are computed once per (device_id, window) and reused
+    until the window rolls over, so a steady stream of requests costs one
+    dict lookup and a constant-time compare. Only digests that matched a
+    token are kept (at most max_cached per window), so requests for made-up
+    device_ids do not grow the cache. Windows are counted from the
+    Unix epoch, which matches rounding UTC minutes down as long as
+    window_minutes divides 60.
+    """
+
+    def __init__(self, keyword, window_minutes, max_cached=10000):
+        self.keyword = keyword
+        self.window_seconds = window_minutes * 60
+        self.max_cached = max_cached
+
+        self._lock = threading.Lock()
+        self._window_index = None
+        self._digests = {}  # window index -> {device_id: token}
+
+        self.stats = {'hits': 0, 'misses': 0, 'accepted': 0, 'rejected': 0}
+
+    def _expected(self, device_id, window_index):
+        """Returns (token, cached)"""
+        token = self._digests.get(window_index, {}).get(device_id)
+        if token is not None:
+            self.stats['hits'] += 1
+            return token, True
+
+        self.stats['misses'] += 1
+        time_window = datetime.fromtimestamp(window_index * self.window_seconds, timezone.utc)
+        return token_for_window(device_id, self.keyword, time_window), False
+
+    def _remember(self, device_id, window_index, token):
+        """Cache a digest that matched, unless the window already holds max_cached"""
+        with self._lock:
+            tokens = self._digests.setdefault(window_index, {})
+            if len(tokens) < self.max_cached:
+                tokens[device_id] = token
+
+    def _roll_over(self, window_index):
+        """Forget digests for windows older than the grace period"""
+        with self._lock:
+            if self._window_index == window_index:
+                return
+            self._window_index = window_index
+            for old in [w for w in self._digests if w < window_index - 1]:
+                del self._digests[old]
+
+    def verify(self, device_id, provided_token):
+        """
+        Check provided_token for the current window, then the previous one (grace period)
+        Returns 'current', 'previous' or None
+        """
+        window_index = int(time.time() // self.window_seconds)
+        if window_index != self._window_index:
+            self._roll_over(window_index)
+
+        provided = provided_token.encode()
+        for window, matched in ((window_index, 'current'), (window_index - 1, 'previous')):
+            token, cached = self._expected(device_id, window)
+            if hmac.compare_digest(token.encode(), provided):
+                if not cached:
+                    self._remember(device_id, window, token)
+                self.stats['accepted'] += 1
+                return matched
+
+        self.stats['rejected'] += 1
+        return None
+
+    def info(self):
+        """Counters for the health endpoint"""
+        # _roll_over drops windows under the lock
+        with self._lock:
+            windows = list(self._digests.values())
+        return {
+            'cached_windows': len(windows),
+            'cached_tokens': sum(len(tokens) for tokens in windows),
+            **self.stats
+        }
@@ -0,0 +1,206 @@
+"""
+File transfer engine for moving camera folders off the FTP disk
+
+Files move one at a time and each source file is deleted as soon as its
+copy is verified, so an interrupted run leaves a folder that simply
+resumes where it stopped:
+
+- same filesystem: os.rename (no data copied)
+- otherwise: kernel-side copy (copy_file_range, falling back to sendfile,
+  then plain read/write) into a hidden .part file, which a later run
+  continues from its current size; the copy is fsync'ed, its size checked
+  (optionally a checksum of both sides, the copy re-read from disk) and
+  renamed into place before the source is removed
+- a destination file that already matches (size, mtime and a checksum of
+  both, whatever TRANSFER_CHECKSUM says) is kept and only the source is
+  removed; one that differs is overwritten by the copy
+"""
+import os
+import time
+import errno
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Verify each copy with a checksum of source and destination (reads both once more)
+TRANSFER_CHECKSUM = os.environ.get('TRANSFER_CHECKSUM', '0') == '1'
+# fsync each copy before the source is deleted
+TRANSFER_FSYNC = os.environ.get('TRANSFER_FSYNC', '1') == '1'
+# Bytes per copy_file_range/sendfile call
+COPY_CHUNK = 8 * 1024 * 1024
+HASH_CHUNK = 1024 * 1024
+
+# copy_file_range/sendfile errors that mean "not supported here", not "failed"
+UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+class TransferError(Exception):
+    """A file could not be transferred or did not verify; its source is kept"""
+
+
+def part_path(dst):
+    return dst.with_name(f".{dst.name}.part")
+
+
+def file_checksum(path, drop_cache=False):
+    """blake2b of a file; drop_cache first evicts it from the page cache so the disk is read"""
+    digest = hashlib.blake2b()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if drop_cache and hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            chunk = os.read(fd, HASH_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
+
+
+def same_filesystem(src_stat, dst_dir):
+    """True when src (by its stat) can be renamed into dst_dir"""
+    return src_stat.st_dev == os.stat(dst_dir).st_dev
+
+
+def _copy_range(fd_in, fd_out, offset, size):
+    """Copy bytes [offset, size) with the cheapest mechanism that works; returns the method used"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < size:
+                copied = os.copy_file_range(fd_in, fd_out, min(COPY_CHUNK, size - offset),
+                                            offset_src=offset, offset_dst=offset)
+                if copied == 0:
+                    break
+                offset += copied
+            return 'copy_file_range', offset
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+
+    os.lseek(fd_out, offset, os.SEEK_SET)
+    try:
+        while offset < size:
+            sent = os.sendfile(fd_out, fd_in, offset, min(COPY_CHUNK, size - offset))
+            if sent == 0:
+                break
+            offset += sent
+        return 'sendfile', offset
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_ERRNOS:
+            raise
+
+    os.lseek(fd_in, offset, os.SEEK_SET)
+    os.lseek(fd_out, offset, os.SEEK_SET)
+    while offset < size:
+        chunk = os.read(fd_in, min(COPY_CHUNK, size - offset))
+        if not chunk:
+            break
+        offset += os.write(fd_out, chunk)
+    return 'read/write', offset
+
+
+def transfer_file(src, dst, checksum=TRANSFER_CHECKSUM):
+    """
+    Move src to dst (see module docstring); the source is gone once this returns
+    Returns (method, bytes copied): method is 'rename', 'existing', 'resumed' or
+    the copy mechanism used. Raises TransferError or OSError, keeping the source.
+    """
+    src, dst = Path(src), Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    src_stat = src.stat()
+
+    if same_filesystem(src_stat, dst.parent):
+        os.rename(src, dst)
+        return 'rename', 0
+
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        dst_stat = None
+    # Size and mtime alone do not prove the copy is the source: always compare contents before unlinking
+    if (dst_stat is not None and dst_stat.st_size == src_stat.st_size
+            and int(dst_stat.st_mtime) == int(src_stat.st_mtime)
+            and file_checksum(src) == file_checksum(dst, drop_cache=checksum)):
+        src.unlink()
+        return 'existing', 0
+
+    part = part_path(dst)
+    try:
+        resume_from = part.stat().st_size
+    except FileNotFoundError:
+        resume_from = 0
+    if resume_from > src_stat.st_size:
+        resume_from = 0
+
+    fd_in = os.open(src, os.O_RDONLY)
+    try:
+        fd_out = os.open(part, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if resume_from == 0:
+                os.ftruncate(fd_out, 0)
+            method, copied_to = _copy_range(fd_in, fd_out, resume_from, src_stat.st_size)
+            if TRANSFER_FSYNC:
+                os.fsync(fd_out)
+        finally:
+            os.close(fd_out)
+    finally:
+        os.close(fd_in)
+
+    part_size = part.stat().st_size
+    if copied_to != src_stat.st_size or part_size != src_stat.st_size:
+        part.unlink()
+        raise TransferError(f"{src}: copied {part_size} of {src_stat.st_size} bytes")
+    if checksum and file_checksum(src) != file_checksum(part, drop_cache=True):
+        part.unlink()
+        raise TransferError(f"{src}: checksum mismatch after copy")
+
+    shutil.copystat(src, part)
+    os.replace(part, dst)
+    src.unlink()
+    return ('resumed' if resume_from else method), src_stat.st_size - resume_from
+
+
+def remove_empty_dirs(root):
+    """Remove root and the folders below it that are empty (bottom-up); returns True if root is gone"""
+    for dirpath, _, _ in sorted(os.walk(root), key=lambda d: len(d[0]), reverse=True):
+        try:
+            os.rmdir(dirpath)
+        except OSError:
+            pass
+    return not os.path.exists(root)
+
+
+def transfer_folder(src_folder, dst_folder, files=None, checksum=TRANSFER_CHECKSUM, remove_empty=True):
+    """
+    Move every file of src_folder to the same relative path under dst_folder
+    files: source paths to move (e.g. from the folder manifest); walks src_folder if None
+    remove_empty: remove the emptied source folders afterwards (off when moving a folder in slices)
+    Returns a stats dict; 'failed' lists the files still at the source
+    """
+    src_folder, dst_folder = Path(src_folder), Path(dst_folder)
+    if files is None:
+        files = [Path(dirpath) / name for dirpath, _, names in os.walk(src_folder) for name in names]
+
+    stats = {'files': 0, 'bytes': 0, 'methods': {}, 'failed': [], 'seconds': 0.0}
+    started = time.perf_counter()
+    for src in files:
+        dst = dst_folder / Path(src).relative_to(src_folder)
+        try:
+            method, copied = transfer_file(src, dst, checksum=checksum)
+        except (OSError, TransferError) as e:
+            logger.error(f"Transfer failed for {src}: {e}")
+            stats['failed'].append(src)
+            continue
+        stats['files'] += 1
+        stats['bytes'] += copied
+        stats['methods'][method] = stats['methods'].get(method, 0) + 1
+
+    if remove_empty and not stats['failed']:
+        remove_empty_dirs(src_folder)
+    stats['seconds'] = time.perf_counter() - started
+    return stats